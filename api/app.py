@@ -1,19 +1,100 @@
 # api/app.py
 
 from fastapi import FastAPI, Form, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+import asyncio
 import sys
 import os
-import json
+import time
 
 # Add the parent directory to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.main import PrivacyAdEngine
+from api.engine_pool import EnginePool, PoolSaturated
+from api.instrumentation import ServiceMetrics
+from api.micro_batcher import MicroBatcher
+from api.schemas import batch_response, recommend_response, to_json
+from src.differential_privacy import PrivacyBudget, PrivacyBudgetExceeded
+from src.privacy_layer import PrivacyLayer
+
+# The NLP and matching work runs in a pool of worker processes, each with its
+# own engine (from a prebuilt index snapshot when configured), so a slow
+# document never blocks the event loop
+engine_workers = int(os.environ.get("ENGINE_WORKERS", 2))
+service_metrics = ServiceMetrics()
+engine_pool = EnginePool(
+    workers=engine_workers,
+    max_pending=int(os.environ.get("ENGINE_MAX_PENDING", engine_workers * 8)),
+    timeout=float(os.environ.get("ENGINE_TIMEOUT", 10)),
+    engine_options={
+        "index_path": os.environ.get("AD_INDEX_PATH"),
+        "analysis_profile": os.environ.get("ANALYSIS_PROFILE", "full"),
+        # Shard processes per engine worker; unset scores in the worker itself
+        "match_shards": int(os.environ.get("MATCH_SHARDS", 0)) or None,
+        # Hashed term columns of indexes built in the workers; unset fits a vocabulary
+        "hash_features": int(os.environ.get("HASH_FEATURES", 0)) or None,
+        # Dimensions of dense LSA embeddings for indexes built in the workers
+        "embedding_dim": int(os.environ.get("EMBEDDING_DIM", 0)) or None,
+    },
+    on_trace=service_metrics.record_trace,
+)
+
+
+# Largest top_k a request may ask for; larger values are clamped to it
+max_top_k = int(os.environ.get("MAX_TOP_K", 100))
+
+# Most documents one /recommend/batch call may send; a running batch can't
+# be cancelled, so this bounds how long one request can hold a worker
+max_batch_docs = int(os.environ.get("MAX_BATCH_DOCS", 256))
+
+
+# Differential privacy budget of each session_id, in epsilon (unset = no
+# limit). The ledger is kept here rather than in the engine workers, so a
+# session's spending adds up whichever worker serves it; a restart, or each
+# of several server processes, starts it over
+privacy_budget = PrivacyBudget(
+    float(os.environ["SESSION_EPSILON"]) if os.environ.get("SESSION_EPSILON") else None,
+    max_sessions=int(os.environ.get("SESSION_BUDGET_MAX_SESSIONS", 100000)),
+    ttl=float(os.environ.get("SESSION_BUDGET_TTL", 0)) or None,
+)
+release_epsilon = PrivacyLayer().release_epsilon()
+
+
+# Concurrent /recommend calls arriving within MICRO_BATCH_WAIT_MS of each other
+# (up to MICRO_BATCH_SIZE documents) are processed as one batch
+micro_batcher = MicroBatcher(
+    lambda contents, top_k: engine_pool.process_batch(contents, top_k=top_k),
+    max_batch_size=int(os.environ.get("MICRO_BATCH_SIZE", 32)),
+    max_delay=float(os.environ.get("MICRO_BATCH_WAIT_MS", 5)) / 1000,
+)
+service_metrics.registry.register(
+    "engine_pool_restarts_total",
+    "Engine worker pools replaced after a worker died",
+    engine_pool.restarts,
+)
+service_metrics.registry.register(
+    "micro_batch_size", "Documents per /recommend micro-batch", micro_batcher.batch_sizes
+)
+service_metrics.registry.register(
+    "micro_batch_queue_delay_seconds",
+    "Time a /recommend document waits for its batch",
+    micro_batcher.queue_delays,
+)
 
-app = FastAPI(title="Privacy-First Ad Recommendation API")
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load the engines before taking traffic
+    await engine_pool.start()
+    yield
+    engine_pool.shutdown()
+
+
+app = FastAPI(title="Privacy-First Ad Recommendation API", lifespan=lifespan)
 
 # Configure CORS for frontend access
 app.add_middleware(
@@ -24,36 +105,190 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the ad engine
-ad_engine = PrivacyAdEngine()
+
+def _json_response(response):
+    """Send a response model, serialized exactly once"""
+    started = time.perf_counter()
+    body = to_json(response)
+    service_metrics.serialization.observe(time.perf_counter() - started)
+    return Response(content=body, media_type="application/json")
+
+
+def _observed(endpoint, started, response):
+    """Record the request's latency and status, and return its response"""
+    service_metrics.observe_request(
+        endpoint, response.status_code, time.perf_counter() - started
+    )
+    return response
+
+
+def _positive_int(data, name, default):
+    """
+    data[name] as a positive integer, or default when it is missing.
+    Integer strings are accepted too.
+
+    Raises:
+        ValueError: If the value is anything else
+    """
+    value = data.get(name)
+    if value is None:
+        return default
+
+    error = ValueError(f"{name} must be a positive integer")
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise error
+    try:
+        value = int(value)
+    except ValueError:
+        raise error from None
+    if value < 1:
+        raise error
+    return value
+
+
+def _documents(data):
+    """
+    data["contents"] as a list of strings, of at most MAX_BATCH_DOCS.
+
+    Raises:
+        ValueError: If it is missing, empty, too long or not all strings
+    """
+    contents = data.get("contents")
+    if not isinstance(contents, list) or not contents or not all(
+        isinstance(content, str) for content in contents
+    ):
+        raise ValueError("contents must be a non-empty list of strings")
+    if len(contents) > max_batch_docs:
+        raise ValueError(f"contents may hold at most {max_batch_docs} documents")
+    return contents
+
+
+def _session_id(data):
+    """
+    data["session_id"] (a string or integer), or None when it is missing.
+
+    Raises:
+        ValueError: If the value is anything else
+    """
+    session_id = data.get("session_id")
+    if session_id is not None and (
+        isinstance(session_id, bool) or not isinstance(session_id, (int, str))
+    ):
+        raise ValueError("session_id must be a string or an integer")
+    return session_id
+
+
+def _charge_session(session_id, documents):
+    """
+    Charge the session for noising this many documents, before any work
+    is done; requests without a session_id are not accounted.
+
+    Raises:
+        PrivacyBudgetExceeded: If the session's budget doesn't cover them
+    """
+    if session_id is not None:
+        privacy_budget.charge([session_id] * documents, release_epsilon)
+
+
+def _invalid_request(error):
+    return JSONResponse(status_code=422, content={"error": str(error)})
+
+
+def _budget_response(error):
+    return JSONResponse(status_code=429, content={"error": str(error)})
+
+
+def _overload_response(error):
+    """Response for requests the engine pool could not serve in time"""
+    if isinstance(error, PoolSaturated):
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": "1"},
+            content={"error": "Too many pending requests, retry later"},
+        )
+    if isinstance(error, asyncio.TimeoutError):
+        return JSONResponse(status_code=503, content={"error": "Request timed out"})
+    return JSONResponse(status_code=503, content={"error": "Engine worker unavailable"})
 
 
 @app.post("/recommend")
 # async def recommend_ads(content: str = Form(...)):
 async def recommend_ads(request: Request):
+    started = time.perf_counter()
     request_data = await request.json()
     content = request_data['data']['content']
+    try:
+        top_k = min(_positive_int(request_data['data'], 'top_k', 10), max_top_k)
+        session_id = _session_id(request_data['data'])
+    except ValueError as e:
+        return _observed("/recommend", started, _invalid_request(e))
+    compact = bool(request_data['data'].get('compact', False))
+    include_factors = bool(request_data['data'].get('include_factors', False))
     """
     Recommend ads based on content without using personal data.
+
+    With "compact": true only the ad IDs and scores come back (plus match
+    factors with "include_factors": true). top_k must be a positive integer
+    and is clamped to MAX_TOP_K. A "session_id" is charged against its
+    SESSION_EPSILON budget; once that is spent the request gets a 429.
     """
     try:
-        result = ad_engine.process_content(content)
-
-        # Serialize the result for JSON response
-        # This handles NumPy types and other non-JSON serializable objects
-        cleaned_result = json.loads(
-            json.dumps(
-                result,
-                default=lambda o: float(o) if hasattr(o, "__float__") else str(o),
-            )
+        _charge_session(session_id, 1)
+        result = await micro_batcher.submit(content, top_k=top_k)
+
+        response = _json_response(recommend_response(result, compact, include_factors))
+    except PrivacyBudgetExceeded as e:
+        response = _budget_response(e)
+    except (PoolSaturated, asyncio.TimeoutError, BrokenProcessPool) as e:
+        response = _overload_response(e)
+    except Exception as e:
+        import traceback
+
+        print(traceback.format_exc())
+        response = JSONResponse(status_code=500, content={"error": str(e)})
+    return _observed("/recommend", started, response)
+
+
+@app.post("/recommend/batch")
+async def recommend_ads_batch(request: Request):
+    """
+    Recommend ads for many documents in one call.
+
+    Expects {"data": {"contents": [...], "top_k": 10, "batch_size": 64}},
+    optionally with "compact", "include_factors" and "session_id" as for
+    /recommend (the session is charged once per document); the results
+    come back in the same order as the contents. contents must be a
+    non-empty list of at most MAX_BATCH_DOCS strings; top_k and batch_size
+    must be positive integers, and top_k is clamped to MAX_TOP_K.
+    """
+    started = time.perf_counter()
+    request_data = await request.json()
+    try:
+        contents = _documents(request_data['data'])
+        top_k = min(_positive_int(request_data['data'], 'top_k', 10), max_top_k)
+        batch_size = _positive_int(request_data['data'], 'batch_size', None)
+        session_id = _session_id(request_data['data'])
+    except ValueError as e:
+        return _observed("/recommend/batch", started, _invalid_request(e))
+    compact = bool(request_data['data'].get('compact', False))
+    include_factors = bool(request_data['data'].get('include_factors', False))
+    try:
+        _charge_session(session_id, len(contents))
+        results = await engine_pool.process_batch(
+            contents, top_k=top_k, batch_size=batch_size
         )
 
-        return JSONResponse(content=cleaned_result)
+        response = _json_response(batch_response(results, compact, include_factors))
+    except PrivacyBudgetExceeded as e:
+        response = _budget_response(e)
+    except (PoolSaturated, asyncio.TimeoutError, BrokenProcessPool) as e:
+        response = _overload_response(e)
     except Exception as e:
         import traceback
 
         print(traceback.format_exc())
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        response = JSONResponse(status_code=500, content={"error": str(e)})
+    return _observed("/recommend/batch", started, response)
 
 
 @app.get("/health")
@@ -62,22 +297,24 @@ async def health_check():
     return {"status": "healthy"}
 
 
-# Create a static directory for the frontend demo
-os.makedirs("static", exist_ok=True)
-
-# Write the frontend HTML file
-with open("static/index.html", "w") as f:
-    f.write(
-        """
-<!DOCTYPE html>
-<html lang="en">
-<!-- Front-end code here (copy from the HTML artifact) -->
-</html>
-    """
+@app.get("/metrics")
+async def metrics():
+    """Stage latencies, candidate counts, cache and batching metrics (Prometheus text format)"""
+    return PlainTextResponse(
+        service_metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
     )
 
-# Mount the static directory
-app.mount("/", StaticFiles(directory="static", html=True), name="static")
+
+@app.get("/batcher/stats")
+async def batcher_stats():
+    """Batch size and queue delay distributions of the /recommend micro-batcher"""
+    return micro_batcher.metrics()
+
+
+# Mount the static directory for the frontend demo, if it is deployed
+static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+if os.path.isdir(static_dir):
+    app.mount("/", StaticFiles(directory=static_dir, html=True), name="static")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,146 @@
+# api/engine_pool.py
+# Runs the CPU-bound PrivacyAdEngine work in worker processes, off the event loop
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from src.metrics import Counter
+
+# Engine of the current worker process, built once by _init_worker, and the
+# barrier all workers of the pool meet at in _ready
+_engine = None
+_started = None
+
+
+def _init_worker(engine_options, started):
+    global _engine, _started
+    from src.main import PrivacyAdEngine
+
+    _started = started
+    _engine = PrivacyAdEngine(**engine_options)
+    _engine.warmup()
+
+
+def _ready():
+    # Held until every worker has called it, so each call lands on a
+    # different worker and returns only once all engines are loaded
+    _started.wait()
+    return True
+
+
+# Each call returns the engine's trace of it along with the result, so the
+# parent process can export the stage timings
+
+def _process_content(content, top_k):
+    return _engine.process_content(content, top_k=top_k), _engine.last_trace
+
+
+def _process_batch(contents, top_k, batch_size):
+    return _engine.process_batch(contents, top_k=top_k, batch_size=batch_size), _engine.last_trace
+
+
+class PoolSaturated(Exception):
+    """Raised when the pool already has max_pending requests queued or running"""
+
+
+class EnginePool:
+    """
+    A pool of worker processes, each holding a preloaded PrivacyAdEngine.
+
+    At most max_pending requests are queued or running at once; beyond that
+    run() raises PoolSaturated instead of queueing, and each request waits at
+    most timeout seconds for its result.
+
+    on_trace, if given, is called in this process with the engine trace
+    (PrivacyAdEngine.last_trace) of every completed call.
+
+    A worker that dies (killed for memory, a crash in spaCy) breaks the
+    whole process pool: the requests it held fail with BrokenProcessPool,
+    and the pool is replaced by a new one, warmed in the background, so
+    later requests are served again without a server restart.
+    """
+
+    def __init__(
+        self, workers=2, max_pending=None, timeout=10.0, engine_options=None, on_trace=None
+    ):
+        self.workers = workers
+        self.max_pending = max_pending or workers * 8
+        self.timeout = timeout
+        self.pending = 0
+        self.on_trace = on_trace
+        self.engine_options = engine_options or {}
+        self.restarts = Counter()
+        self._executor = self._new_executor()
+        self._warmup = None  # Task warming a replacement pool
+
+    def _new_executor(self):
+        # spawn rather than fork: the server process may already run threads
+        context = multiprocessing.get_context("spawn")
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.engine_options, context.Barrier(self.workers)),
+        )
+
+    async def start(self):
+        """Start every worker and wait until their engines are loaded"""
+        await self._start(self._executor)
+
+    async def _start(self, executor):
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(executor, _ready) for _ in range(self.workers)
+        ))
+
+    async def process_content(self, content, top_k=10):
+        return await self._run(_process_content, content, top_k)
+
+    async def process_batch(self, contents, top_k=10, batch_size=None):
+        return await self._run(_process_batch, contents, top_k, batch_size)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise PoolSaturated(f"{self.pending} requests already pending")
+
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._replace(executor)
+            raise
+
+        # The slot is held until the worker is actually done, even when the
+        # caller gave up waiting, so timeouts can't oversubscribe the pool
+        self.pending += 1
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+
+        # A timeout cancels the work if it hasn't started yet
+        try:
+            result, trace = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except BrokenProcessPool:
+            self._replace(executor)
+            raise
+        if self.on_trace is not None:
+            self.on_trace(trace)
+        return result
+
+    def _release(self):
+        self.pending -= 1
+
+    def _replace(self, broken):
+        """Swap a broken executor for a new one, once, and warm it up"""
+        if self._executor is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._new_executor()
+        self.restarts.inc()
+        self._warmup = asyncio.ensure_future(self._start(self._executor))
+        # A replacement that breaks too is replaced by the next request
+        self._warmup.add_done_callback(lambda task: task.cancelled() or task.exception())
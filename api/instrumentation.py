@@ -0,0 +1,81 @@
+# api/instrumentation.py
+# Service metrics of the recommendation API, exported at /metrics
+
+from src.metrics import MetricsRegistry
+
+# Ads scored per page: a few hundred with candidate retrieval, up to the
+# whole inventory without it
+CANDIDATE_BUCKETS = (10, 30, 100, 300, 1000, 3000, 10000, 30000, 100000, 300000, 1000000)
+
+
+class ServiceMetrics:
+    """
+    Metrics of the API process, fed from the engine traces the worker
+    processes send back and from the endpoints themselves.
+
+    Recording is a few dictionary lookups and additions per call, cheap
+    enough to stay on in production. Lives on the event loop thread.
+    """
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        registry = self.registry
+
+        self.inventory_size = registry.gauge(
+            "ad_inventory_size", "Ads in the matching index of the engine workers"
+        )
+        self.index_version = registry.gauge(
+            "ad_index_version", "Ad index version the engine workers last served from"
+        )
+        self.candidates = registry.histogram(
+            "match_candidates", "Ads scored per page", CANDIDATE_BUCKETS
+        )
+        self.documents = registry.counter(
+            "engine_documents_total", "Pages processed by the engine workers"
+        )
+        self.cache_hits = registry.counter(
+            "analysis_cache_hits_total", "Content analysis results served from the cache"
+        )
+        self.cache_misses = registry.counter(
+            "analysis_cache_misses_total", "Pages analyzed because they were not cached"
+        )
+        self.cache_hit_ratio = registry.gauge(
+            "analysis_cache_hit_ratio", "Share of analysis cache lookups that hit, since startup"
+        )
+        self.serialization = registry.histogram(
+            "api_serialize_seconds", "Time to build and serialize a response body"
+        )
+
+    def record_trace(self, trace):
+        """Record the engine trace of one process_content/process_batch call"""
+        for stage, seconds in trace["stages"].items():
+            self.registry.histogram(
+                "engine_stage_seconds",
+                "Time per engine call in each stage (a batch counts once)",
+                labels={"stage": stage},
+            ).observe(seconds)
+
+        for count in trace["candidates"]:
+            self.candidates.observe(count)
+        self.documents.inc(trace["documents"])
+        self.inventory_size.set(trace["inventory_size"])
+        self.index_version.set(trace["index_version"])
+
+        self.cache_hits.inc(trace["cache_hits"])
+        self.cache_misses.inc(trace["cache_misses"])
+        lookups = self.cache_hits.value + self.cache_misses.value
+        if lookups:
+            self.cache_hit_ratio.set(self.cache_hits.value / lookups)
+
+    def observe_request(self, endpoint, status, seconds):
+        """Record a finished request"""
+        self.registry.histogram(
+            "api_request_seconds", "Request latency", labels={"endpoint": endpoint}
+        ).observe(seconds)
+        self.registry.counter(
+            "api_responses_total", "Responses by endpoint and status code",
+            labels={"endpoint": endpoint, "status": status},
+        ).inc()
+
+    def render(self):
+        return self.registry.render()
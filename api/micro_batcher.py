@@ -0,0 +1,89 @@
+# api/micro_batcher.py
+# Coalesces concurrent single-document requests into batches
+
+import asyncio
+import time
+
+from src.metrics import Histogram
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+QUEUE_DELAY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+
+class MicroBatcher:
+    """
+    Collects documents submitted within max_delay seconds of each other (or
+    until max_batch_size are waiting) and processes them with one batch call,
+    so they share one nlp.pipe run and one scoring matrix product.
+
+    Args:
+        process_batch: Coroutine function (contents, top_k) -> list of
+            process_content-style responses, in order
+        max_batch_size (int): Flush as soon as this many documents wait
+        max_delay (float): Longest a document waits for others, in seconds
+    """
+
+    def __init__(self, process_batch, max_batch_size=32, max_delay=0.005):
+        self._process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self._waiting = []  # (content, top_k, future, submitted_at)
+        self._timer = None
+
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_delays = Histogram(QUEUE_DELAY_BUCKETS)
+
+    async def submit(self, content, top_k=10):
+        """Process one document as part of the next batch and return its response"""
+        if top_k < 1:
+            # A non-positive k would slice the batch's shared ranking wrongly
+            raise ValueError(f"top_k must be positive, got {top_k}")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiting.append((content, top_k, future, time.perf_counter()))
+
+        if len(self._waiting) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+
+        return await future
+
+    def metrics(self):
+        """Batch size and queue delay distributions"""
+        return {
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_delay_seconds": self.queue_delays.snapshot(),
+        }
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._waiting = self._waiting, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        now = time.perf_counter()
+        self.batch_sizes.observe(len(batch))
+        for _, _, _, submitted_at in batch:
+            self.queue_delays.observe(now - submitted_at)
+
+        # One top_k for the whole batch; a shorter ranking is a prefix of a longer one
+        top_k = max(top_k for _, top_k, _, _ in batch)
+        try:
+            results = await self._process_batch([content for content, _, _, _ in batch], top_k)
+        except Exception as e:
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, k, future, _), result in zip(batch, results):
+            if not future.done():
+                result["recommended_ads"] = result["recommended_ads"][:k]
+                future.set_result(result)
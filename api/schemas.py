@@ -0,0 +1,100 @@
+# api/schemas.py
+# Typed response bodies of the recommendation endpoints
+
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+
+class MatchFactors(BaseModel):
+    content_similarity: float
+    keyword_overlap: int
+    category_relevance: int
+
+
+class Recommendation(BaseModel):
+    ad: dict[str, Any]
+    relevance_score: float
+    match_factors: MatchFactors
+    match_reason: str
+
+
+class PrivacyMetrics(BaseModel):
+    anonymization_applied: bool
+    differential_privacy_applied: bool
+    local_processing_simulated: bool
+
+
+class RecommendResponse(BaseModel):
+    recommended_ads: list[Recommendation]
+    index_version: Optional[int] = None
+    privacy_metrics: PrivacyMetrics
+    content_topics: Optional[list[str]] = None  # Left out when there are none
+
+
+class CompactRecommendation(BaseModel):
+    ad_id: int
+    relevance_score: float
+    match_factors: Optional[MatchFactors] = None  # Only with include_factors
+
+
+class CompactRecommendResponse(BaseModel):
+    recommended_ads: list[CompactRecommendation]
+    index_version: Optional[int] = None
+
+
+class BatchRecommendResponse(BaseModel):
+    results: list[RecommendResponse]
+
+
+class CompactBatchRecommendResponse(BaseModel):
+    results: list[CompactRecommendResponse]
+
+
+def recommend_response(result, compact=False, include_factors=False):
+    """
+    Typed response for one PrivacyAdEngine.process_content result.
+
+    Numbers are validated (and numpy scalars converted) here, once.
+
+    Args:
+        result (dict): Engine response
+        compact (bool): Only the ad IDs and scores of the recommendations
+        include_factors (bool): Keep the match factors in compact mode
+
+    Returns:
+        RecommendResponse or CompactRecommendResponse
+    """
+    if not compact:
+        return RecommendResponse.model_validate(result)
+
+    return CompactRecommendResponse(
+        recommended_ads=[
+            CompactRecommendation(
+                ad_id=match["ad"]["classification"]["ad_id"],
+                relevance_score=match["relevance_score"],
+                **({"match_factors": match["match_factors"]} if include_factors else {}),
+            )
+            for match in result["recommended_ads"]
+        ],
+        index_version=result.get("index_version"),
+    )
+
+
+def batch_response(results, compact=False, include_factors=False):
+    """Typed response for PrivacyAdEngine.process_batch results"""
+    responses = [recommend_response(result, compact, include_factors) for result in results]
+    if compact:
+        return CompactBatchRecommendResponse(results=responses)
+    return BatchRecommendResponse(results=responses)
+
+
+def to_json(response):
+    """
+    Serialize a response model, leaving out optional fields that weren't set.
+
+    The JSON parses to the same values json.dumps would give, but is not
+    always the same text: pydantic writes floats below 1e-4 in full or with
+    a short exponent (0.000015, 1e-7 where json.dumps writes 1.5e-05, 1e-07).
+    """
+    return response.model_dump_json(exclude_unset=True)
@@ -0,0 +1,76 @@
+# benchmarks/bench_ann.py
+# Recall@10 and latency of the approximate index against exact matching
+#
+# Run from the project root:
+#   python -m benchmarks.bench_ann --ads 20000 --lists 0 64 128 --probes 1 4 8 16
+#
+# --lists 0 and --probes 8 are ClusteredIndex's defaults (about sqrt(ads)
+# lists, 8 probes), i.e. what MatchingEngine(approximate_index=ClusteredIndex())
+# serves with.
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_ads, generate_content_features
+from src.ann_index import ClusteredIndex
+from src.matching_engine import MatchingEngine
+
+
+def run_queries(engine, queries):
+    """Median latency and the top-10 ad identities for each query"""
+    timings, results = [], []
+    for features in queries:
+        start = time.perf_counter()
+        matches = engine.match_content(features)
+        timings.append(time.perf_counter() - start)
+        results.append([id(m["ad"]) for m in matches])
+    return np.median(timings), results
+
+
+def recall_at_10(approximate, exact):
+    hits = [len(set(a) & set(e)) / max(1, len(e)) for a, e in zip(approximate, exact)]
+    return float(np.mean(hits))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ads", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--content-words", type=int, default=40)
+    parser.add_argument("--lists", type=int, nargs="+", default=[0, 64, 128],
+                        help="lists per index; 0 for the default of about sqrt(ads)")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    engine = MatchingEngine(approximate_min_inventory=0)
+    engine.add_ads(generate_ads(args.ads))
+    queries = [
+        generate_content_features(n_words=args.content_words, seed=1000 + i)
+        for i in range(args.queries)
+    ]
+
+    exact_elapsed, exact = run_queries(engine, queries)
+    print(f"exact: {exact_elapsed * 1000:.2f} ms/query over {args.ads} ads")
+
+    print(f"{'lists':>6} {'probes':>7} {'build (s)':>10} {'ms/query':>9} {'recall@10':>10}")
+    for n_lists in args.lists:
+        engine.approximate_index = ClusteredIndex(n_lists=n_lists or None)
+        engine._approximate_built = False
+        start = time.perf_counter()
+        engine._use_approximate_index()
+        build = time.perf_counter() - start
+        n_lists = len(engine.approximate_index.centroids)
+
+        for n_probe in args.probes:
+            engine.approximate_index.n_probe = n_probe
+            elapsed, approximate = run_queries(engine, queries)
+            print(
+                f"{n_lists:>6} {n_probe:>7} {build:>10.2f} {elapsed * 1000:>9.2f} "
+                f"{recall_at_10(approximate, exact):>10.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
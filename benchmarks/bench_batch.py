@@ -0,0 +1,41 @@
+# benchmarks/bench_batch.py
+# Throughput of PrivacyAdEngine.process_batch against one process_content call per page
+#
+# Run from the project root (needs the en_core_web_sm spaCy model):
+#   python -m benchmarks.bench_batch --pages 1000 --batch-sizes 16 64 256
+
+import argparse
+import time
+
+from benchmarks.synthetic import generate_pages
+from src.main import PrivacyAdEngine
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 64, 256])
+    args = parser.parse_args()
+
+    # No analysis cache: every mode runs spaCy on every page, instead of the
+    # batches reusing what the single-page loop cached
+    engine = PrivacyAdEngine(analysis_cache=False)
+    pages = generate_pages(args.pages)
+    engine.process_batch(pages[:10])  # warm up
+
+    start = time.perf_counter()
+    for page in pages:
+        engine.process_content(page)
+    single = time.perf_counter() - start
+    print(f"{'mode':>18} {'pages/s':>9}")
+    print(f"{'process_content':>18} {len(pages) / single:>9.1f}")
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        engine.process_batch(pages, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"{'batch ' + str(batch_size):>18} {len(pages) / elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
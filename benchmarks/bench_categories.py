@@ -0,0 +1,84 @@
+# benchmarks/bench_categories.py
+# Category detection cost by taxonomy size: substring tests vs the automaton
+#
+# Run from the project root:
+#   python -m benchmarks.bench_categories --ads 20000 --categories 15 50 100 200 500 5015
+#
+# The texts are what AdClassifier scans per ad (the lowercased ad and its
+# keywords) and what MatchingEngine scans per page (each topic). Taxonomies
+# beyond the 15 sample categories are padded with made-up two-word names.
+
+import argparse
+import random
+import time
+
+from benchmarks.synthetic import _vocabulary, generate_ads, generate_content_features
+from data.sample_categories import get_sample_categories
+from src import category_matcher
+from src.category_matcher import CategoryMatcher
+
+
+def taxonomy(size, seed=0):
+    """The sample categories padded to size with made-up names"""
+    rng = random.Random(seed)
+    vocabulary = _vocabulary()
+    categories = list(get_sample_categories())
+    seen = set(categories)
+    while len(categories) < size:
+        name = f"{rng.choice(vocabulary)} {rng.choice(vocabulary)}"
+        if name not in seen:
+            seen.add(name)
+            categories.append(name)
+    return categories[:size]
+
+
+def timed(find, texts):
+    start = time.perf_counter()
+    for text in texts:
+        find(text)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ads", type=int, default=20000)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--categories", type=int, nargs="+", default=[15, 50, 100, 200, 500, 5015])
+    args = parser.parse_args()
+
+    ad_texts = [
+        "\0".join([ad["content"].lower()] + ad["content"].lower().split()[:10])
+        for ad in generate_ads(args.ads)
+    ]
+    topics = [
+        topic
+        for seed in range(args.pages)
+        for topic in set(generate_content_features(seed=seed)["topic_candidates"])
+    ]
+
+    print(
+        f"threshold: substring tests up to {category_matcher.SUBSTRING_SCAN_MAX} categories\n"
+        f"{len(ad_texts)} ads, {len(topics)} page topics; seconds per pass"
+    )
+    print(
+        f"{'categories':>10} {'ads substr':>11} {'ads automaton':>14} "
+        f"{'topics substr':>14} {'topics automaton':>17} {'find() picks':>13}"
+    )
+    for size in args.categories:
+        matcher = CategoryMatcher(taxonomy(size))
+        matcher._find_automaton("")  # compile outside the timing
+
+        for text in ad_texts[:100] + topics[:100]:
+            assert matcher._find_substrings(text) == matcher._find_automaton(text)
+
+        picks = "substring" if size <= category_matcher.SUBSTRING_SCAN_MAX else "automaton"
+        print(
+            f"{size:>10} {timed(matcher._find_substrings, ad_texts):>11.3f} "
+            f"{timed(matcher._find_automaton, ad_texts):>14.3f} "
+            f"{timed(matcher._find_substrings, topics):>14.4f} "
+            f"{timed(matcher._find_automaton, topics):>17.4f} {picks:>13}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# benchmarks/bench_embeddings.py
+# Memory, latency and accuracy of dense LSA embeddings against sparse TF-IDF scoring
+#
+# Run from the project root:
+#   python -m benchmarks.bench_embeddings --ads 100000 --dims 64 128 256
+#
+# The projection is fitted on the first --fit-share of the ads; the rest are
+# added afterwards and only projected, like ads ingested after a fit. Queries
+# are pages generated from seeds no other benchmark uses, and the dense
+# rankings are scored against the exact sparse ranking of the same engine.
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_ads, generate_content_features
+from src.matching_engine import MatchingEngine
+
+# Seeds of the held-out query pages
+_QUERY_SEED = 100000
+
+
+def nbytes(matrix):
+    """Bytes of a CSR/CSC matrix or a dense array"""
+    if isinstance(matrix, np.ndarray):
+        return matrix.nbytes
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+
+def build(ads, fit_share, **engine_options):
+    engine = MatchingEngine(**engine_options)
+    split = int(len(ads) * fit_share)
+    engine.add_ads(ads[:split])
+    engine._flush_pending_vectors()
+    engine.add_ads(ads[split:])
+    engine._flush_pending_vectors()
+    return engine
+
+
+def latency(engine, features_list, top_k, batch_size):
+    """Median match_content ms and match_batch ms per page"""
+    durations = []
+    for features in features_list:
+        start = time.perf_counter()
+        engine.match_content(features, top_k=top_k)
+        durations.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(0, len(features_list), batch_size):
+        engine.match_batch(features_list[i:i + batch_size], top_k=top_k)
+    per_page = (time.perf_counter() - start) / len(features_list)
+    return np.median(durations) * 1000, per_page * 1000
+
+
+def rankings(engine, features_list, top_k):
+    return [
+        [match["ad"]["classification"]["ad_id"] for match in engine.match_content(f, top_k=top_k)]
+        for f in features_list
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ads", type=int, default=20000)
+    parser.add_argument("--dims", type=int, nargs="+", default=[64, 128, 256])
+    parser.add_argument("--fit-share", type=float, default=0.8,
+                        help="share of the ads the projection is fitted on")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    ads = generate_ads(args.ads)
+    features_list = [
+        generate_content_features(seed=_QUERY_SEED + i) for i in range(args.queries)
+    ]
+
+    sparse = build(ads, args.fit_share)
+    sparse.match_content(features_list[0])  # builds the postings
+    expected = rankings(sparse, features_list, args.top_k)
+
+    n_ads = sparse.inventory_size
+    print(f"{n_ads} ads, {len(features_list)} held-out pages, top {args.top_k}")
+    print(
+        f"{'mode':>12} {'bytes/ad':>9} {'match ms':>9} {'batch ms/page':>14} "
+        f"{'recall':>7} {'top-1':>6}"
+    )
+
+    # The sparse mode keeps CSC postings of the vectors for candidate retrieval
+    sparse_bytes = nbytes(sparse.ad_vectors) + nbytes(sparse._postings[0])
+    median, per_page = latency(sparse, features_list, args.top_k, args.batch_size)
+    print(
+        f"{'sparse':>12} {sparse_bytes / n_ads:>9.0f} {median:>9.2f} {per_page:>14.2f} "
+        f"{1:>7.3f} {1:>6.3f}"
+    )
+
+    for dim in args.dims:
+        dense = build(ads, args.fit_share, embedding_dim=dim)
+        dense.match_content(features_list[0])  # warm up
+        dense_bytes = nbytes(dense.ad_embeddings)
+        median, per_page = latency(dense, features_list, args.top_k, args.batch_size)
+
+        found = rankings(dense, features_list, args.top_k)
+        recall = np.mean([
+            len(set(a) & set(b)) / max(1, len(b)) for a, b in zip(found, expected)
+        ])
+        top_1 = np.mean([a[:1] == b[:1] for a, b in zip(found, expected)])
+        print(
+            f"{'dense ' + str(dim):>12} {dense_bytes / n_ads:>9.0f} {median:>9.2f} "
+            f"{per_page:>14.2f} {recall:>7.3f} {top_1:>6.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/bench_hashing.py
+# Streaming ingest throughput and ranking quality of the feature hashing mode
+#
+# Run from the project root:
+#   python -m benchmarks.bench_hashing --ads 100000 --chunk 500
+#
+# Ads arrive in chunks of --chunk, each followed by one match (so pending
+# vectors get stacked, as when serving while ingesting). Rankings are then
+# compared with a reference engine fitted once on the whole inventory with
+# an unlimited vocabulary.
+
+import argparse
+import time
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from benchmarks.synthetic import generate_ads, generate_content_features
+from src.matching_engine import MatchingEngine
+
+
+def stream(engine, ads, chunk, features):
+    """Add ads chunk by chunk, matching after each; returns the seconds per chunk"""
+    durations = []
+    for i in range(0, len(ads), chunk):
+        start = time.perf_counter()
+        engine.add_ads(ads[i:i + chunk])
+        engine.match_content(features)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def top_ids(engine, features_list, k):
+    return [
+        {match["ad"]["classification"]["ad_id"] for match in engine.match_content(f, top_k=k)}
+        for f in features_list
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ads", type=int, default=20000)
+    parser.add_argument("--chunk", type=int, default=500)
+    parser.add_argument("--hash-features", type=int, nargs="+", default=[2 ** 16, 2 ** 18, 2 ** 20])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    ads = generate_ads(args.ads)
+    features_list = [generate_content_features(seed=seed) for seed in range(args.queries)]
+
+    reference = MatchingEngine()
+    reference.vectorizer = TfidfVectorizer()
+    reference.add_ads(ads)
+    expected = top_ids(reference, features_list, args.top_k)
+
+    modes = {"tfidf (1000 terms)": {}}
+    for n_features in args.hash_features:
+        modes[f"hashing 2^{n_features.bit_length() - 1}"] = {"hash_features": n_features}
+
+    print(f"{len(ads)} ads in chunks of {args.chunk}; recall@{args.top_k} against a full-vocabulary fit")
+    print(
+        f"{'mode':>20} {'ads/s':>9} {'worst chunk ms':>15} {'match ms':>9} "
+        f"{'vectors MB':>11} {'recall':>7}"
+    )
+    for name, options in modes.items():
+        engine = MatchingEngine(**options)
+        durations = stream(engine, ads, args.chunk, features_list[0])
+
+        start = time.perf_counter()
+        found = top_ids(engine, features_list, args.top_k)
+        match_ms = (time.perf_counter() - start) / len(features_list) * 1000
+
+        vectors = engine.ad_vectors
+        size_mb = (vectors.data.nbytes + vectors.indices.nbytes + vectors.indptr.nbytes) / 1e6
+        recall = sum(len(a & b) for a, b in zip(found, expected)) / sum(map(len, expected))
+        print(
+            f"{name:>20} {len(ads) / sum(durations):>9.0f} {max(durations) * 1000:>15.1f} "
+            f"{match_ms:>9.2f} "
+            f"{size_mb:>11.1f} {recall:>7.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
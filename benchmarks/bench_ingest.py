@@ -0,0 +1,48 @@
+# benchmarks/bench_ingest.py
+# Ingest time of MatchingEngine as the inventory grows
+#
+# Run from the project root:
+#   python -m benchmarks.bench_ingest --sizes 1000 2000 4000 8000
+
+import argparse
+import time
+
+from benchmarks.synthetic import generate_ads
+from src.matching_engine import MatchingEngine
+
+
+def time_bulk(ads):
+    engine = MatchingEngine()
+    start = time.perf_counter()
+    engine.add_ads(ads)
+    return time.perf_counter() - start
+
+
+def time_incremental(ads):
+    engine = MatchingEngine()
+    start = time.perf_counter()
+    for ad in ads:
+        engine.add_ad(ad["content"], ad["metadata"])
+    # Include stacking the pending rows, which happens before the first match
+    engine._flush_pending_vectors()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 4000, 8000])
+    args = parser.parse_args()
+
+    print(f"{'ads':>8} {'bulk (s)':>10} {'us/ad':>8} {'single (s)':>11} {'us/ad':>8}")
+    for n in args.sizes:
+        ads = generate_ads(n)
+        bulk = time_bulk(ads)
+        single = time_incremental(ads)
+        print(
+            f"{n:>8} {bulk:>10.3f} {bulk / n * 1e6:>8.1f} "
+            f"{single:>11.3f} {single / n * 1e6:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/bench_match.py
+# Per-request latency of MatchingEngine.match_content by inventory size
+#
+# Run from the project root:
+#   python -m benchmarks.bench_match --sizes 10000 100000 1000000
+#
+# Ingesting a million distinct ads takes a while, so the inventory is built
+# from --distinct synthetic ads and replicated up to each size.
+
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import cosine_similarity
+
+from benchmarks.synthetic import generate_ads, generate_content_features
+from src.matching_engine import MatchingEngine
+
+
+def replicate(engine, copies, **engine_options):
+    """Return a new engine whose inventory is engine's repeated copies times"""
+    engine._flush_pending_vectors()
+    replica = MatchingEngine(**engine_options)
+    replica.vectorizer = engine.vectorizer
+    replica.feature_names = engine.feature_names
+    replica.keyword_vocabulary = engine.keyword_vocabulary
+    replica.category_vocabulary = engine.category_vocabulary
+    replica.ad_inventory = engine.ad_inventory * copies
+    replica.ad_vectors = sp.vstack([engine.ad_vectors] * copies, format="csr")
+    replica.keyword_matrix = sp.vstack([engine.keyword_matrix] * copies, format="csr")
+    replica.category_matrix = sp.vstack([engine.category_matrix] * copies, format="csr")
+    replica._fitted_size = len(replica.ad_inventory)
+    return replica
+
+
+def reference_ranking(engine, content_features):
+    """Top 10 ad indices using the original per-ad scoring loop"""
+    content_text = " ".join(content_features.get("keywords", []) +
+                           content_features.get("topic_candidates", []) +
+                           [e[0] for e in content_features.get("entities", [])])
+    content_vector = engine.vectorizer.transform([content_text])
+    similarity_scores = cosine_similarity(content_vector, engine.ad_vectors)[0]
+    content_keywords = set(content_features.get("keywords", []))
+    content_topics = set(content_features.get("topic_candidates", []))
+
+    scores = []
+    for i, ad in enumerate(engine.ad_inventory):
+        ad_keywords = set(ad["classification"].get("keywords", []))
+        keyword_overlap = len(content_keywords.intersection(ad_keywords))
+        ad_categories = set(ad["classification"].get("categories", []))
+        category_match = sum(
+            1
+            for topic in content_topics
+            if any(cat in topic for cat in ad_categories)
+        )
+        scores.append(
+            (0.5 * similarity_scores[i])
+            + (0.3 * (keyword_overlap / max(1, len(content_keywords))))
+            + (0.2 * category_match)
+        )
+    return sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:10]
+
+
+def time_calls(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return np.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--distinct", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--content-words", type=int, default=150,
+        help="keywords per synthetic page; short pages share terms with fewer ads",
+    )
+    parser.add_argument(
+        "--reference-limit", type=int, default=100000,
+        help="largest size to also time the original per-ad loop on",
+    )
+    args = parser.parse_args()
+
+    base = MatchingEngine()
+    base.add_ads(generate_ads(args.distinct))
+    features = generate_content_features(n_words=args.content_words, seed=1)
+
+    print(
+        f"{'ads':>9} {'match (ms)':>11} {'no index (ms)':>14} {'candidates':>11} "
+        f"{'loop (ms)':>10} {'same top-10':>12}"
+    )
+    for n in args.sizes:
+        copies = max(1, n // args.distinct)
+        engine = replicate(base, copies)
+        engine.match_content(features)  # warm up
+        elapsed, matches = time_calls(lambda: engine.match_content(features), args.repeat)
+        candidates = engine.last_candidate_counts[0]
+
+        # Same inventory, scoring every ad instead of the retrieved candidates
+        exhaustive = replicate(base, copies, candidate_retrieval=False)
+        exhaustive_elapsed, _ = time_calls(
+            lambda: exhaustive.match_content(features), args.repeat
+        )
+
+        loop, same = "-", "-"
+        if len(engine.ad_inventory) <= args.reference_limit:
+            loop_elapsed, ranking = time_calls(
+                lambda: reference_ranking(engine, features), 1
+            )
+            loop = f"{loop_elapsed * 1000:.1f}"
+            same = [m["ad"] for m in matches] == [engine.ad_inventory[i] for i in ranking]
+        print(
+            f"{len(engine.ad_inventory):>9} {elapsed * 1000:>11.1f} "
+            f"{exhaustive_elapsed * 1000:>14.1f} {candidates:>11} {loop:>10} {str(same):>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_privacy.py
+# PII redaction and PrivacyLayer cost at realistic page sizes
+#
+# Run from the project root:
+#   python -m benchmarks.bench_privacy --sizes 200 2000 20000 200000
+
+import argparse
+import copy
+import random
+import time
+
+from benchmarks.synthetic import generate_content_features, generate_pages
+from src.privacy_layer import PrivacyLayer
+
+# PII sprinkled into the pages, roughly one per this many words
+_PII_EVERY = 80
+_PII_SAMPLES = [
+    "jane.doe@example.com",
+    "(555) 123-4567",
+    "+1 555.123.4567",
+    "123-45-6789",
+    "4111 1111 1111 1111",
+    "192.168.0.12",
+]
+
+
+def page_with_pii(n_chars, seed=0):
+    """A synthetic page of about n_chars characters with PII mixed in"""
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    for page in generate_pages(max(1, n_chars // 1000 + 1), seed=seed, min_words=200):
+        for word in page.split():
+            if rng.randrange(_PII_EVERY) == 0:
+                word = rng.choice(_PII_SAMPLES)
+            words.append(word)
+            length += len(word) + 1
+            if length >= n_chars:
+                return " ".join(words)
+    return " ".join(words)
+
+
+def redact_per_pattern(privacy_layer, text):
+    """Reference: one re.sub pass per PII type"""
+    for pattern_name, pattern in privacy_layer.pii_patterns.items():
+        text = pattern.sub(f"[REDACTED {pattern_name.upper()}]", text)
+    return text
+
+
+def time_calls(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200, 2000, 20000, 200000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    privacy_layer = PrivacyLayer()
+    privacy_layer.differential_privacy_enabled = False
+
+    print(
+        f"{'chars':>8} {'per-type (ms)':>14} {'one pass (ms)':>14} {'same':>5} "
+        f"{'deepcopy (ms)':>14} {'pipeline (ms)':>14}"
+    )
+    for n in args.sizes:
+        text = page_with_pii(n)
+        per_type = time_calls(lambda: redact_per_pattern(privacy_layer, text), args.repeat)
+        one_pass = time_calls(lambda: privacy_layer.redact_text(text), args.repeat)
+        same = redact_per_pattern(privacy_layer, text) == privacy_layer.redact_text(text)
+
+        # Features of a page this size, with the full text as the summary
+        features = generate_content_features(n_words=max(1, n // 12))
+        features["text_summary"] = text
+        deep_copy = time_calls(lambda: copy.deepcopy(features), args.repeat)
+        pipeline = time_calls(
+            lambda: privacy_layer.apply_privacy_measures(features), args.repeat
+        )
+        print(
+            f"{len(text):>8} {per_type * 1000:>14.3f} {one_pass * 1000:>14.3f} {str(same):>5} "
+            f"{deep_copy * 1000:>14.3f} {pipeline * 1000:>14.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# benchmarks/bench_profiles.py
+# Speed and relevance of the ContentAnalyzer analysis profiles
+#
+# Run from the project root (needs the en_core_web_sm spaCy model):
+#   python -m benchmarks.bench_profiles --pages 500
+#
+# Relevance is the overlap of each profile's top-10 ads with the "full"
+# profile's, averaged over the pages.
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_pages
+from data.sample_ads import get_sample_ads
+from src.content_analyzer import ANALYSIS_PROFILES, ContentAnalyzer
+from src.matching_engine import MatchingEngine
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=500)
+    args = parser.parse_args()
+
+    pages = generate_pages(args.pages)
+    engine = MatchingEngine()
+    engine.add_ads(get_sample_ads())
+
+    rankings = {}
+    print(f"{'profile':>9} {'docs/s':>8} {'overlap@10':>11}")
+    for profile in ANALYSIS_PROFILES:
+        analyzer = ContentAnalyzer(profile=profile)
+        analyzer.analyze_batch(pages[:10])  # warm up
+
+        start = time.perf_counter()
+        features_list = analyzer.analyze_batch(pages)
+        elapsed = time.perf_counter() - start
+
+        rankings[profile] = [
+            {id(m["ad"]) for m in matches}
+            for matches in engine.match_batch(features_list)
+        ]
+        overlap = np.mean([
+            len(ranked & full) / max(1, len(full))
+            for ranked, full in zip(rankings[profile], rankings["full"])
+        ])
+        print(f"{profile:>9} {len(pages) / elapsed:>8.1f} {overlap:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
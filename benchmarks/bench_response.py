@@ -0,0 +1,73 @@
+# benchmarks/bench_response.py
+# Serialization cost and size of /recommend responses
+#
+# Run from the project root:
+#   python -m benchmarks.bench_response --top-k 10 --ads 2000
+
+import argparse
+import json
+import time
+
+from fastapi.responses import JSONResponse
+
+from api.schemas import recommend_response, to_json
+from benchmarks.synthetic import generate_ads, generate_content_features
+from src.main import PrivacyAdEngine
+from src.matching_engine import MatchingEngine
+
+
+def round_trip(result):
+    """Reference: the old dumps/loads round trip followed by JSONResponse"""
+    cleaned_result = json.loads(
+        json.dumps(
+            result,
+            default=lambda o: float(o) if hasattr(o, "__float__") else str(o),
+        )
+    )
+    return JSONResponse(content=cleaned_result).body
+
+
+def time_calls(fn, results, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for result in results:
+            body = fn(result)
+    return (time.perf_counter() - start) / (repeat * len(results)), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ads", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # Responses are built the way process_content builds them, minus spaCy
+    engine = PrivacyAdEngine()
+    engine._matching_engine = MatchingEngine()
+    engine._matching_engine.add_ads(generate_ads(args.ads))
+    results = []
+    for seed in range(args.pages):
+        private_features = engine.privacy_layer.apply_privacy_measures(
+            generate_content_features(seed=seed)
+        )
+        matches = engine.matching_engine.match_content(private_features, top_k=args.top_k)
+        results.append(engine._build_response(private_features, matches, None))
+
+    modes = {
+        "round trip": round_trip,
+        "typed": lambda result: to_json(recommend_response(result)),
+        "compact": lambda result: to_json(recommend_response(result, compact=True)),
+        "compact+factors": lambda result: to_json(
+            recommend_response(result, compact=True, include_factors=True)
+        ),
+    }
+    print(f"{'mode':>16} {'us/response':>12} {'bytes':>8}")
+    for name, fn in modes.items():
+        elapsed, size = time_calls(fn, results, args.repeat)
+        print(f"{name:>16} {elapsed * 1e6:>12.1f} {size:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/bench_shards.py
+# Match latency of ShardedMatchingEngine by shard count, against the unsharded engine
+#
+# Run from the project root:
+#   python -m benchmarks.bench_shards --size 1000000 --shards 1 2 4 8
+#
+# Every sharded ranking is also checked against the unsharded engine's.
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_match import replicate
+from benchmarks.synthetic import generate_ads, generate_content_features
+from src.matching_engine import MatchingEngine
+from src.sharded_matching import ShardedMatchingEngine
+
+
+def _ranking(matches):
+    return [(match["ad"]["classification"]["ad_id"], match["relevance_score"]) for match in matches]
+
+
+def _latency(fn, features_list):
+    durations = []
+    for features in features_list:
+        start = time.perf_counter()
+        fn(features)
+        durations.append(time.perf_counter() - start)
+    return np.median(durations) * 1000, np.percentile(durations, 99) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--distinct", type=int, default=20000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    engine = MatchingEngine()
+    engine.add_ads(generate_ads(min(args.distinct, args.size)))
+    engine = replicate(engine, max(1, args.size // min(args.distinct, args.size)))
+    features_list = [generate_content_features(seed=seed) for seed in range(args.queries)]
+    expected = [
+        _ranking(engine.match_content(features, top_k=args.top_k)) for features in features_list
+    ]
+
+    median, p99 = _latency(lambda f: engine.match_content(f, top_k=args.top_k), features_list)
+    print(f"{len(engine.ad_inventory)} ads")
+    print(f"{'shards':>10} {'median ms':>10} {'p99 ms':>8} {'batch ms/page':>14} {'exact':>6}")
+    print(f"{'unsharded':>10} {median:>10.2f} {p99:>8.2f} {'':>14} {'':>6}")
+
+    for n_shards in args.shards:
+        sharded = ShardedMatchingEngine(engine, n_shards)
+        sharded.match_content(features_list[0])  # warm up
+        median, p99 = _latency(
+            lambda f: sharded.match_content(f, top_k=args.top_k), features_list
+        )
+
+        start = time.perf_counter()
+        batch = sharded.match_batch(features_list, top_k=args.top_k)
+        per_page = (time.perf_counter() - start) / len(features_list) * 1000
+
+        exact = [_ranking(matches) for matches in batch] == expected and all(
+            _ranking(sharded.match_content(features, top_k=args.top_k)) == ranking
+            for features, ranking in zip(features_list, expected)
+        )
+        print(f"{n_shards:>10} {median:>10.2f} {p99:>8.2f} {per_page:>14.2f} {str(exact):>6}")
+        sharded.close()
+
+
+if __name__ == "__main__":
+    main()
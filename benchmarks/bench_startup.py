@@ -0,0 +1,65 @@
+# benchmarks/bench_startup.py
+# Startup cost of PrivacyAdEngine, broken down by stage
+#
+# Run from the project root (needs the en_core_web_sm spaCy model):
+#   python -m benchmarks.bench_startup [--index index/] [--runs 3]
+#
+# Each run is a fresh interpreter, so imports are measured cold.
+
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+# Runs in the child interpreter; prints the stage timings as JSON
+_CHILD = """
+import json, sys, time
+timings = {}
+start = time.perf_counter()
+from src.main import PrivacyAdEngine
+timings["import"] = time.perf_counter() - start
+
+start = time.perf_counter()
+engine = PrivacyAdEngine(index_path=sys.argv[1] or None)
+timings["construct"] = time.perf_counter() - start
+
+start = time.perf_counter()
+engine.content_analyzer.load()
+timings["model_load"] = time.perf_counter() - start
+
+start = time.perf_counter()
+engine.matching_engine
+timings["index_build"] = time.perf_counter() - start
+
+start = time.perf_counter()
+engine.process_content("Smart devices and healthy food for the whole family.")
+timings["first_request"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index", default="", help="index snapshot to load instead of the sample ads")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _CHILD, args.index],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'stage':>14} {'median (ms)':>12}")
+    for stage in runs[0]:
+        print(f"{stage:>14} {np.median([run[stage] for run in runs]) * 1000:>12.1f}")
+    total = np.median([sum(run.values()) for run in runs])
+    print(f"{'total':>14} {total * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
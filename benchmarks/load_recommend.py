@@ -0,0 +1,96 @@
+# benchmarks/load_recommend.py
+# Load test for a running API server: /recommend latency under concurrency
+#
+# Start the server, then from the project root:
+#   python -m benchmarks.load_recommend --url http://localhost:8000 --concurrency 32
+#
+# /health is probed alongside the load to show whether the event loop stays
+# responsive. Run it against the server before and after a change to compare.
+# A --concurrency above the server's ENGINE_MAX_PENDING (default 8 per
+# worker) mostly measures 429s; raise that setting to compare latencies.
+
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.synthetic import generate_pages
+
+
+def post(url, payload, timeout):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = "error"
+    return status, time.perf_counter() - start
+
+
+def probe_health(url, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url + "/health", timeout=30) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start)
+        except OSError:
+            pass
+        time.sleep(0.05)
+
+
+def percentiles(latencies):
+    if not latencies:
+        return "-"
+    p50, p90, p99 = np.percentile(np.array(latencies) * 1000, [50, 90, 99])
+    return f"p50 {p50:.1f} ms, p90 {p90:.1f} ms, p99 {p99:.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    pages = generate_pages(args.requests, max_words=1500)
+    stop = threading.Event()
+    health_latencies = []
+    prober = threading.Thread(target=probe_health, args=(args.url, stop, health_latencies))
+    prober.start()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(
+            lambda page: post(args.url + "/recommend", {"data": {"content": page}}, args.timeout),
+            pages,
+        ))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    prober.join()
+
+    statuses = Counter(status for status, _ in results)
+    ok = [latency for status, latency in results if status == 200]
+    print(f"{len(results)} requests, concurrency {args.concurrency}, {len(results) / elapsed:.1f} req/s")
+    print(f"statuses: {dict(statuses)}")
+    print(f"/recommend (200s): {percentiles(ok)}")
+    print(f"/health under load: {percentiles(health_latencies)}")
+
+
+if __name__ == "__main__":
+    main()
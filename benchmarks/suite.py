@@ -0,0 +1,243 @@
+# benchmarks/suite.py
+# Stage-level benchmark suite with machine-readable results
+#
+# Run from the project root (the analyze stage needs the en_core_web_sm spaCy model):
+#   python -m benchmarks.suite --out results.json
+#   python -m benchmarks.suite --sizes 1000 10000 100000 1000000 --out results.json
+#   python -m benchmarks.suite --stages privacy ingest match --out results.json
+#
+# Compare two runs, e.g. the base and head of a branch; exits with status 1
+# when a stage's median got slower than --threshold times the baseline:
+#   python -m benchmarks.suite compare base.json head.json --threshold 1.2
+#
+# Every input is generated from --seed, so runs on the same machine are
+# comparable across commits.
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_ads, generate_content_features, generate_pages
+
+STAGES = ("analyze", "privacy", "ingest", "match")
+
+# Ads added one at a time with add_ad on top of each built inventory
+_INCREMENTAL_ADS = 200
+
+
+def _summary(durations):
+    """Latency statistics of a list of durations in seconds"""
+    durations = np.asarray(durations)
+    return {
+        "count": int(len(durations)),
+        "total_s": float(durations.sum()),
+        "mean_ms": float(durations.mean() * 1000),
+        "median_ms": float(np.median(durations) * 1000),
+        "p90_ms": float(np.percentile(durations, 90) * 1000),
+        "p99_ms": float(np.percentile(durations, 99) * 1000),
+    }
+
+
+def _timed(fn, items):
+    """Call fn on each item and return the duration of every call"""
+    durations = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def bench_analyze(args):
+    from src.content_analyzer import ContentAnalyzer
+
+    analyzer = ContentAnalyzer(cache=None)
+    analyzer.load()
+    analyzer.analyze(generate_pages(1, seed=args.seed)[0])  # warm up
+
+    results = []
+    for words in args.page_words:
+        pages = generate_pages(args.pages, seed=args.seed, min_words=words, max_words=words)
+        results.append({"page_words": words, **_summary(_timed(analyzer.analyze, pages))})
+    return results
+
+
+def bench_privacy(args):
+    from src.privacy_layer import PrivacyLayer
+
+    privacy_layer = PrivacyLayer(seed=args.seed)
+
+    results = []
+    for words in args.page_words:
+        pages = generate_pages(args.pages, seed=args.seed, min_words=words, max_words=words)
+        features_list = []
+        for i, page in enumerate(pages):
+            features = generate_content_features(n_words=max(1, words // 2), seed=args.seed + i)
+            features["text_summary"] = page
+            features_list.append(features)
+        durations = _timed(privacy_layer.apply_privacy_measures, features_list)
+        results.append({"page_words": words, **_summary(durations)})
+    return results
+
+
+def bench_ingest(args, inventories):
+    from src.matching_engine import MatchingEngine
+
+    results = []
+    for size, ads in inventories.items():
+        engine = MatchingEngine()
+        start = time.perf_counter()
+        engine.add_ads(ads)
+        engine._flush_pending_vectors()
+        bulk = time.perf_counter() - start
+
+        extra = generate_ads(_INCREMENTAL_ADS, seed=args.seed + 1)
+        durations = _timed(lambda ad: engine.add_ad(ad["content"], ad["metadata"]), extra)
+        # Stacking the pending rows happens before the next match; count it
+        start = time.perf_counter()
+        engine._flush_pending_vectors()
+        durations[-1] += time.perf_counter() - start
+
+        results.append({
+            "ads": size,
+            "bulk_s": bulk,
+            "bulk_us_per_ad": bulk / size * 1e6,
+            "add_ad": _summary(durations),
+        })
+    return results
+
+
+def bench_match(args, inventories):
+    from src.matching_engine import MatchingEngine
+
+    features_list = [
+        generate_content_features(n_words=args.match_words, seed=args.seed + i)
+        for i in range(args.queries)
+    ]
+
+    results = []
+    for size, ads in inventories.items():
+        engine = MatchingEngine()
+        engine.add_ads(ads)
+        engine.match_content(features_list[0])  # warm up
+        durations = _timed(lambda features: engine.match_content(features, top_k=10), features_list)
+        results.append({"ads": size, **_summary(durations)})
+    return results
+
+
+def environment():
+    """Where the results came from"""
+    import scipy
+    import sklearn
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "scikit-learn": sklearn.__version__,
+    }
+
+
+def run(args):
+    report = {"environment": environment(), "parameters": vars(args).copy(), "stages": {}}
+    report["parameters"].pop("func", None)
+
+    if "analyze" in args.stages:
+        report["stages"]["analyze"] = bench_analyze(args)
+    if "privacy" in args.stages:
+        report["stages"]["privacy"] = bench_privacy(args)
+    if "ingest" in args.stages or "match" in args.stages:
+        inventories = {size: generate_ads(size, seed=args.seed) for size in args.sizes}
+        if "ingest" in args.stages:
+            report["stages"]["ingest"] = bench_ingest(args, inventories)
+        if "match" in args.stages:
+            report["stages"]["match"] = bench_match(args, inventories)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+        print(f"Wrote {args.out}", file=sys.stderr)
+    else:
+        print(output)
+
+
+def _medians(report):
+    """(stage, case) -> median milliseconds of one report"""
+    medians = {}
+    for stage, results in report["stages"].items():
+        for result in results:
+            if "ads" not in result:
+                medians[(stage, f"page_words={result['page_words']}")] = result["median_ms"]
+            elif stage == "ingest":
+                medians[(stage, f"ads={result['ads']} bulk")] = result["bulk_s"] * 1000
+                medians[(stage, f"ads={result['ads']} add_ad")] = result["add_ad"]["median_ms"]
+            else:
+                medians[(stage, f"ads={result['ads']}")] = result["median_ms"]
+    return medians
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = _medians(json.load(f))
+    with open(args.candidate) as f:
+        candidate = _medians(json.load(f))
+
+    regressions = 0
+    print(f"{'stage':>8} {'case':>20} {'base (ms)':>10} {'new (ms)':>10} {'ratio':>6}")
+    for key in sorted(baseline.keys() & candidate.keys()):
+        ratio = candidate[key] / baseline[key] if baseline[key] else float("inf")
+        flag = ""
+        if ratio > args.threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(
+            f"{key[0]:>8} {key[1]:>20} {baseline[key]:>10.3f} {candidate[key]:>10.3f} "
+            f"{ratio:>6.2f}{flag}"
+        )
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each pipeline stage separately")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="ad inventory sizes for the ingest and match stages")
+    parser.add_argument("--page-words", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="page lengths for the analyze and privacy stages")
+    parser.add_argument("--pages", type=int, default=50, help="pages per length")
+    parser.add_argument("--queries", type=int, default=200, help="match_content calls per size")
+    parser.add_argument("--match-words", type=int, default=150,
+                        help="keywords per page in the match queries")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    parser.set_defaults(func=run)
+
+    subparsers = parser.add_subparsers()
+    compare_parser = subparsers.add_parser("compare", help="compare two JSON reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=1.2,
+                                help="slowdown ratio reported as a regression")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
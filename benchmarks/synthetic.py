@@ -0,0 +1,132 @@
+# benchmarks/synthetic.py
+# Synthetic ad inventories for benchmarking
+
+import random
+
+from data.sample_ads import get_sample_ads
+from data.sample_categories import get_sample_categories
+
+# Filler words mixed into synthetic ads so the vocabulary grows with the inventory
+_FILLER_SYLLABLES = ["ka", "lo", "mi", "ter", "van", "os", "ri", "zu", "pel", "dor"]
+
+# Share of words drawn from the ad's theme rather than the whole vocabulary
+_THEME_SHARE = 0.7
+
+
+def _words(text):
+    return [w.strip(".,!?%").lower() for w in text.split() if w.strip(".,!?%").isalpha()]
+
+
+def _themes():
+    """Vocabulary of the sample ads, grouped by their metadata category"""
+    themes = {}
+    for ad in get_sample_ads():
+        themes.setdefault(ad["metadata"]["category"], set()).update(_words(ad["content"]))
+    return {theme: sorted(words) for theme, words in sorted(themes.items())}
+
+
+def _vocabulary():
+    """Words from the sample ads and category names"""
+    words = set()
+    for theme_words in _themes().values():
+        words.update(theme_words)
+    for category in get_sample_categories():
+        words.update(category.split())
+    return sorted(words)
+
+
+def _themed_words(rng, theme_words, vocabulary, n):
+    """n words, mostly from the theme and the rest from the whole vocabulary"""
+    return [
+        rng.choice(theme_words if rng.random() < _THEME_SHARE else vocabulary)
+        for _ in range(n)
+    ]
+
+
+def generate_ads(n, seed=0, words_per_ad=14):
+    """
+    Generate n synthetic ads shaped like get_sample_ads().
+
+    Each ad draws most of its words from one of the sample ad themes, so the
+    inventory clusters the way a real catalog does.
+
+    Args:
+        n (int): Number of ads
+        seed (int): Random seed, so runs are reproducible
+        words_per_ad (int): Approximate ad length in words
+
+    Returns:
+        list: A list of dictionaries containing ad content and metadata
+    """
+    rng = random.Random(seed)
+    themes = _themes()
+    theme_names = list(themes)
+    vocabulary = _vocabulary()
+    categories = get_sample_categories()
+
+    ads = []
+    for i in range(n):
+        theme = rng.choice(theme_names)
+        category = rng.choice(categories)
+        words = [category] + _themed_words(rng, themes[theme], vocabulary, words_per_ad - 2)
+        # One made-up brand word per ad keeps the long tail of the vocabulary
+        brand = "".join(rng.choice(_FILLER_SYLLABLES) for _ in range(3))
+        words.append(brand)
+        rng.shuffle(words)
+        ads.append({
+            "content": " ".join(words).capitalize() + "!",
+            "metadata": {"category": theme, "target_audience": "synthetic"},
+        })
+    return ads
+
+
+def generate_content_features(n_words=150, seed=0):
+    """
+    Generate features shaped like ContentAnalyzer.analyze() output.
+
+    Args:
+        n_words (int): Number of keyword tokens on the page
+        seed (int): Random seed
+
+    Returns:
+        dict: Content features including keywords, entities, topics
+    """
+    rng = random.Random(seed)
+    themes = _themes()
+    vocabulary = _vocabulary()
+    theme_words = themes[rng.choice(list(themes))]
+    keywords = _themed_words(rng, theme_words, vocabulary, n_words)
+    return {
+        "keywords": keywords,
+        "entities": [(rng.choice(vocabulary).title(), "ORG") for _ in range(3)],
+        "noun_phrases": [],
+        "topic_candidates": keywords[::2],
+        "word_count": n_words * 2,
+        "text_summary": " ".join(keywords)[:200],
+    }
+
+
+def generate_pages(n, seed=0, min_words=50, max_words=300):
+    """
+    Generate plain-text pages for the content analyzer.
+
+    Args:
+        n (int): Number of pages
+        seed (int): Random seed
+        min_words (int): Shortest page, in words
+        max_words (int): Longest page, in words
+
+    Returns:
+        list: Page texts
+    """
+    rng = random.Random(seed)
+    pages = []
+    for i in range(n):
+        words = generate_content_features(
+            n_words=rng.randint(min_words, max_words), seed=seed + i
+        )["keywords"]
+        sentences = [
+            " ".join(words[j:j + 12]).capitalize() + "." for j in range(0, len(words), 12)
+        ]
+        pages.append(" ".join(sentences))
+    return pages
@@ -1,17 +1,43 @@
 # ad_classifier.py
 # A basic ad classifier that categorizes ads
 
+import hashlib
+
+import numpy as np
+import scipy.sparse as sp
+
 from data.sample_categories import get_sample_categories
+from src.category_matcher import CategoryMatcher
+
+# Number of TF-IDF keywords kept per ad
+TOP_KEYWORDS = 10
+
+# Joins the ad text and its keywords for category detection
+_SEPARATOR = "\0"
 
 class AdClassifier:
-    def __init__(self):
-        # Initialize vectorizer
+    def __init__(self, hashing=None):
+        # Tokenize as TfidfVectorizer does
         from sklearn.feature_extraction.text import TfidfVectorizer
 
-        self.vectorizer = TfidfVectorizer(max_features=1000)
+        self._analyzer = TfidfVectorizer().build_analyzer()
+
+        # Keywords are weighted by IDF over every ad classified so far (and
+        # not removed), so a small batch or a single ad is weighted against
+        # the inventory rather than just itself. Terms get columns in order
+        # of first appearance, as in a TfidfVectorizer fit
+        self.vocabulary = {}
+        self._terms = []
+        self._frequencies = np.zeros(1024, dtype=np.int64)  # Grown geometrically
+        self.n_documents = 0
+
+        # With a HashedTfidf, keywords are weighted by its running document
+        # frequencies instead
+        self.hashing = hashing
 
         # Using simple categorization approach for the purpose of hackathon
         self.categories = get_sample_categories()
+        self.category_matcher = CategoryMatcher(self.categories)
 
     def classify_ad(self, ad_content, ad_metadata=None):
         """
@@ -24,35 +50,108 @@ class AdClassifier:
         Returns:
             dict: Ad classification including categories and keywords
         """
+        return self.classify_ads([{"content": ad_content, "metadata": ad_metadata}])[0]
+
+    def classify_ads(self, ads):
+        """
+        Classify a batch of ads, weighting their terms against every ad seen.
 
-        # Extract keywords using TF-IDF
-        if not hasattr(self, "tfidf_matrix"):
-            # First time, fit the vectorizer
-            self.tfidf_matrix = self.vectorizer.fit_transform([ad_content])
-            self.feature_names = self.vectorizer.get_feature_names_out()
+        The batch is counted into the document frequencies first, and each
+        ad's keywords are then its highest scoring TF-IDF terms. Classifying
+        a whole inventory in one batch gives the keywords of a TfidfVectorizer
+        fitted on it; later batches keep building on those counts. With
+        hashing, the caller counts the documents into it instead.
+
+        Args:
+            ads (iterable): Dicts with "content" and optional "metadata" and
+                "ad_id" keys, as returned by get_sample_ads()
+
+        Returns:
+            list: Ad classifications, in the order of ads
+        """
+        ads = list(ads)
+        ad_contents = [ad["content"] for ad in ads]
+        if not ad_contents:
+            return []
+
+        if self.hashing is not None:
+            keywords = self.hashing.top_terms(ad_contents, TOP_KEYWORDS)
         else:
-            # Transform new content
-            self.tfidf_matrix = self.vectorizer.transform([ad_content])
+            counts = self.add_documents(ad_contents)
+
+            # Only the batch's own terms are weighted, so the cost follows
+            # the batch rather than the vocabulary
+            columns, local_columns = np.unique(counts.indices, return_inverse=True)
+            idf = np.log((1 + self.n_documents) / (1 + self._frequencies[columns])) + 1
+            weights = sp.csr_matrix(
+                (counts.data * idf[local_columns], local_columns, counts.indptr),
+                shape=(counts.shape[0], len(columns)),
+            )
+            terms = np.array([self._terms[column] for column in columns], dtype=object)
+            keywords = _top_keywords(weights, terms, TOP_KEYWORDS)
+        return [
+            self._classification(ad_content, top_keywords, ad.get("ad_id"))
+            for ad, ad_content, top_keywords in zip(ads, ad_contents, keywords)
+        ]
+
+    def add_documents(self, ad_contents):
+        """
+        Count ad texts into the document frequencies.
+
+        Returns:
+            scipy.sparse.csr_matrix: Term counts of each text, with every
+                row's terms in column (first appearance) order
+        """
+        indices = []
+        data = []
+        indptr = [0]
+        for text in ad_contents:
+            counts = {}
+            for token in self._analyzer(text):
+                column = self.vocabulary.get(token)
+                if column is None:
+                    column = self.vocabulary[token] = len(self._terms)
+                    self._terms.append(token)
+                counts[column] = counts.get(column, 0) + 1
+            indices.extend(counts)
+            data.extend(counts.values())
+            indptr.append(len(indices))
 
-        # Get top keywords
-        feature_index = self.tfidf_matrix[0].nonzero()[1]
-        tfidf_scores = zip(
-            feature_index, [self.tfidf_matrix[0, x] for x in feature_index]
+        counts = sp.csr_matrix(
+            (np.array(data, dtype=float), np.array(indices, dtype=np.int64), indptr),
+            shape=(len(ad_contents), len(self._terms)),
         )
-        top_keywords = sorted(
-            [(self.feature_names[i], s) for (i, s) in tfidf_scores],
-            key=lambda x: x[1],
-            reverse=True,
-        )[:10]
+        counts.sort_indices()
 
+        if len(self._terms) > len(self._frequencies):
+            grown = np.zeros(max(len(self._terms), 2 * len(self._frequencies)), dtype=np.int64)
+            grown[:len(self._frequencies)] = self._frequencies
+            self._frequencies = grown
+        # Columns are unique within a row, so each occurrence is one document
+        np.add.at(self._frequencies, counts.indices, 1)
+        self.n_documents += len(ad_contents)
+        return counts
+
+    def remove_documents(self, ad_contents):
+        """Undo add_documents for ad texts that were counted before"""
+        for text in ad_contents:
+            columns = list({self.vocabulary[token] for token in self._analyzer(text)})
+            self._frequencies[columns] -= 1
+        self.n_documents -= len(ad_contents)
+
+    @property
+    def document_frequencies(self):
+        """Ads containing each term, by column"""
+        return self._frequencies[:len(self._terms)]
+
+    def _classification(self, ad_content, top_keywords, ad_id=None):
         # Using a simple rule-based approach for categories for hackathon
         # In a real implementation, use trained classifier
-        detected_categories = []
-        for category in self.categories:
-            if category in ad_content.lower() or any(
-                category in kw for kw, _ in top_keywords
-            ):
-                detected_categories.append(category)
+        # Categories found in the ad or in one of its keywords, in a single
+        # scan; no category contains the separator, so none spans two parts
+        detected_categories = self.category_matcher.find_categories(
+            _SEPARATOR.join([ad_content.lower()] + top_keywords)
+        )
 
         # If no categories detected, use the most general one
         if not detected_categories:
@@ -60,6 +159,43 @@ class AdClassifier:
 
         return {
             "categories": detected_categories,
-            "keywords": [kw for kw, _ in top_keywords],
-            "ad_id": hash(ad_content) % 10000,  # Simple ad ID for demo
+            "keywords": top_keywords,
+            # Caller-assigned, or derived from the content
+            "ad_id": _content_id(ad_content) if ad_id is None else ad_id,
         }
+
+
+def _content_id(ad_content):
+    """
+    Ad ID derived from the content, the same in every process and run
+    (unlike hash(), which is salted per process). 48 bits, so it stays an
+    exact integer in JavaScript clients.
+    """
+    digest = hashlib.blake2b(ad_content.encode("utf-8"), digest_size=6).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _top_keywords(tfidf_matrix, feature_names, k):
+    """
+    Top k terms of every row of a CSR TF-IDF matrix, by descending score.
+
+    Ties keep the order the terms are stored in the row (for a fresh
+    TfidfVectorizer fit, their first appearance in the text). All rows are
+    sorted in one lexsort instead of looking up each element of each row.
+
+    Returns:
+        list: One list of at most k terms per row
+    """
+    tfidf_matrix = tfidf_matrix.tocsr()
+    row_lengths = np.diff(tfidf_matrix.indptr)
+    rows = np.repeat(np.arange(tfidf_matrix.shape[0]), row_lengths)
+
+    # Sorted by row, then score (descending); lexsort is stable, so ties stay
+    # in storage order, and each row's entries still start at indptr[row]
+    order = np.lexsort((-tfidf_matrix.data, rows))
+    rank = np.arange(len(order)) - np.repeat(tfidf_matrix.indptr[:-1], row_lengths)
+    keep = order[rank < k]
+
+    terms = feature_names[tfidf_matrix.indices[keep]].tolist()
+    offsets = np.concatenate(([0], np.cumsum(np.minimum(row_lengths, k))))
+    return [terms[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
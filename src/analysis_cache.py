@@ -0,0 +1,136 @@
+# analysis_cache.py
+# A bounded cache of content analysis results
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+
+# Rough per-object overhead used when estimating the size of cached features
+_ITEM_OVERHEAD = 56
+
+
+class AnalysisCache:
+    """
+    LRU cache of ContentAnalyzer results keyed by a hash of the normalized
+    content, bounded by entry count and estimated memory, with an optional TTL.
+
+    Cached values are frozen (read-only mappings of tuples, nested mappings
+    included), so callers can't modify what later requests get back.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # Seconds; None keeps entries until evicted
+
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(content):
+        """Hash of the content with case and whitespace normalized"""
+        normalized = " ".join(content.lower().split())
+        return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, key):
+        """Cached features for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, size, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, features):
+        """
+        Freeze and store features under key.
+
+        Returns:
+            Mapping: The frozen features
+        """
+        value = freeze_features(features)
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            # Would evict everything else and still not fit
+            return value
+
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Hit/miss/eviction counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+def freeze_features(features):
+    """Read-only copy of content features, with lists turned into tuples"""
+    return _freeze(features)
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (dict, MappingProxyType)):
+        # A proxy of the caller's dict would still change with it, so copy
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    return value
+
+
+def _estimate_size(value):
+    """Approximate memory held by frozen features, in bytes"""
+    if isinstance(value, str):
+        return _ITEM_OVERHEAD + len(value)
+    if isinstance(value, tuple):
+        return _ITEM_OVERHEAD + sum(_estimate_size(item) for item in value)
+    if isinstance(value, MappingProxyType):
+        return _ITEM_OVERHEAD + sum(
+            _estimate_size(key) + _estimate_size(item) for key, item in value.items()
+        )
+    return _ITEM_OVERHEAD
@@ -0,0 +1,114 @@
+# category_matcher.py
+# Finds every category name contained in a text: substring tests for a small
+# taxonomy, one Aho-Corasick pass for a large one
+
+from collections import deque
+
+# Up to this many categories, a substring test per category (each a fast C
+# scan) beats walking the text character by character in Python
+SUBSTRING_SCAN_MAX = 100
+
+
+class CategoryMatcher:
+    """
+    Multi-pattern substring matcher over a list of category names.
+
+    find(text) returns the same categories as testing `category in text` for
+    each one. Past SUBSTRING_SCAN_MAX categories it walks the text once
+    instead, however many categories there are, with an automaton compiled
+    on the first find() after categories change.
+    """
+
+    def __init__(self, categories=()):
+        self.categories = []
+        self._automaton = None
+        self.add(categories)
+
+    def __len__(self):
+        return len(self.categories)
+
+    def add(self, categories):
+        """Append categories; their ids continue from the current ones"""
+        categories = list(categories)
+        if categories:
+            self.categories.extend(categories)
+            self._automaton = None
+
+    def find(self, text):
+        """
+        Ids of the categories contained in text.
+
+        Args:
+            text (str): Text to scan, compared case-sensitively
+
+        Returns:
+            list: Category ids (positions in self.categories), ascending
+        """
+        if len(self.categories) <= SUBSTRING_SCAN_MAX:
+            return self._find_substrings(text)
+        return self._find_automaton(text)
+
+    def _find_substrings(self, text):
+        return [i for i, category in enumerate(self.categories) if category in text]
+
+    def _find_automaton(self, text):
+        if self._automaton is None:
+            self._automaton = _compile(self.categories)
+        goto, fail, output, always = self._automaton
+
+        hits = set(always)
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                hits.update(output[state])
+        return sorted(hits)
+
+    def find_categories(self, text):
+        """Names of the categories contained in text, in category order"""
+        return [self.categories[i] for i in self.find(text)]
+
+
+def _compile(patterns):
+    """
+    Build the Aho-Corasick automaton for patterns.
+
+    Returns:
+        tuple: Per-state transitions (dicts), failure links, the pattern ids
+            ending at each state (including via failure links), and the ids of
+            empty patterns, which every text contains
+    """
+    goto = [{}]
+    output = [[]]
+    always = []
+    for pattern_id, pattern in enumerate(patterns):
+        if not pattern:
+            always.append(pattern_id)
+            continue
+        state = 0
+        for char in pattern:
+            next_state = goto[state].get(char)
+            if next_state is None:
+                next_state = len(goto)
+                goto[state][char] = next_state
+                goto.append({})
+                output.append([])
+            state = next_state
+        output[state].append(pattern_id)
+
+    # Breadth-first, so a state's failure target is finished before the state
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for char, next_state in goto[state].items():
+            target = fail[state]
+            while target and char not in goto[target]:
+                target = fail[target]
+            fail[next_state] = goto[target].get(char, 0)
+            output[next_state] = output[next_state] + output[fail[next_state]]
+            queue.append(next_state)
+
+    return goto, fail, [tuple(ids) for ids in output], always
@@ -1,19 +1,95 @@
 # content_analyzer.py
 # extracts keywords and topics
 
+from collections import Counter
+
+# Analysis profiles: the spaCy components each one leaves out, and the
+# features it produces. Keywords and topics only need the tagger and
+# lemmatizer; the parser is only used for noun_phrases and NER for entities.
+ANALYSIS_PROFILES = {
+    "full": {
+        "exclude": [],
+        "fields": ["keywords", "entities", "noun_phrases", "topic_candidates"],
+    },
+    "standard": {
+        "exclude": ["parser"],
+        "fields": ["keywords", "entities", "topic_candidates"],
+    },
+    "fast": {
+        "exclude": ["parser", "ner"],
+        "fields": ["keywords", "topic_candidates"],
+    },
+}
+
+
 class ContentAnalyzer:
-    def __init__(self):
-        # Initialize NLP tools
-        import nltk
+    def __init__(
+        self,
+        batch_size=64,
+        profile="full",
+        cache=None,
+        stream_threshold=100000,
+        chunk_size=20000,
+        summary_size=200,
+        early_stop=False,
+    ):
+        if profile not in ANALYSIS_PROFILES:
+            raise ValueError(
+                f"Unknown analysis profile {profile!r}, "
+                f"expected one of {', '.join(ANALYSIS_PROFILES)}"
+            )
+        self.profile = profile
+        self.fields = ANALYSIS_PROFILES[profile]["fields"]
+
+        # NLP tools are loaded on first use (or by load()), never downloaded
+        self._nlp = None
+        self._stopwords = None
+
+        # Documents per nlp.pipe batch in analyze_batch
+        self.batch_size = batch_size
+
+        # Optional AnalysisCache; cached results are returned read-only
+        self.cache = cache
 
-        nltk.download("punkt")
-        nltk.download("stopwords")
-        self.stopwords = set(nltk.corpus.stopwords.words("english"))
+        # Content longer than stream_threshold characters is analyzed in
+        # chunk_size pieces and summarized to the summary_size most frequent
+        # terms (see analyze_stream)
+        self.stream_threshold = stream_threshold
+        self.chunk_size = chunk_size
+        self.summary_size = summary_size
+        self.early_stop = early_stop
 
-        # Optional: Load spaCy for better entity recognition
-        import spacy
+    @property
+    def nlp(self):
+        """The spaCy pipeline, loaded on first use"""
+        if self._nlp is None:
+            self.load()
+        return self._nlp
 
-        self.nlp = spacy.load("en_core_web_sm")
+    @property
+    def stopwords(self):
+        """English stopwords from local NLTK data, else spaCy's list"""
+        if self._stopwords is None:
+            try:
+                import nltk
+
+                self._stopwords = set(nltk.corpus.stopwords.words("english"))
+            except (ImportError, LookupError):
+                from spacy.lang.en.stop_words import STOP_WORDS
+
+                self._stopwords = set(STOP_WORDS)
+        return self._stopwords
+
+    def load(self):
+        """Load the spaCy pipeline now instead of on the first analysis"""
+        if self._nlp is None:
+            # Optional: Load spaCy for better entity recognition
+            import spacy
+
+            self._nlp = spacy.load(
+                "en_core_web_sm", exclude=ANALYSIS_PROFILES[self.profile]["exclude"]
+            )
+        return self._nlp
 
     def analyze(self, content):
         """
@@ -22,9 +98,128 @@ class ContentAnalyzer:
         Returns:
             dict: Content features including keywords, entities, topics
         """
-        # Process text
-        doc = self.nlp(content)
+        if self.cache is None:
+            return self._analyze_many([content])[0]
+
+        key = self.cache.key(content)
+        features = self.cache.get(key)
+        if features is None:
+            features = self.cache.put(key, self._analyze_many([content])[0])
+        return features
+
+    def analyze_batch(self, contents, batch_size=None):
+        """
+        Analyze many documents at once with nlp.pipe.
+
+        Args:
+            contents (list): Webpage contents
+            batch_size (int): Documents per spaCy batch (defaults to self.batch_size)
+
+        Returns:
+            list: Content features for each document, in order
+        """
+        batch_size = batch_size or self.batch_size
+        if self.cache is None:
+            return self._analyze_many(contents, batch_size)
+
+        # Only run spaCy on the documents missing from the cache, once each
+        keys = [self.cache.key(content) for content in contents]
+        results = {}
+        misses = {}
+        for key, content in zip(keys, contents):
+            if key in results or key in misses:
+                continue
+            features = self.cache.get(key)
+            if features is None:
+                misses[key] = content
+            else:
+                results[key] = features
+
+        analyzed = self._analyze_many(list(misses.values()), batch_size)
+        for key, features in zip(misses, analyzed):
+            results[key] = self.cache.put(key, features)
+
+        return [results[key] for key in keys]
+
+    def analyze_stream(self, content, chunk_size=None, summary_size=None, early_stop=None):
+        """
+        Analyze long content chunk by chunk with bounded memory.
 
+        Chunks are cut at paragraph or sentence boundaries and run through
+        nlp.pipe; only running term counts are kept, pruned as they grow.
+        Keywords, topics, entities and noun phrases are summarized to their
+        summary_size most frequent distinct values. With early_stop, analysis
+        ends once the top topics have stayed (almost) the same for a few chunks.
+
+        Returns:
+            dict: Content features, as from analyze(), plus "streaming" details
+        """
+        chunk_size = chunk_size or self.chunk_size
+        summary_size = summary_size or self.summary_size
+        early_stop = self.early_stop if early_stop is None else early_stop
+
+        counts = {field: Counter() for field in self.fields}
+        word_count = 0
+        chars_processed = 0
+        chunks = 0
+        stable_chunks = 0
+        top_topics = None
+
+        for doc in self.nlp.pipe(
+            _split_chunks(content, chunk_size), batch_size=_STREAM_BATCH_SIZE
+        ):
+            features = self._extract_features(doc, doc.text)
+            for field, counter in counts.items():
+                counter.update(features[field])
+                if len(counter) > 2 * _PRUNE_FACTOR * summary_size:
+                    _prune(counter, _PRUNE_FACTOR * summary_size)
+
+            word_count += features["word_count"]
+            chars_processed += len(doc.text)
+            chunks += 1
+
+            if early_stop:
+                topics = {t for t, _ in counts["topic_candidates"].most_common(summary_size)}
+                stable = top_topics is not None and len(topics & top_topics) >= (
+                    _STABLE_TOPIC_OVERLAP * max(1, len(topics))
+                )
+                stable_chunks = stable_chunks + 1 if stable else 0
+                top_topics = topics
+                if stable_chunks >= _STABLE_CHUNKS_TO_STOP:
+                    break
+
+        stopped_early = chars_processed < len(content)
+        if stopped_early:
+            # Extrapolate the word count to the unread rest of the content
+            word_count = int(word_count * len(content) / chars_processed)
+
+        summary = {
+            field: [value for value, _ in counts[field].most_common(summary_size)]
+            if field in counts else []
+            for field in ("keywords", "entities", "noun_phrases", "topic_candidates")
+        }
+        return {
+            **summary,
+            "word_count": word_count,
+            "text_summary": content[:200] + "..." if len(content) > 200 else content,
+            "analysis_profile": self.profile,
+            "produced_fields": list(self.fields),
+            "streaming": {"chunks": chunks, "stopped_early": stopped_early},
+        }
+
+    def _analyze_many(self, contents, batch_size=None):
+        """Features of each content: short ones through nlp.pipe, long ones streamed"""
+        short = [content for content in contents if len(content) <= self.stream_threshold]
+        docs = iter(self.nlp.pipe(short, batch_size=batch_size or self.batch_size))
+        return [
+            self._extract_features(next(docs), content)
+            if len(content) <= self.stream_threshold
+            else self.analyze_stream(content)
+            for content in contents
+        ]
+
+    def _extract_features(self, doc, content):
+        """Content features of a processed spaCy doc"""
         # Extract keywords (excluding stopwords)
         keywords = [
             token.lemma_.lower()
@@ -33,10 +228,14 @@ class ContentAnalyzer:
         ]
 
         # Extract named entities
-        entities = [(ent.text, ent.label_) for ent in doc.ents]
+        entities = []
+        if "entities" in self.fields:
+            entities = [(ent.text, ent.label_) for ent in doc.ents]
 
         # Extract noun phrases (potential topics)
-        noun_phrases = [chunk.text for chunk in doc.noun_chunks]
+        noun_phrases = []
+        if "noun_phrases" in self.fields:
+            noun_phrases = [chunk.text for chunk in doc.noun_chunks]
 
         # Basic topic extraction (can be improved with more sophisticated methods)
         topic_candidates = [
@@ -52,4 +251,39 @@ class ContentAnalyzer:
             "topic_candidates": topic_candidates,
             "word_count": len(doc),
             "text_summary": content[:200] + "..." if len(content) > 200 else content,
+            # Fields left empty by the profile are not listed here
+            "analysis_profile": self.profile,
+            "produced_fields": list(self.fields),
         }
+
+
+# Streaming analysis: chunks per nlp.pipe batch, how many times summary_size
+# distinct terms a running count keeps, and for an early stop, the share of
+# top topics that must carry over from one chunk to the next, for how many chunks
+_STREAM_BATCH_SIZE = 4
+_PRUNE_FACTOR = 10
+_STABLE_TOPIC_OVERLAP = 0.9
+_STABLE_CHUNKS_TO_STOP = 3
+
+
+def _split_chunks(content, chunk_size):
+    """Split content into pieces of at most chunk_size characters at natural boundaries"""
+    start = 0
+    while start < len(content):
+        end = min(start + chunk_size, len(content))
+        if end < len(content):
+            # Prefer a paragraph, then a line, sentence or word boundary
+            for separator in ("\n\n", "\n", ". ", " "):
+                cut = content.rfind(separator, start + chunk_size // 2, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        yield content[start:end]
+        start = end
+
+
+def _prune(counter, size):
+    """Keep only the size most common entries of a Counter"""
+    kept = counter.most_common(size)
+    counter.clear()
+    counter.update(dict(kept))
@@ -0,0 +1,143 @@
+# differential_privacy.py
+# Laplace noise for numeric features, with per-session privacy budgets
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PrivacyBudgetExceeded(Exception):
+    """Raised when a release would take a session past its epsilon budget"""
+
+
+class PrivacyBudget:
+    """
+    Epsilon spent per session, under sequential composition: every noised
+    value released for a session adds its epsilon to the session's total.
+
+    Accounting is one dict update per session and release, however many
+    values the release noises. The ledger lives in this process only: each
+    process with its own PrivacyBudget counts separately, so one shared
+    ledger (as the API server keeps) is needed to bound a session overall.
+
+    At most max_sessions sessions are tracked, least recently charged
+    evicted first, and a session not charged for ttl seconds is forgotten.
+    A forgotten session starts over with its full budget, so ttl should
+    cover a session's lifetime.
+    """
+
+    def __init__(self, session_epsilon=None, max_sessions=100000, ttl=None):
+        self.session_epsilon = session_epsilon  # None means unlimited
+        self.max_sessions = max_sessions
+        self.ttl = ttl  # Seconds; None keeps sessions until evicted
+        self._spent = OrderedDict()  # session_id -> (spent, last charged at), oldest first
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def charge(self, session_ids, epsilon):
+        """
+        Charge epsilon to each session, or to none of them.
+
+        Args:
+            session_ids (list): Session of each release; repeats are charged
+                once per occurrence
+            epsilon (float): Privacy cost of one release
+
+        Raises:
+            PrivacyBudgetExceeded: If any session would go over its budget
+        """
+        costs = {}
+        for session_id in session_ids:
+            costs[session_id] = costs.get(session_id, 0.0) + epsilon
+
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if self.session_epsilon is not None:
+                for session_id, cost in costs.items():
+                    spent = self._spent.get(session_id, (0.0, None))[0]
+                    if spent + cost > self.session_epsilon:
+                        raise PrivacyBudgetExceeded(
+                            f"Session {session_id!r} has spent {spent:g} of its "
+                            f"{self.session_epsilon:g} epsilon budget, {cost:g} more requested"
+                        )
+            for session_id, cost in costs.items():
+                spent = self._spent.pop(session_id, (0.0, None))[0]
+                self._spent[session_id] = (spent + cost, now)
+
+            while len(self._spent) > self.max_sessions:
+                self._spent.popitem(last=False)
+                self.evictions += 1
+
+    def spent(self, session_id):
+        with self._lock:
+            self._expire(time.monotonic())
+            return self._spent.get(session_id, (0.0, None))[0]
+
+    def remaining(self, session_id):
+        """Epsilon the session can still spend, or None when unlimited"""
+        if self.session_epsilon is None:
+            return None
+        return max(0.0, self.session_epsilon - self.spent(session_id))
+
+    def reset(self, session_id=None):
+        """Forget what one session, or every session, has spent"""
+        with self._lock:
+            if session_id is None:
+                self._spent.clear()
+            else:
+                self._spent.pop(session_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._spent)
+
+    def _expire(self, now):
+        """Drop the sessions last charged more than ttl ago (oldest come first)"""
+        if self.ttl is None:
+            return
+        while self._spent:
+            session_id, (_, charged_at) = next(iter(self._spent.items()))
+            if now - charged_at < self.ttl:
+                break
+            del self._spent[session_id]
+
+
+class LaplaceMechanism:
+    """
+    Adds Laplace noise to whole arrays of values in one draw.
+
+    Each instance owns its numpy Generator, so worker processes or threads
+    with their own mechanism never share random state. With seed=None the
+    generator is seeded from the OS, independently in every instance.
+    """
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    def noise(self, values, epsilon, sensitivity=1.0):
+        """
+        Add noise calibrated to sensitivity / epsilon to every value.
+
+        Args:
+            values (array-like): Values of any shape, e.g. records x features
+            epsilon (float): Privacy parameter of each value
+            sensitivity (float or array-like): Sensitivity, broadcast against
+                values (e.g. one per feature column)
+
+        Returns:
+            numpy.ndarray: Noised values as floats
+        """
+        if epsilon <= 0:
+            raise ValueError(f"epsilon must be positive, got {epsilon}")
+
+        values = np.asarray(values, dtype=float)
+        scale = np.broadcast_to(np.asarray(sensitivity, dtype=float) / epsilon, values.shape)
+        return values + self.rng.laplace(0.0, scale)
+
+    def noise_counts(self, values, epsilon, sensitivity=1.0):
+        """Noised counts, truncated to integers and clipped at zero"""
+        noised = self.noise(values, epsilon, sensitivity)
+        return np.maximum(0, np.trunc(noised)).astype(np.int64)
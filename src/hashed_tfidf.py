@@ -0,0 +1,130 @@
+# hashed_tfidf.py
+# TF-IDF over hashed term columns, with IDF weights kept from running document frequencies
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from sklearn.utils import murmurhash3_32
+
+
+class HashedTfidf:
+    """
+    Feature hashing counterpart of TfidfVectorizer for a growing inventory.
+
+    Terms are hashed into a fixed number of columns, so a document is
+    vectorized on its own, without a vocabulary, and adding documents never
+    changes the columns of earlier ones. Documents are stored as raw term
+    counts; IDF weights come from document frequencies that are updated as
+    documents are added and removed, and are applied when scoring.
+
+    Tokenization, the smoothed IDF formula and l2 normalization match
+    TfidfVectorizer's defaults, so apart from hash collisions the scores are
+    those of a TfidfVectorizer fitted on the current documents.
+    """
+
+    def __init__(self, n_features=2 ** 18):
+        if n_features < 1:
+            raise ValueError(f"n_features must be positive, got {n_features}")
+
+        self.n_features = n_features
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features, alternate_sign=False, norm=None
+        )
+        self._analyzer = self.vectorizer.build_analyzer()
+        self.document_frequencies = np.zeros(n_features, dtype=np.int64)
+        self.n_documents = 0
+        self._idf = None  # Cached until the document frequencies change
+        self._known_idf = None
+
+    def transform(self, texts):
+        """Term count matrix of texts, one CSR row per text"""
+        return self.vectorizer.transform(texts)
+
+    def add_documents(self, counts):
+        """Count the documents of a term count matrix into the document frequencies"""
+        # Columns are unique within a row, so each occurrence is one document
+        self.document_frequencies += np.bincount(counts.indices, minlength=self.n_features)
+        self.n_documents += counts.shape[0]
+        self._idf = self._known_idf = None
+
+    def remove_documents(self, counts):
+        """Undo add_documents for some of the added documents"""
+        self.document_frequencies -= np.bincount(counts.indices, minlength=self.n_features)
+        self.n_documents -= counts.shape[0]
+        self._idf = self._known_idf = None
+
+    @property
+    def idf(self):
+        """Smoothed IDF weight of every column, as TfidfVectorizer computes it"""
+        if self._idf is None:
+            self._idf = (
+                np.log((1 + self.n_documents) / (1 + self.document_frequencies)) + 1
+            )
+        return self._idf
+
+    def query_vectors(self, texts):
+        """
+        Vectors of texts to score against stored counts with similarity().
+
+        Each row is the l2-normalized TF-IDF vector of the text, weighted by
+        IDF once more for the stored counts, which carry no IDF weight.
+        Terms in no document are left out, like terms outside a
+        TfidfVectorizer's vocabulary.
+        """
+        idf = self.idf
+        if self._known_idf is None:
+            self._known_idf = np.where(self.document_frequencies > 0, idf, 0)
+        weights = normalize(self.transform(texts).multiply(self._known_idf).tocsr())
+        return weights.multiply(idf).tocsr()
+
+    def norms(self, counts):
+        """l2 norm of the TF-IDF vector of each row of a term count matrix"""
+        return np.sqrt(counts.power(2).dot(self.idf ** 2))
+
+    def similarity(self, query_vectors, counts, norms):
+        """
+        Cosine similarities of TF-IDF vectors, queries x documents.
+
+        Args:
+            query_vectors (scipy.sparse.csr_matrix): From query_vectors()
+            counts (scipy.sparse.csr_matrix): Term counts of the documents
+            norms (np.ndarray): norms() of the documents
+
+        Returns:
+            scipy.sparse.csr_matrix: Similarities
+        """
+        # Empty documents have a zero norm and a zero dot product
+        scale = 1 / np.where(norms > 0, norms, 1)
+        return query_vectors.dot(counts.T).multiply(scale).tocsr()
+
+    def top_terms(self, texts, k):
+        """
+        The k terms of each text with the highest TF-IDF weight, under the
+        current document frequencies.
+
+        Ties keep the order of first appearance in the text, as for a fresh
+        TfidfVectorizer fit.
+
+        Returns:
+            list: One list of at most k terms per text
+        """
+        idf = self.idf
+        results = []
+        for text in texts:
+            counts = {}
+            for token in self._analyzer(text):
+                counts[token] = counts.get(token, 0) + 1
+            terms = list(counts)
+            weights = np.fromiter(counts.values(), dtype=float, count=len(terms))
+            weights *= idf[[self._column(term) for term in terms]]
+            # Stable, so ties stay in order of first appearance
+            order = np.argsort(-weights, kind="stable")[:k]
+            results.append([terms[i] for i in order])
+        return results
+
+    def _column(self, term):
+        """Column a term hashes to, exactly as HashingVectorizer assigns it"""
+        h = murmurhash3_32(term, positive=False)
+        if h == -2 ** 31:
+            return (2 ** 31 - 1 - (self.n_features - 1)) % self.n_features
+        return abs(h) % self.n_features
@@ -0,0 +1,322 @@
+# index_snapshot.py
+# Saves a built MatchingEngine index to disk and loads it back memory-mapped
+#
+# Build a snapshot offline from the project root:
+#   python -m src.index_snapshot build --out index/ [--ads ads.json]
+#
+# Or publish a new version into a versioned index directory, which running
+# engines pick up without a restart:
+#   python -m src.index_snapshot publish --root indexes/ [--ads ads.json]
+#
+# Add --hash-features 262144 to either for a feature hashing index (see
+# src/hashed_tfidf.py), or --embedding-dim 128 for dense LSA embeddings.
+
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import scipy.sparse as sp
+
+# Bumped whenever the layout below changes; version 2 added hashed indexes,
+# version 3 dense embeddings
+FORMAT_VERSION = 3
+_READABLE_FORMATS = (1, 2, 3)
+
+# Sparse matrices stored as <name>.data.npy, <name>.indices.npy, <name>.indptr.npy
+_MATRICES = {
+    "ad_vectors": sp.csr_matrix,
+    "keyword_matrix": sp.csr_matrix,
+    "category_matrix": sp.csr_matrix,
+    "ad_vector_postings": sp.csc_matrix,
+    "keyword_postings": sp.csc_matrix,
+    "category_postings": sp.csc_matrix,
+}
+
+# TfidfVectorizer settings carried over; everything else is left at its default
+_VECTORIZER_PARAMS = ("lowercase", "max_features", "norm", "use_idf", "smooth_idf", "sublinear_tf")
+
+# In a versioned index directory, names the snapshot subdirectory in use
+CURRENT = "CURRENT"
+
+
+def save_index(engine, path):
+    """
+    Write the engine's index to a snapshot directory.
+
+    Args:
+        engine (MatchingEngine): Engine with a built inventory
+        path (str): Snapshot directory, created if missing
+    """
+    if not engine.inventory_size:
+        raise ValueError("Cannot snapshot an empty inventory")
+
+    # Snapshots hold no deleted ads
+    engine.compact()
+    engine.merge_postings()
+
+    os.makedirs(path, exist_ok=True)
+    matrices = dict(zip(_MATRICES, (
+        engine.ad_vectors,
+        engine.keyword_matrix,
+        engine.category_matrix,
+    ) + engine._postings))
+
+    shapes = {}
+    for name, matrix in matrices.items():
+        for part in ("data", "indices", "indptr"):
+            np.save(os.path.join(path, f"{name}.{part}.npy"), getattr(matrix, part))
+        shapes[name] = list(matrix.shape)
+
+    if engine.hashing is not None:
+        # Hashed vectors are raw counts; IDF is derived from these at query time
+        np.save(
+            os.path.join(path, "document_frequencies.npy"), engine.hashing.document_frequencies
+        )
+        vectorizer = {
+            "hash_features": engine.hashing.n_features,
+            "n_documents": engine.hashing.n_documents,
+        }
+    else:
+        np.save(os.path.join(path, "idf.npy"), engine.vectorizer.idf_)
+        vectorizer = {
+            "vectorizer_params": {
+                key: engine.vectorizer.get_params()[key] for key in _VECTORIZER_PARAMS
+            },
+            # Terms in column order
+            "vocabulary": list(engine.feature_names),
+        }
+        if engine.ad_embeddings is not None:
+            # Saved float32, so workers map them without converting
+            np.save(os.path.join(path, "projection.npy"), engine.projection)
+            np.save(os.path.join(path, "ad_embeddings.npy"), engine.ad_embeddings)
+            vectorizer["embedding_dim"] = engine.embedding_dim
+
+    with open(os.path.join(path, "inventory.json"), "w") as f:
+        json.dump(engine.ad_inventory, f)
+
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump(
+            {
+                "format_version": FORMAT_VERSION,
+                "index_version": engine.index_version,
+                **vectorizer,
+                "keyword_vocabulary": list(engine.keyword_vocabulary),
+                "category_vocabulary": list(engine.category_vocabulary),
+                "shapes": shapes,
+            },
+            f,
+        )
+
+
+def load_index(path, mmap=True, **engine_options):
+    """
+    Load a snapshot written by save_index into a new MatchingEngine.
+
+    With mmap the arrays are memory-mapped read-only, so workers loading the
+    same snapshot share its pages instead of each holding a private copy.
+
+    Args:
+        path (str): Snapshot directory, or a versioned index directory
+            (see publish_index) to load its current version
+        mmap (bool): Memory-map the arrays instead of reading them
+        **engine_options: Passed on to MatchingEngine
+
+    Returns:
+        MatchingEngine: Engine ready to match content
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from src.matching_engine import MatchingEngine
+
+    if is_versioned(path):
+        _, path = current_version(path)
+
+    with open(os.path.join(path, "index.json")) as f:
+        index = json.load(f)
+    if index["format_version"] not in _READABLE_FORMATS:
+        raise ValueError(
+            f"Unsupported index format {index['format_version']}, expected one of "
+            f"{_READABLE_FORMATS}"
+        )
+
+    mmap_mode = "r" if mmap else None
+    matrices = {}
+    for name, matrix_type in _MATRICES.items():
+        parts = [
+            np.load(os.path.join(path, f"{name}.{part}.npy"), mmap_mode=mmap_mode)
+            for part in ("data", "indices", "indptr")
+        ]
+        matrices[name] = matrix_type(
+            tuple(parts), shape=tuple(index["shapes"][name]), copy=False
+        )
+
+    if "hash_features" in index:
+        engine = MatchingEngine(hash_features=index["hash_features"], **engine_options)
+        # Read, not mapped: adding or removing ads updates them
+        engine.hashing.document_frequencies = np.load(
+            os.path.join(path, "document_frequencies.npy")
+        )
+        engine.hashing.n_documents = index["n_documents"]
+    else:
+        engine = MatchingEngine(embedding_dim=index.get("embedding_dim"), **engine_options)
+
+        engine.vectorizer = TfidfVectorizer(**index["vectorizer_params"])
+        engine.vectorizer.vocabulary_ = {
+            term: i for i, term in enumerate(index["vocabulary"])
+        }
+        engine.vectorizer.idf_ = np.load(os.path.join(path, "idf.npy"), mmap_mode=mmap_mode)
+        engine.feature_names = np.asarray(index["vocabulary"], dtype=object)
+        if engine.embedding_dim is not None:
+            engine.projection = np.load(os.path.join(path, "projection.npy"), mmap_mode=mmap_mode)
+            engine.ad_embeddings = np.load(
+                os.path.join(path, "ad_embeddings.npy"), mmap_mode=mmap_mode
+            )
+
+    engine.keyword_vocabulary = {term: i for i, term in enumerate(index["keyword_vocabulary"])}
+    engine.category_vocabulary = {
+        term: i for i, term in enumerate(index["category_vocabulary"])
+    }
+
+    with open(os.path.join(path, "inventory.json")) as f:
+        engine.ad_inventory = json.load(f)
+    engine._index_ids()
+
+    engine.ad_vectors = matrices["ad_vectors"]
+    engine.keyword_matrix = matrices["keyword_matrix"]
+    engine.category_matrix = matrices["category_matrix"]
+    engine._postings = (
+        matrices["ad_vector_postings"],
+        matrices["keyword_postings"],
+        matrices["category_postings"],
+    )
+    engine._fitted_size = len(engine.ad_inventory)
+    engine.index_version = index.get("index_version")
+    return engine
+
+
+def publish_index(engine, root, keep=3):
+    """
+    Save engine as the next version of a versioned index directory and make
+    it the current one.
+
+    The snapshot is written to a temporary directory and renamed into place,
+    then the CURRENT pointer is replaced atomically, so readers only ever
+    see complete versions. Only one publisher per root at a time.
+
+    Args:
+        engine (MatchingEngine): Engine with a built inventory
+        root (str): Versioned index directory, created if missing
+        keep (int): Versions kept on disk, including the new one; engines
+            still using a removed version keep their mapped pages
+
+    Returns:
+        int: The published version
+    """
+    os.makedirs(root, exist_ok=True)
+    versions = _versions(root)
+    version = max(versions, default=0) + 1
+    name = _version_name(version)
+
+    engine.index_version = version
+    staging = os.path.join(root, f".{name}.tmp")
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    save_index(engine, staging)
+    os.rename(staging, os.path.join(root, name))
+
+    pointer = os.path.join(root, f".{CURRENT}.tmp")
+    with open(pointer, "w") as f:
+        f.write(name + "\n")
+    os.replace(pointer, os.path.join(root, CURRENT))
+
+    for old in sorted(versions)[:max(0, len(versions) + 1 - keep)]:
+        shutil.rmtree(os.path.join(root, _version_name(old)), ignore_errors=True)
+    return version
+
+
+def is_versioned(path):
+    """Whether path is a versioned index directory written by publish_index"""
+    return os.path.isfile(os.path.join(path, CURRENT))
+
+
+def current_version(root):
+    """
+    The current version of a versioned index directory.
+
+    Returns:
+        tuple: (version, snapshot directory)
+    """
+    with open(os.path.join(root, CURRENT)) as f:
+        name = f.read().strip()
+    return int(name[1:]), os.path.join(root, name)
+
+
+def _version_name(version):
+    return f"v{version:06d}"
+
+
+def _versions(root):
+    return [
+        int(name[1:]) for name in os.listdir(root)
+        if name.startswith("v") and name[1:].isdigit()
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build an ad index snapshot")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="classify and index ads into a snapshot")
+    build.add_argument("--out", required=True, help="snapshot directory")
+    build.add_argument(
+        "--ads",
+        help="JSON file with a list of {\"content\", \"metadata\"} ads "
+             "(defaults to the sample ads)",
+    )
+    publish = subparsers.add_parser(
+        "publish", help="build a new version in a versioned index directory and make it current"
+    )
+    publish.add_argument("--root", required=True, help="versioned index directory")
+    publish.add_argument(
+        "--ads",
+        help="JSON file with a list of {\"content\", \"metadata\"} ads "
+             "(defaults to the sample ads)",
+    )
+    publish.add_argument("--keep", type=int, default=3, help="versions kept on disk")
+    for subparser in (build, publish):
+        subparser.add_argument(
+            "--hash-features", type=int,
+            help="index with this many hashed term columns instead of a fitted vocabulary",
+        )
+        subparser.add_argument(
+            "--embedding-dim", type=int,
+            help="score with dense LSA embeddings of this many dimensions",
+        )
+    args = parser.parse_args(argv)
+
+    from src.matching_engine import MatchingEngine
+    from data.sample_ads import get_sample_ads
+
+    if args.ads:
+        with open(args.ads) as f:
+            ads = json.load(f)
+    else:
+        ads = get_sample_ads()
+
+    engine = MatchingEngine(hash_features=args.hash_features, embedding_dim=args.embedding_dim)
+    engine.add_ads(ads)
+    if args.command == "publish":
+        version = publish_index(engine, args.root, keep=args.keep)
+        print(
+            f"Published version {version} with {len(engine.ad_inventory)} ads to {args.root}",
+            file=sys.stderr,
+        )
+    else:
+        save_index(engine, args.out)
+        print(f"Wrote {len(engine.ad_inventory)} ads to {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,336 @@
 # src/main.py
 # Main entry point for the application
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from src.content_analyzer import ContentAnalyzer
+from src.analysis_cache import AnalysisCache
 from src.ad_classifier import AdClassifier
 from src.matching_engine import MatchingEngine
+from src.sharded_matching import ShardedMatchingEngine
 from src.privacy_layer import PrivacyLayer
+from src.index_snapshot import current_version, is_versioned, load_index, publish_index
 from data.sample_ads import get_sample_ads
 
 class PrivacyAdEngine:
-    def __init__(self):
-        self.content_analyzer = ContentAnalyzer()
+    def __init__(
+        self,
+        index_path=None,
+        analysis_profile="full",
+        analysis_cache=None,
+        session_epsilon=None,
+        index_poll_interval=1.0,
+        match_shards=None,
+        hash_features=None,
+        embedding_dim=None,
+    ):
+        """
+        Args:
+            index_path (str): Optional index snapshot (see src/index_snapshot.py)
+                to load instead of building the sample ad inventory. For a
+                versioned index directory, newly published versions are
+                loaded in the background and swapped in
+            analysis_profile (str): ContentAnalyzer profile, "full", "standard" or "fast"
+            analysis_cache (AnalysisCache): Cache of content analysis results;
+                defaults to an AnalysisCache with its default limits, and
+                False analyzes every page afresh
+            session_epsilon (float): Differential privacy budget of each
+                session, tracked by this engine only; None leaves sessions
+                unlimited
+            index_poll_interval (float): Seconds between checks for a newly
+                published index version
+            match_shards (int): Score the ads on this many shard processes
+                (see src/sharded_matching.py); None scores them in-process
+            hash_features (int): Build ad indexes with this many hashed term
+                columns (see src/hashed_tfidf.py) instead of a fitted
+                vocabulary; loaded snapshots keep the mode they were built with
+            embedding_dim (int): Score content similarity with dense LSA
+                embeddings of this many dimensions in indexes built here
+        """
+        # Repeated pages skip spaCy; privacy noise is still added per request
+        if analysis_cache is None:
+            analysis_cache = AnalysisCache()
+        self.analysis_cache = analysis_cache or None
+        self.content_analyzer = ContentAnalyzer(
+            profile=analysis_profile, cache=self.analysis_cache
+        )
         self.ad_classifier = AdClassifier()
-        self.matching_engine = MatchingEngine()
-        self.privacy_layer = PrivacyLayer()
+        self.privacy_layer = PrivacyLayer(session_epsilon=session_epsilon)
+
+        # The ad index is built (or loaded) on first use, or by warmup().
+        # Each version is an engine that is never modified once it serves
+        # requests; a new version is built on a background thread and
+        # published by swapping _matching_engine, so requests already
+        # running finish on the version they started with
+        self.index_path = index_path
+        self.index_poll_interval = index_poll_interval
+        self._matching_engine = None
+        self._index_lock = threading.Lock()
+        self._index_builder = None  # Single-thread executor, created on first rebuild
+        self._index_update = None  # Future of the rebuild or load in progress
+        self._index_checked_at = 0.0
+        self.match_shards = match_shards
+        self.hash_features = hash_features
+        self.embedding_dim = embedding_dim
+
+        # Stage timings and counts of the last process_content/process_batch
+        # call (see _trace), for whoever exports metrics
+        self.last_trace = None
+
+    @property
+    def matching_engine(self):
+        """The current version of the ad index, built on first use"""
+        engine = self._matching_engine
+        if engine is None:
+            with self._index_lock:
+                if self._matching_engine is None:
+                    self._matching_engine = self._initial_index()
+                engine = self._matching_engine
+        elif self.index_path:
+            self._poll_published_index(engine)
+        return engine
+
+    @property
+    def index_version(self):
+        return self.matching_engine.index_version
+
+    def rebuild_index(self, ads):
+        """
+        Build a new index version from ads on a background thread and swap it
+        in when it is ready. Requests keep using the current version meanwhile.
+
+        With a versioned index_path the new version is also published there,
+        so other processes serving that directory pick it up too.
+
+        Args:
+            ads (list): Dicts with "content" and optional "metadata" keys
+
+        Returns:
+            concurrent.futures.Future: Resolves to the new version number
+        """
+        with self._index_lock:
+            if self._index_builder is None:
+                self._index_builder = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="index-builder"
+                )
+            self._index_update = self._index_builder.submit(self._build_index, list(ads))
+            return self._index_update
+
+    def _build_index(self, ads):
+        engine = MatchingEngine(
+            hash_features=self.hash_features, embedding_dim=self.embedding_dim
+        )
+        engine.add_ads(ads)
+        # Flushed now, so serving the engine only fills derived caches
+        engine._flush_pending_vectors()
+
+        if self.index_path and is_versioned(self.index_path):
+            publish_index(engine, self.index_path)
+        else:
+            engine.index_version = (self.matching_engine.index_version or 0) + 1
+        self._swap_index(self._serving(engine))
+        return engine.index_version
+
+    def _initial_index(self):
+        if self.index_path:
+            # Memory-mapped, so workers share the snapshot's pages
+            engine = load_index(self.index_path)
+        else:
+            engine = MatchingEngine(
+                hash_features=self.hash_features, embedding_dim=self.embedding_dim
+            )
+
+            # Load sample ads
+            engine.add_ads(get_sample_ads())
+            engine._flush_pending_vectors()
+        if engine.index_version is None:
+            engine.index_version = 1
+        return self._serving(engine)
+
+    def _poll_published_index(self, engine):
+        """Start loading a newer published version, at most once per poll interval"""
+        now = time.monotonic()
+        if now - self._index_checked_at < self.index_poll_interval:
+            return
+        self._index_checked_at = now
 
-        # Load sample ads
-        self._load_sample_ads()
+        if not is_versioned(self.index_path):
+            return
+        if self._index_update is not None and not self._index_update.done():
+            return
+        version, path = current_version(self.index_path)
+        if version > (engine.index_version or 0):
+            with self._index_lock:
+                if self._index_builder is None:
+                    self._index_builder = ThreadPoolExecutor(
+                        max_workers=1, thread_name_prefix="index-builder"
+                    )
+                self._index_update = self._index_builder.submit(self._load_published, path)
 
-    def _load_sample_ads(self):
-        # More diverse sample ads for a better demo
-        sample_ads = get_sample_ads()
+    def _load_published(self, path):
+        engine = load_index(path)
+        self._swap_index(self._serving(engine))
+        return engine.index_version
 
-        for ad in sample_ads:
-            self.matching_engine.add_ad(ad["content"], ad["metadata"])
+    def _serving(self, engine):
+        """The engine requests are matched with: engine itself, or its shards"""
+        if self.match_shards:
+            # A replaced version's shards stop once its last request is done
+            # and it is garbage collected
+            return ShardedMatchingEngine(engine, self.match_shards)
+        return engine
 
-    def process_content(self, content):
+    def _swap_index(self, engine):
+        """Publish engine as the current version, unless a newer one already is"""
+        with self._index_lock:
+            current = self._matching_engine
+            if current is None or (engine.index_version or 0) > (current.index_version or 0):
+                self._matching_engine = engine
+
+    def warmup(self):
+        """
+        Load the spaCy model and build the ad index now, so the first request
+        doesn't pay for them. Nothing here needs network access.
+        """
+        self.content_analyzer.load()
+        self.matching_engine
+        self.process_content("Warm up the content analysis and matching path.")
+
+    def process_content(self, content, top_k=10, session_id=None):
         """
         Process webpage content and find matching ads.
 
         Args:
             content (str): Webpage content
+            top_k (int): Number of ads to recommend
+            session_id: Session whose privacy budget pays for the request
 
         Returns:
             dict: Matching ads and metrics
         """
+        # One index version for the whole request, even if a new one is
+        # swapped in meanwhile
+        matching_engine = self.matching_engine
+
+        cache_lookups = self._cache_lookups()
+        started = time.perf_counter()
+
         # Extract content features
         content_features = self.content_analyzer.analyze(content)
+        analyzed = time.perf_counter()
 
         # Apply privacy measures
-        private_features = self.privacy_layer.apply_privacy_measures(content_features)
+        private_features = self.privacy_layer.apply_privacy_measures(
+            content_features, session_id=session_id
+        )
+        privatized = time.perf_counter()
 
         # Find matching ads
-        matches = self.matching_engine.match_content(private_features)
+        matches = matching_engine.match_content(private_features, top_k=top_k)
+        matched = time.perf_counter()
+
+        response = self._build_response(private_features, matches, matching_engine.index_version)
+        self.last_trace = self._trace(
+            matching_engine,
+            (started, analyzed, privatized, matched, time.perf_counter()),
+            1,
+            cache_lookups,
+        )
+        return response
+
+    def process_batch(self, contents, top_k=10, batch_size=None, session_ids=None):
+        """
+        Process many webpages at once and find matching ads for each.
+
+        Content analysis runs through nlp.pipe and all documents are scored
+        against the inventory together.
+
+        Args:
+            contents (list): Webpage contents
+            top_k (int): Number of ads to recommend per page
+            batch_size (int): Documents per spaCy batch
+            session_ids (list): Session of each page, for privacy budgets
+
+        Returns:
+            list: One process_content-style response per page, in order
+        """
+        # One index version for the whole batch
+        matching_engine = self.matching_engine
+
+        cache_lookups = self._cache_lookups()
+        started = time.perf_counter()
+
+        # Extract content features
+        features_list = self.content_analyzer.analyze_batch(contents, batch_size=batch_size)
+        analyzed = time.perf_counter()
+
+        # Apply privacy measures
+        private_features_list = self.privacy_layer.apply_privacy_measures_batch(
+            features_list, session_ids=session_ids
+        )
+        privatized = time.perf_counter()
+
+        # Find matching ads
+        matches_list = matching_engine.match_batch(private_features_list, top_k=top_k)
+        matched = time.perf_counter()
+
+        responses = [
+            self._build_response(private_features, matches, matching_engine.index_version)
+            for private_features, matches in zip(private_features_list, matches_list)
+        ]
+        self.last_trace = self._trace(
+            matching_engine,
+            (started, analyzed, privatized, matched, time.perf_counter()),
+            len(contents),
+            cache_lookups,
+        )
+        return responses
+
+    def _trace(self, matching_engine, checkpoints, documents, cache_lookups):
+        """
+        Summary of one processing call.
+
+        Args:
+            matching_engine (MatchingEngine): Index version the call used
+            checkpoints (tuple): perf_counter() at the start and after the
+                analyze, privacy, match and response stages
+            documents (int): Pages processed
+            cache_lookups (tuple): Analysis cache (hits, misses) before the call
+
+        Returns:
+            dict: Seconds per stage, pages, candidates scored per page,
+                index version and size, and analysis cache hits/misses of
+                the call
+        """
+        started, analyzed, privatized, matched, finished = checkpoints
+        return {
+            "stages": {
+                "analyze": analyzed - started,
+                "privacy": privatized - analyzed,
+                "match": matched - privatized,
+                "response": finished - matched,
+            },
+            "documents": documents,
+            "candidates": matching_engine.last_candidate_counts,
+            "index_version": matching_engine.index_version,
+            "inventory_size": matching_engine.inventory_size,
+            "cache_hits": self._cache_lookups()[0] - cache_lookups[0],
+            "cache_misses": self._cache_lookups()[1] - cache_lookups[1],
+        }
+
+    def _cache_lookups(self):
+        """Analysis cache (hits, misses) so far; none without a cache"""
+        if self.analysis_cache is None:
+            return 0, 0
+        return self.analysis_cache.hits, self.analysis_cache.misses
 
-        # Prepare the response
+    def _build_response(self, private_features, matches, index_version):
+        """Prepare the response for one page"""
         response = {
             "recommended_ads": matches,
+            "index_version": index_version,
             "privacy_metrics": {
                 "anonymization_applied": self.privacy_layer.anonymization_enabled,
                 "differential_privacy_applied": self.privacy_layer.differential_privacy_enabled,
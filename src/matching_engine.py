@@ -1,116 +1,878 @@
 # matching_engine.py
 # A matching engine that connects content to relevant ads
 
+import numbers
+
 import numpy as np
+import scipy.sparse as sp
+from sklearn.decomposition import TruncatedSVD
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+from src.ad_classifier import AdClassifier, _content_id
+from src.category_matcher import CategoryMatcher
+from src.hashed_tfidf import HashedTfidf
 
 class MatchingEngine:
-    def __init__(self):
+    def __init__(
+        self,
+        refit_ratio=2.0,
+        candidate_retrieval=True,
+        max_candidate_share=1.0,
+        approximate_index=None,
+        approximate_min_inventory=10000,
+        compact_ratio=0.25,
+        hash_features=None,
+        embedding_dim=None,
+        embedding_sample_size=100000,
+    ):
         # Initialize with empty ad inventory
         self.ad_inventory = []
         self.vectorizer = TfidfVectorizer(max_features=1000)
         self.ad_vectors = None
         self.feature_names = None
 
-    def add_ad(self, ad_content, ad_metadata=None):
-        """Add an ad to the inventory with its classification"""
-        from src.ad_classifier import AdClassifier
-        classifier = AdClassifier()
+        # Feature hashing mode: with hash_features columns instead of a
+        # fitted vocabulary, new ads are vectorized on their own and appended
+        # without ever refitting. Ad vectors hold raw term counts; the IDF
+        # weights come from running document frequencies and are applied
+        # when scoring, with each ad's TF-IDF norm cached in _row_norms
+        self.hashing = None
+        self._row_norms = None
+        if hash_features is not None:
+            if approximate_index is not None:
+                raise ValueError("The approximate index needs TF-IDF vocabulary vectors, not hash_features")
+            self.hashing = HashedTfidf(hash_features)
+            self.vectorizer = None
+            self.ad_vectors = sp.csr_matrix((0, hash_features))
+        self.classifier = AdClassifier(hashing=self.hashing)
+
+        # Dense (LSA) mode: with embedding_dim, content similarity is the dot
+        # product of l2-normalized float32 embeddings, projected from the
+        # TF-IDF vectors by a truncated SVD (projection, embedding_dim x
+        # terms) fitted on up to embedding_sample_size ads. New ads are
+        # projected with the current fit; a vocabulary refit refits it too.
+        # Every ad is scored, with one dense product per request or batch
+        self.embedding_dim = embedding_dim
+        self.embedding_sample_size = embedding_sample_size
+        self.projection = None
+        self.ad_embeddings = None
+        self._embedding_rows = _GrowingArray()
+        if embedding_dim is not None:
+            if embedding_dim < 1:
+                raise ValueError(f"embedding_dim must be positive, got {embedding_dim}")
+            if hash_features is not None or approximate_index is not None:
+                raise ValueError(
+                    "embedding_dim can't be combined with hash_features or an approximate index"
+                )
+
+        # Incremental ingest: new ads are transformed with the already fitted
+        # vocabulary and only trigger a full refit once the inventory has grown
+        # by refit_ratio since the last fit, so ingest cost stays linear
+        self.refit_ratio = refit_ratio
+        self._fitted_size = 0
+        self._pending_vectors = []
+        self._vector_rows = _GrowingRows()
+
+        # Sparse ad x keyword and ad x category indicator matrices, so keyword
+        # overlap and category relevance are scored for all ads at once
+        self.keyword_vocabulary = {}
+        self.category_vocabulary = {}
+        self.keyword_matrix = None
+        self.category_matrix = None
+        self._pending_keyword_rows = []
+        self._pending_category_rows = []
+        self._keyword_rows = _GrowingRows()
+        self._category_rows = _GrowingRows()
+
+        # Finds the ad categories contained in content topics; mirrors
+        # category_vocabulary, so pattern ids are category columns
+        self.category_matcher = CategoryMatcher()
+
+        # Inverted index (term -> ads) over the three matrices above, used to
+        # score only the ads that share something with the content. Queries
+        # whose postings hold more than max_candidate_share entries per ad
+        # would make most ads candidates anyway, and score every ad instead.
+        # _postings covers the first _postings[0].shape[0] rows; ads appended
+        # since then are in the small _tail_postings, rebuilt after each
+        # append, until the tail outgrows sqrt(ads) and is merged in
+        self.candidate_retrieval = candidate_retrieval
+        self.max_candidate_share = max_candidate_share
+        self._postings = None
+        self._tail_postings = None
+
+        # Optional approximate nearest-neighbour index (e.g. ClusteredIndex)
+        # used instead of exact retrieval once the inventory is large enough
+        self.approximate_index = approximate_index
+        self.approximate_min_inventory = approximate_min_inventory
+        self._approximate_built = False
+
+        # Ads scored for each document of the last match call, for metrics
+        self.last_candidate_counts = []
+
+        # Version of the index this engine holds, set when it is published
+        # or swapped in (see PrivacyAdEngine.rebuild_index)
+        self.index_version = None
+
+        # Ad ID -> inventory row, for lookups, updates and deletes. A deleted
+        # ad leaves a tombstone: its inventory entry becomes None and its row
+        # is skipped when scoring, until the rows are compacted away once
+        # more than compact_ratio of them are tombstones
+        self._rows = {}
+        self._deleted = set()
+        self._dead_rows = None  # Sorted array of _deleted, built on demand
+        self.compact_ratio = compact_ratio
+
+    def add_ad(self, ad_content, ad_metadata=None, ad_id=None):
+        """
+        Add an ad to the inventory with its classification.
+
+        Returns:
+            int: The ad's ID; an ad already in the inventory is not added again
+
+        Raises:
+            ValueError: If ad_id is not an integer
+        """
+        ad_id = _content_id(ad_content) if ad_id is None else _checked_id(ad_id)
+        self.add_ads([{"content": ad_content, "metadata": ad_metadata, "ad_id": ad_id}])
+        return ad_id
+
+    def add_ads(self, ads):
+        """
+        Add a batch of ads to the inventory, vectorizing them in one pass.
+
+        Ads are identified by their "ad_id", or by a hash of their content
+        when they have none, so identical creatives are stored once. Ads
+        whose ID is already in the inventory (or earlier in the batch) are
+        skipped; use update_ad to replace one. Only IDs are compared: the
+        same content under two caller-assigned IDs is stored under both.
+
+        Args:
+            ads (iterable): Dicts with "content" and optional "metadata" and
+                "ad_id" keys, as returned by get_sample_ads()
+
+        Returns:
+            int: Number of ads added
+
+        Raises:
+            ValueError: If an ad's "ad_id" is not an integer; nothing is added
+        """
+        unique_ads = []
+        batch_ids = set()
+        for ad in ads:
+            ad_id = ad.get("ad_id")
+            if ad_id is None:
+                ad_id = _content_id(ad["content"])
+            else:
+                ad_id = _checked_id(ad_id)
+            if ad_id in self._rows or ad_id in batch_ids:
+                continue
+            batch_ids.add(ad_id)
+            unique_ads.append({**ad, "ad_id": ad_id})
+
+        if self.hashing is not None and unique_ads:
+            # Document frequencies first, so the keywords are weighted with
+            # this batch counted
+            new_vectors = self.hashing.transform([ad["content"] for ad in unique_ads])
+            self.hashing.add_documents(new_vectors)
+            self._row_norms = None
+        elif unique_ads:
+            self._count_inventory()
+
+        # Keywords are weighted against the whole inventory, this batch included
+        classifications = self.classifier.classify_ads(unique_ads)
+        ad_texts = []
+        for ad, ad_data in zip(unique_ads, classifications):
+            self._rows[ad_data["ad_id"]] = len(self.ad_inventory)
+            self.ad_inventory.append(
+                self._inventory_entry(ad["content"], ad.get("metadata"), ad_data)
+            )
+            ad_texts.append(ad["content"])
+
+        if ad_texts:
+            if self.hashing is not None:
+                # Stacked onto ad_vectors right before the next match
+                self._pending_vectors.append(new_vectors)
+            else:
+                self._update_vectors(ad_texts)
+        return len(ad_texts)
+
+    def get_ad(self, ad_id):
+        """The inventory entry of an ad, or None if there is no such ad"""
+        row = self._rows.get(ad_id)
+        return None if row is None else self.ad_inventory[row]
+
+    def update_ad(self, ad_id, ad_content, ad_metadata=None):
+        """
+        Replace an ad, keeping its ID.
+
+        The old version is deleted and the new one added like any new ad, so
+        it ranks after older ads on ties.
+
+        Raises:
+            KeyError: If there is no ad with this ID
+            ValueError: If ad_id is not an integer
+        """
+        ad_id = _checked_id(ad_id)
+        self.remove_ad(ad_id)
+        self.add_ads([{"content": ad_content, "metadata": ad_metadata, "ad_id": ad_id}])
+
+    def remove_ad(self, ad_id):
+        """
+        Delete an ad. Its row stays as a tombstone until the next compaction.
+
+        Raises:
+            KeyError: If there is no ad with this ID
+        """
+        if ad_id not in self._rows:
+            raise KeyError(f"No ad with ID {ad_id!r}")
+
+        if self.hashing is not None:
+            # The ad's term counts leave the document frequencies; its row
+            # may still be pending
+            self._flush_pending_vectors()
+            self.hashing.remove_documents(self.ad_vectors[self._rows[ad_id]])
+            self._row_norms = None
+        else:
+            self._count_inventory()
+            self.classifier.remove_documents([self.ad_inventory[self._rows[ad_id]]["content"]])
+
+        row = self._rows.pop(ad_id)
+        self.ad_inventory[row] = None
+        self._deleted.add(row)
+        self._dead_rows = None
+
+    def _count_inventory(self):
+        """
+        Count the ads into the classifier's document frequencies, if they
+        weren't classified by this engine (e.g. they were loaded from a
+        snapshot)
+        """
+        if not self.classifier.n_documents and self.inventory_size:
+            self.classifier.add_documents(
+                [ad["content"] for ad in self.ad_inventory if ad is not None]
+            )
+
+    @property
+    def inventory_size(self):
+        """Number of ads, not counting deleted ones"""
+        return len(self.ad_inventory) - len(self._deleted)
+
+    def compact(self):
+        """Drop the rows of deleted ads from the inventory and the ad matrices"""
+        self._flush_pending_vectors()
+        self._compact_rows()
+
+    def _compact_rows(self):
+        """compact() once pending rows are flushed"""
+        if not self._deleted:
+            return
+
+        live = np.setdiff1d(
+            np.arange(len(self.ad_inventory)), self._deleted_rows(), assume_unique=True
+        )
+        # Row order is kept, so rankings (and their ties) don't change
+        self.ad_vectors = self.ad_vectors[live]
+        self.keyword_matrix = self.keyword_matrix[live]
+        self.category_matrix = self.category_matrix[live]
+        self.ad_inventory = [self.ad_inventory[row] for row in live]
+        if self.ad_embeddings is not None:
+            self.ad_embeddings = self.ad_embeddings[live]
+        self._index_ids()
 
-        ad_data = classifier.classify_ad(ad_content, ad_metadata)
-        self.ad_inventory.append({
+        self._deleted = set()
+        self._dead_rows = None
+        self._postings = None
+        self._approximate_built = False
+        self._row_norms = None
+
+    def _index_ids(self):
+        """Rebuild the ad ID -> row index from the inventory"""
+        self._rows = {
+            ad["classification"]["ad_id"]: row
+            for row, ad in enumerate(self.ad_inventory)
+            if ad is not None
+        }
+
+    def refit(self):
+        """Refit the vectorizer and recompute TF-IDF vectors for all ads"""
+        if not self.inventory_size or self.hashing is not None:
+            # Hashed vectors never need a refit
+            return
+
+        # Extract ad content and create vectors; deleted ads don't count
+        # towards the IDF weights and keep empty rows
+        live = [row for row, ad in enumerate(self.ad_inventory) if ad is not None]
+        ad_texts = [self.ad_inventory[row]["content"] for row in live]
+        self.ad_vectors = self.vectorizer.fit_transform(ad_texts)
+        if len(live) < len(self.ad_inventory):
+            self.ad_vectors = _expand_rows(self.ad_vectors, live, len(self.ad_inventory))
+        self.feature_names = self.vectorizer.get_feature_names_out()
+        self._fitted_size = len(self.ad_inventory)
+        self._pending_vectors = []
+        self._postings = None
+        self._approximate_built = False
+        # The vocabulary changed, so the projection is refitted too
+        self.projection = None
+        self.ad_embeddings = None
+
+    def _inventory_entry(self, ad_content, ad_metadata, ad_data):
+        """Build the inventory entry for a classified ad"""
+        self._pending_keyword_rows.append(
+            _term_ids(ad_data["keywords"], self.keyword_vocabulary)
+        )
+        self._pending_category_rows.append(
+            _term_ids(ad_data["categories"], self.category_vocabulary)
+        )
+        return {
             "content": ad_content,
             "metadata": ad_metadata or {},
             "classification": ad_data,
-        })
+        }
+
+    def _update_vectors(self, new_texts):
+        """Update TF-IDF vectors after new_texts were appended to the inventory"""
+        if len(self.ad_inventory) >= self.refit_ratio * self._fitted_size:
+            self.refit()
+            return
+
+        # Keep the current vocabulary and IDF weights; the new rows are
+        # stacked onto ad_vectors lazily, right before the next match
+        self._pending_vectors.append(self.vectorizer.transform(new_texts))
+
+    def _flush_pending_vectors(self):
+        """Append vectors of incrementally added ads to the ad matrices"""
+        # The rows are appended in place and stay out of the postings until
+        # the next retrieval adds them to the tail (see _postings_parts)
+        if self._pending_vectors:
+            new_vectors = sp.vstack(self._pending_vectors, format="csr")
+            self.ad_vectors = self._vector_rows.append(self.ad_vectors, new_vectors)
+            self._pending_vectors = []
+
+            # The vocabulary is unchanged, so new ads join the existing lists
+            if self._approximate_built:
+                self.approximate_index.add(new_vectors)
+
+        if self._pending_keyword_rows:
+            self.keyword_matrix = self._keyword_rows.append(
+                self.keyword_matrix,
+                _rows_to_csr(self._pending_keyword_rows, len(self.keyword_vocabulary)),
+            )
+            self.category_matrix = self._category_rows.append(
+                self.category_matrix,
+                _rows_to_csr(self._pending_category_rows, len(self.category_vocabulary)),
+            )
+            self._pending_keyword_rows = []
+            self._pending_category_rows = []
 
-        # Update vectors when a new ad is added
-        self._update_vectors()
+        if self.embedding_dim is not None:
+            self._update_embeddings()
 
-    def _update_vectors(self):
-        """Update TF-IDF vectors for all ads"""
-        if not self.ad_inventory:
+        if len(self._deleted) > self.compact_ratio * len(self.ad_inventory):
+            self._compact_rows()
+
+    def _update_embeddings(self):
+        """Fit the projection if needed and embed the ads that have no embedding yet"""
+        if self.ad_vectors is None:
             return
 
-        # Extract ad content and create vectors
-        ad_texts = [ad["content"] for ad in self.ad_inventory]
-        self.ad_vectors = self.vectorizer.fit_transform(ad_texts)
-        self.feature_names = self.vectorizer.get_feature_names_out()
+        if self.projection is None:
+            rows = self._live(np.arange(self.ad_vectors.shape[0]))
+            if len(rows) > self.embedding_sample_size:
+                rng = np.random.default_rng(0)
+                rows = np.sort(rng.choice(rows, self.embedding_sample_size, replace=False))
+            sample = self.ad_vectors[rows]
+            # TruncatedSVD needs fewer components than terms
+            n_components = max(1, min(self.embedding_dim, sample.shape[1] - 1))
+            svd = TruncatedSVD(n_components=n_components, random_state=0).fit(sample)
+            self.projection = svd.components_.astype(np.float32)
+            self.ad_embeddings = None
+
+        embedded = 0 if self.ad_embeddings is None else self.ad_embeddings.shape[0]
+        if embedded < self.ad_vectors.shape[0]:
+            new_embeddings = _embed(self.ad_vectors[embedded:], self.projection)
+            if self.ad_embeddings is None:
+                self.ad_embeddings = new_embeddings
+            else:
+                self.ad_embeddings = self._embedding_rows.append(
+                    self.ad_embeddings, new_embeddings
+                )
 
-    def match_content(self, content_features):
+    def match_content(self, content_features, top_k=10):
         """
         Match content features with relevant ads.
 
         Args:
             content_features (dict): Features extracted from content
+            top_k (int): Number of matches to return
 
         Returns:
             list: Ranked list of matching ads
         """
-        if not self.ad_inventory:
+        if not self.inventory_size:
+            self.last_candidate_counts = [0]
             return []
 
-        # Combine features into a single text document
-        content_text = " ".join(content_features.get("keywords", []) +
-                               content_features.get("topic_candidates", []) +
-                               [e[0] for e in content_features.get("entities", [])])
-        matches = []
+        self._flush_pending_vectors()
+
+        content_keywords = set(content_features.get("keywords", []))
+        content_vector, keyword_query, topic_categories = self._build_query(
+            content_features
+        )
+        topic_hits = self._topic_category_hits(topic_categories)
+
+        ranked = self._score_query(
+            content_vector, keyword_query, topic_hits, len(content_keywords), top_k
+        )
+        return [
+            self._build_match(*match, content_features, topic_categories)
+            for match in zip(*ranked)
+        ]
+
+    def _score_query(
+        self, content_vector, keyword_query, topic_hits, n_keywords, top_k, similarities=None
+    ):
+        """
+        Score the ads against one query and rank the top_k.
+
+        Args:
+            content_vector (scipy.sparse.csr_matrix): TF-IDF vector of the content
+            keyword_query (np.ndarray): Keyword indicator vector
+            topic_hits (scipy.sparse.csr_matrix): Topic x category hit matrix
+            n_keywords (int): Number of distinct content keywords
+            top_k (int): Number of matches to rank
+            similarities (np.ndarray): Content similarity to every ad, already
+                computed (dense mode only); content_vector is then unused
+
+        Returns:
+            tuple: Ad indices, final scores, similarities, keyword overlaps and
+                category matches of the top ads, best first
+        """
+        # Only ads sharing a term, keyword or category with the content can
+        # score above zero, so score just those. Embedding similarities are
+        # dense, so in dense mode every ad is a candidate
+        candidates = None
+        if self.ad_embeddings is None:
+            if self._use_approximate_index():
+                candidates = self._fill_candidates(
+                    self._live(self.approximate_index.search(content_vector)), top_k
+                )
+            elif self.candidate_retrieval:
+                candidates = self._retrieve_candidates(
+                    content_vector, keyword_query, topic_hits, top_k
+                )
+        if candidates is None and self._deleted:
+            candidates = self._live(np.arange(self.ad_vectors.shape[0]))
+
+        self.last_candidate_counts = [
+            self.ad_vectors.shape[0] if candidates is None else len(candidates)
+        ]
 
         # 1. Content-based matching using TF-IDF and cosine similarity
-        content_vector = self.vectorizer.transform([content_text])
-        similarity_scores = cosine_similarity(content_vector, self.ad_vectors)[0]
+        if similarities is None:
+            similarity_scores = self._similarity(content_vector, candidates)[0]
+        else:
+            similarity_scores = _select_rows(similarities, candidates)
 
         # 2. Keyword matching (with weights)
+        keyword_overlap = _select_rows(self.keyword_matrix, candidates).dot(
+            keyword_query
+        )
+
+        # 3. Context relevance: topics containing one of the ad's categories
+        category_match = self._category_match(
+            _select_rows(self.category_matrix, candidates), topic_hits
+        )
+
+        # 4. Combine the scores
+        # We can adjust these weights based on performance
+        final_scores = (
+            (0.5 * similarity_scores)
+            + (0.3 * (keyword_overlap / max(1, n_keywords)))
+            + (0.2 * category_match)
+        )
+
+        # Select and sort only the top_k survivors; result dicts and match
+        # reasons are built for those alone
+        ranking = _top_k(final_scores, top_k)
+        ad_indices = ranking if candidates is None else candidates[ranking]
+        return (
+            ad_indices,
+            final_scores[ranking],
+            similarity_scores[ranking],
+            keyword_overlap[ranking],
+            category_match[ranking],
+        )
+
+    def match_batch(self, content_features_list, top_k=10):
+        """
+        Match a batch of documents with relevant ads in one pass.
+
+        All documents are scored with sparse matrix-matrix products, which only
+        touch the ad/document pairs that share a term, keyword or category.
+        Each document gets the same ranking match_content would give it. With
+        an approximate index in use, each document is searched in it and
+        scored on its own candidates, as in match_content. In dense mode the
+        similarities come from one matrix product for all documents, which
+        can round differently from match_content's per-document product in
+        the last float32 bit.
+
+        Args:
+            content_features_list (list): Features extracted from each document
+            top_k (int): Number of matches to return per document
+
+        Returns:
+            list: Ranked list of matching ads for each document
+        """
+        self.last_candidate_counts = [0] * len(content_features_list)
+        if not self.inventory_size:
+            return [[] for _ in content_features_list]
+        if not content_features_list:
+            return []
+
+        self._flush_pending_vectors()
+
+        # 1. Content-based matching, documents x ads
+        content_vectors = self._query_vectors(
+            [_content_text(features) for features in content_features_list]
+        )
+        if self.ad_embeddings is not None:
+            return self._match_each(
+                content_features_list, content_vectors, top_k, self._similarity(content_vectors)
+            )
+        if self._use_approximate_index():
+            return self._match_each(content_features_list, content_vectors, top_k)
+        similarity_scores = self._similarity(content_vectors, dense_output=False).tocsr()
+
+        # 2. Keyword overlap, documents x ads
+        keyword_sets = [
+            set(features.get("keywords", [])) for features in content_features_list
+        ]
+        keyword_queries = _rows_to_csr(
+            [self._keyword_ids(keywords) for keywords in keyword_sets],
+            self.keyword_matrix.shape[1],
+        )
+        keyword_overlap = keyword_queries.dot(self.keyword_matrix.T).tocsr()
+
+        # 3. Context relevance, documents x ads
+        topic_categories = [
+            self._topic_categories(set(features.get("topic_candidates", [])))
+            for features in content_features_list
+        ]
+        category_match = self._batch_category_match(topic_categories)
+
+        results = []
+        for d, content_features in enumerate(content_features_list):
+            rows = [
+                _sparse_row(matrix, d)
+                for matrix in (similarity_scores, keyword_overlap, category_match)
+            ]
+            candidates = self._fill_candidates(
+                self._live(np.unique(np.concatenate([indices for indices, _ in rows]))),
+                top_k,
+            )
+            doc_similarity, doc_overlap, doc_category = (
+                _gather(indices, values, candidates) for indices, values in rows
+            )
+            self.last_candidate_counts[d] = len(candidates)
+
+            # 4. Combine the scores, exactly as in match_content
+            final_scores = (
+                (0.5 * doc_similarity)
+                + (0.3 * (doc_overlap / max(1, len(keyword_sets[d]))))
+                + (0.2 * doc_category)
+            )
+            results.append([
+                self._build_match(
+                    candidates[i],
+                    final_scores[i],
+                    doc_similarity[i],
+                    doc_overlap[i],
+                    doc_category[i],
+                    content_features,
+                    topic_categories[d],
+                )
+                for i in _top_k(final_scores, top_k)
+            ])
+
+        return results
+
+    def _match_each(self, content_features_list, content_vectors, top_k, similarities=None):
+        """
+        match_batch one document at a time: in dense mode with the
+        similarities of one dense product for all documents, with an
+        approximate index on the candidates it finds for each document
+        """
+        results = []
+        candidate_counts = []
+        for d, content_features in enumerate(content_features_list):
+            content_keywords = set(content_features.get("keywords", []))
+            topic_categories = self._topic_categories(
+                set(content_features.get("topic_candidates", []))
+            )
+            ranked = self._score_query(
+                content_vectors[d],
+                self._keyword_query(content_keywords),
+                self._topic_category_hits(topic_categories),
+                len(content_keywords),
+                top_k,
+                None if similarities is None else similarities[d],
+            )
+            candidate_counts.extend(self.last_candidate_counts)
+            results.append([
+                self._build_match(*match, content_features, topic_categories)
+                for match in zip(*ranked)
+            ])
+
+        self.last_candidate_counts = candidate_counts
+        return results
+
+    def _build_match(
+        self, ad_index, score, similarity, overlap, category, content_features, topic_categories
+    ):
+        """Result entry for one matched ad"""
+        ad = self.ad_inventory[ad_index]
+        return {
+            "ad": ad,
+            "relevance_score": float(
+                score
+            ),  # Convert to float for JSON serialization
+            "match_factors": {
+                "content_similarity": float(similarity),
+                "keyword_overlap": int(overlap),
+                "category_relevance": int(category),
+            },
+            "match_reason": self._generate_match_reason(
+                ad, content_features, topic_categories
+            ),
+        }
+
+    def _build_query(self, content_features):
+        """
+        Turn content features into the query vectors matched against the ads.
+
+        Returns:
+            tuple: TF-IDF vector of the content, keyword indicator vector and
+                the categories contained in each topic (see _topic_categories)
+        """
+        content_vector = self._query_vectors([_content_text(content_features)])
+
         content_keywords = set(content_features.get("keywords", []))
         content_topics = set(content_features.get("topic_candidates", []))
+        return (
+            content_vector,
+            self._keyword_query(content_keywords),
+            self._topic_categories(content_topics),
+        )
+
+    def _query_vectors(self, texts):
+        """Content vectors of texts, to score with _similarity"""
+        if self.hashing is not None:
+            return self.hashing.query_vectors(texts)
+        return self.vectorizer.transform(texts)
+
+    def _similarity(self, content_vectors, candidates=None, dense_output=True):
+        """Cosine similarity of each content vector to each ad (or candidate ad)"""
+        if self.ad_embeddings is not None:
+            # Embeddings are normalized, so cosine is a plain dot product
+            embeddings = _select_rows(self.ad_embeddings, candidates)
+            return embeddings.dot(_embed(content_vectors, self.projection).T).T
+
+        ad_vectors = _select_rows(self.ad_vectors, candidates)
+        if self.hashing is None:
+            return cosine_similarity(content_vectors, ad_vectors, dense_output=dense_output)
+
+        norms = self._ad_norms()
+        if candidates is not None:
+            norms = norms[candidates]
+        similarity = self.hashing.similarity(content_vectors, ad_vectors, norms)
+        return similarity.toarray() if dense_output else similarity
+
+    def _ad_norms(self):
+        """TF-IDF norm of every hashed ad vector under the current IDF weights"""
+        if self._row_norms is None:
+            self._row_norms = self.hashing.norms(self.ad_vectors)
+        return self._row_norms
+
+    def _keyword_ids(self, content_keywords):
+        """Columns of the content keywords known to the keyword vocabulary"""
+        return [
+            self.keyword_vocabulary[kw]
+            for kw in content_keywords
+            if kw in self.keyword_vocabulary
+        ]
+
+    def _keyword_query(self, content_keywords):
+        """Indicator vector of the content keywords over the keyword vocabulary"""
+        query = np.zeros(self.keyword_matrix.shape[1])
+        query[self._keyword_ids(content_keywords)] = 1
+        return query
 
-        # 3. Combine the scores
-        for i, ad in enumerate(self.ad_inventory):
-            # Get similarity score from TF-IDF
-            tfidf_score = similarity_scores[i]
-
-            # Calculate keyword matching score
-            ad_keywords = set(ad["classification"].get("keywords", []))
-            keyword_overlap = len(content_keywords.intersection(ad_keywords))
-
-            # Calculate context relevance score
-            ad_categories = set(ad["classification"].get("categories", []))
-            category_match = sum(
-                1
-                for topic in content_topics
-                if any(cat in topic for cat in ad_categories)
+    def _topic_categories(self, content_topics):
+        """
+        Category columns contained in each topic, found with one automaton
+        pass per topic.
+
+        Returns:
+            dict: Topic -> category columns, only for topics with a hit, in
+                the iteration order of content_topics
+        """
+        # Categories only ever get appended to the vocabulary
+        if len(self.category_matcher) < len(self.category_vocabulary):
+            self.category_matcher.add(
+                list(self.category_vocabulary)[len(self.category_matcher):]
             )
 
-            # Calculate weighted score
-            # We can adjust these weights based on performance
-            final_score = (
-                (0.5 * tfidf_score)
-                + (0.3 * (keyword_overlap / max(1, len(content_keywords))))
-                + (0.2 * category_match)
+        topic_categories = {}
+        for topic in content_topics:
+            hits = self.category_matcher.find(topic)
+            if hits:
+                topic_categories[topic] = hits
+        return topic_categories
+
+    def _topic_category_hits(self, topic_categories):
+        """Topic x category matrix of categories contained in each topic"""
+        # Restricted to topics that hit any category
+        return _rows_to_csr(list(topic_categories.values()), self.category_matrix.shape[1])
+
+    def _category_match(self, category_matrix, topic_hits):
+        """Number of content topics that contain one of each ad's categories"""
+        if not topic_hits.nnz:
+            return np.zeros(category_matrix.shape[0])
+
+        ad_topic_hits = category_matrix.dot(topic_hits.T).tocsr()
+        return ad_topic_hits.getnnz(axis=1)
+
+    def _batch_category_match(self, topic_categories):
+        """Documents x ads matrix of _category_match counts"""
+        topic_hits = [self._topic_category_hits(topics) for topics in topic_categories]
+        owners = np.repeat(
+            np.arange(len(topic_hits)), [hits.shape[0] for hits in topic_hits]
+        )
+        if not len(owners):
+            return sp.csr_matrix((len(topic_categories), len(self.ad_inventory)))
+
+        # Ads x topics of all documents, then count hit topics per document
+        ad_topic_hits = self.category_matrix.dot(
+            sp.vstack(topic_hits, format="csr").T
+        ).tocsr()
+        ad_topic_hits.data[:] = 1
+        topic_owners = sp.csr_matrix(
+            (np.ones(len(owners)), (np.arange(len(owners)), owners)),
+            shape=(len(owners), len(topic_categories)),
+        )
+        return ad_topic_hits.dot(topic_owners).T.tocsr()
+
+    def _retrieve_candidates(self, content_vector, keyword_query, topic_hits, top_k):
+        """
+        Gather the ads that share at least one term with the content.
+
+        Uses the term -> ad postings of the TF-IDF vocabulary, the ad keywords
+        and the ad categories. When fewer than top_k ads are found, the first
+        non-matching ads are added (they all score zero), so the ranking is
+        the same as scoring the whole inventory.
+
+        Returns:
+            np.ndarray: Sorted ad indices, or None when the postings hold
+                more than max_candidate_share entries per ad and every ad
+                should be scored instead
+        """
+        columns = (
+            content_vector.indices,
+            np.flatnonzero(keyword_query),
+            np.unique(topic_hits.indices),
+        )
+        lists = [
+            (postings, _known_columns(cols, postings.shape[1]), first_row)
+            for part, first_row in self._postings_parts()
+            for postings, cols in zip(part, columns)
+        ]
+
+        # Gathering costs about one step per posting, and the postings'
+        # total bounds the candidates, so past the limit it saves nothing
+        n_postings = sum(
+            (postings.indptr[cols + 1] - postings.indptr[cols]).sum()
+            for postings, cols, _ in lists
+        )
+        if n_postings > self.max_candidate_share * self.ad_vectors.shape[0]:
+            return None
+
+        candidates = np.unique(np.concatenate([
+            _postings(postings, cols) + first_row for postings, cols, first_row in lists
+        ]))
+        return self._fill_candidates(self._live(candidates), top_k)
+
+    def _postings_parts(self):
+        """
+        The CSC postings of the ad matrices, as (postings, first row) parts:
+        the main postings and, if ads were appended since they were built,
+        the postings of those ads
+        """
+        n_rows = self.ad_vectors.shape[0]
+        indexed = 0 if self._postings is None else self._postings[0].shape[0]
+        # Rebuilding the tail after an append costs about its size, and
+        # merging it costs the whole inventory, so it's merged past sqrt(ads)
+        if self._postings is None or (n_rows - indexed) ** 2 > n_rows:
+            self.merge_postings()
+            return [(self._postings, 0)]
+        if indexed == n_rows:
+            return [(self._postings, 0)]
+
+        if self._tail_postings is None or self._tail_postings[0].shape[0] != n_rows - indexed:
+            self._tail_postings = _csc_postings(
+                (self.ad_vectors, self.keyword_matrix, self.category_matrix), indexed
             )
+        return [(self._postings, 0), (self._tail_postings, indexed)]
 
-            # Add to matches
-            matches.append(
-                {
-                    "ad": ad,
-                    "relevance_score": float(
-                        final_score
-                    ),  # Convert to float for JSON serialization
-                    "match_factors": {
-                        "content_similarity": float(tfidf_score),
-                        "keyword_overlap": keyword_overlap,
-                        "category_relevance": category_match,
-                    },
-                    "match_reason": self._generate_match_reason(ad, content_features),
-                }
+    def merge_postings(self):
+        """Build the postings of all flushed ads, merging in those of recently appended ones"""
+        if self._postings is None or self._postings[0].shape[0] < self.ad_vectors.shape[0]:
+            self._postings = _csc_postings(
+                (self.ad_vectors, self.keyword_matrix, self.category_matrix), 0
             )
+            self._tail_postings = None
+
+    def _fill_candidates(self, candidates, top_k):
+        """Bounded fallback: give the slots candidates can't fill to the lowest-index ads"""
+        dead_rows = self._deleted_rows()
+        n_rows = self.ad_vectors.shape[0]
+        missing = min(top_k, n_rows - len(dead_rows)) - len(candidates)
+        if missing > 0:
+            # At most len(candidates) + len(dead_rows) of these rows are taken
+            prefix = np.ones(min(n_rows, len(candidates) + len(dead_rows) + missing), dtype=bool)
+            prefix[candidates[candidates < len(prefix)]] = False
+            prefix[dead_rows[dead_rows < len(prefix)]] = False
+            candidates = np.union1d(candidates, np.flatnonzero(prefix)[:missing])
+
+        return candidates
+
+    def _deleted_rows(self):
+        """Rows of deleted ads, sorted"""
+        if self._dead_rows is None:
+            self._dead_rows = np.array(sorted(self._deleted), dtype=np.intp)
+        return self._dead_rows
+
+    def _live(self, candidates):
+        """Sorted candidates without the rows of deleted ads"""
+        if not self._deleted:
+            return candidates
+        return np.setdiff1d(candidates, self._deleted_rows())
 
-        # Sort by relevance score
-        matches.sort(key=lambda x: x["relevance_score"], reverse=True)
-        return matches[:10]  # Return top 5 matches
+    def _use_approximate_index(self):
+        """Whether to retrieve candidates from the approximate index"""
+        if self.approximate_index is None:
+            return False
+        if len(self.ad_inventory) < self.approximate_min_inventory:
+            # Small inventories are cheap to score exactly
+            return False
 
-    def _generate_match_reason(self, ad, content_features):
+        if not self._approximate_built:
+            self.approximate_index.build(self.ad_vectors)
+            self._approximate_built = True
+        return True
+
+    def _generate_match_reason(self, ad, content_features, topic_categories):
         """Generate a human-readable reason for the match"""
         ad_keywords = set(ad["classification"]["keywords"])
         content_keywords = set(content_features.get("keywords", []))
@@ -119,15 +881,228 @@ class MatchingEngine:
         if common_keywords:
             return f"Matched based on keywords: {', '.join(list(common_keywords)[:3])}"
 
-        ad_categories = set(ad["classification"]["categories"])
-        content_topics = set(content_features.get("topic_candidates", []))
+        # Topics containing one of the ad's categories
+        ad_categories = {
+            self.category_vocabulary[cat] for cat in ad["classification"]["categories"]
+        }
         matched_topics = [
             topic
-            for topic in content_topics
-            if any(cat in topic for cat in ad_categories)
+            for topic, hits in topic_categories.items()
+            if ad_categories.intersection(hits)
         ]
 
         if matched_topics:
             return f"Matched based on topics: {', '.join(matched_topics[:3])}"
 
         return "Matched based on content similarity"
+
+
+def _top_k(scores, k):
+    """Indices of the k highest scores, best first, ties in inventory order"""
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+
+    # Partial selection of the k-th best score, then an exact cut at it so
+    # ties on the boundary are resolved the same way a full stable sort would
+    kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+    above = np.flatnonzero(scores > kth_score)
+    ties = np.flatnonzero(scores == kth_score)[: k - len(above)]
+    top = np.concatenate([above, ties])
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _checked_id(ad_id):
+    """
+    An ad ID given by the caller, as an int: IDs are integers everywhere
+    (content hashes, snapshots, compact responses)
+
+    Raises:
+        ValueError: If ad_id is not an integer
+    """
+    if isinstance(ad_id, bool) or not isinstance(ad_id, numbers.Integral):
+        raise ValueError(f"ad_id must be an integer, got {ad_id!r}")
+    return int(ad_id)
+
+
+def _content_text(content_features):
+    """Combine features into a single text document"""
+    return " ".join(list(content_features.get("keywords", [])) +
+                    list(content_features.get("topic_candidates", [])) +
+                    [e[0] for e in content_features.get("entities", [])])
+
+
+def _embed(vectors, projection, chunk_size=65536):
+    """l2-normalized float32 projections of the rows of a sparse matrix"""
+    embeddings = np.empty((vectors.shape[0], projection.shape[0]), dtype=np.float32)
+    for start in range(0, vectors.shape[0], chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        embeddings[start:start + chunk_size] = normalize(chunk.dot(projection.T))
+    return embeddings
+
+
+def _sparse_row(matrix, row):
+    """Column indices and values of one CSR row"""
+    start, end = matrix.indptr[row], matrix.indptr[row + 1]
+    return matrix.indices[start:end], matrix.data[start:end]
+
+
+def _gather(indices, values, columns):
+    """Dense values of a sparse row at the given sorted columns; other entries are dropped"""
+    dense = np.zeros(len(columns))
+    positions = np.searchsorted(columns, indices)
+    found = positions < len(columns)
+    found[found] = columns[positions[found]] == indices[found]
+    dense[positions[found]] = values[found]
+    return dense
+
+
+def _select_rows(matrix, rows):
+    """Rows of a CSR matrix or an array, or the whole of it when rows is None"""
+    return matrix if rows is None else matrix[rows]
+
+
+def _postings(csc_matrix, columns):
+    """Row indices of all non-zeros in the given columns of a CSC matrix"""
+    if not len(columns):
+        return np.empty(0, dtype=csc_matrix.indices.dtype)
+    return csc_matrix[:, columns].indices
+
+
+def _term_ids(terms, vocabulary):
+    """Map terms to column ids, adding unseen terms to the vocabulary"""
+    return sorted({vocabulary.setdefault(term, len(vocabulary)) for term in terms})
+
+
+def _rows_to_csr(rows, n_cols):
+    """Build a binary CSR matrix from per-row lists of column ids"""
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=indptr[1:])
+    indices = np.fromiter(
+        (col for row in rows for col in row), dtype=np.int32, count=indptr[-1]
+    )
+    data = np.ones(len(indices))
+    return sp.csr_matrix((data, indices, indptr), shape=(len(rows), n_cols))
+
+
+def _expand_rows(matrix, rows, n_rows):
+    """CSR matrix of n_rows rows holding matrix's rows at the given rows, empty elsewhere"""
+    lengths = np.zeros(n_rows, dtype=matrix.indptr.dtype)
+    lengths[rows] = np.diff(matrix.indptr)
+    indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(matrix.indptr.dtype)
+    return sp.csr_matrix((matrix.data, matrix.indices, indptr), shape=(n_rows, matrix.shape[1]))
+
+
+def _csc_postings(matrices, first_row):
+    """CSC postings of the rows of matrices from first_row on"""
+    return tuple(matrix[first_row:].tocsc() for matrix in matrices)
+
+
+def _known_columns(columns, n_cols):
+    """The columns below n_cols; postings built before the vocabulary grew lack the others"""
+    return columns[columns < n_cols]
+
+
+class _GrowingRows:
+    """
+    Storage of a CSR matrix that rows keep being appended to.
+
+    The rows live in buffers grown geometrically, so an append copies only
+    the new rows instead of the whole matrix. Each matrix handed out views
+    the filled part of the buffers; later appends write past it, so it stays
+    valid and unchanged.
+    """
+
+    def __init__(self):
+        self.matrix = None
+        self._data = np.empty(0)
+        self._indices = np.empty(0, dtype=np.int32)
+        self._indptr = np.zeros(1, dtype=np.int32)
+        self._n_rows = self._nnz = self._n_cols = 0
+
+    def append(self, matrix, new_rows):
+        """
+        matrix with new_rows stacked under it, widened to their columns.
+
+        matrix is copied into fresh buffers first unless it's the matrix the
+        last append returned (e.g. after a refit or compaction replaced it).
+        """
+        if matrix is None or matrix is not self.matrix:
+            dtype = new_rows.dtype if matrix is None else np.result_type(matrix, new_rows)
+            self._data = np.empty(0, dtype=dtype)
+            self._n_rows = self._nnz = self._n_cols = 0
+            if matrix is not None:
+                self._extend(matrix)
+        self._extend(new_rows)
+
+        self.matrix = sp.csr_matrix(
+            (
+                self._data[:self._nnz],
+                self._indices[:self._nnz],
+                self._indptr[:self._n_rows + 1],
+            ),
+            shape=(self._n_rows, self._n_cols),
+            copy=False,
+        )
+        return self.matrix
+
+    def _extend(self, rows):
+        start, end = rows.indptr[0], rows.indptr[-1]
+        n_rows = self._n_rows + rows.shape[0]
+        nnz = self._nnz + end - start
+        self._n_cols = max(self._n_cols, rows.shape[1])
+        if nnz > len(self._data) or n_rows >= len(self._indptr):
+            self._grow(nnz, n_rows + 1)
+
+        self._data[self._nnz:nnz] = rows.data[start:end]
+        self._indices[self._nnz:nnz] = rows.indices[start:end]
+        self._indptr[self._n_rows + 1:n_rows + 1] = rows.indptr[1:] - start + self._nnz
+        self._n_rows, self._nnz = n_rows, nnz
+
+    def _grow(self, nnz, n_pointers):
+        capacity = max(nnz, 2 * len(self._data))
+        pointer_capacity = max(n_pointers, 2 * len(self._indptr))
+        # Indices and pointers share a dtype, or scipy would copy them
+        index_dtype = (
+            np.int32
+            if max(capacity, self._n_cols) <= np.iinfo(np.int32).max
+            else np.int64
+        )
+
+        data = np.empty(capacity, dtype=self._data.dtype)
+        data[:self._nnz] = self._data[:self._nnz]
+        indices = np.empty(capacity, dtype=index_dtype)
+        indices[:self._nnz] = self._indices[:self._nnz]
+        indptr = np.zeros(pointer_capacity, dtype=index_dtype)
+        indptr[:self._n_rows + 1] = self._indptr[:self._n_rows + 1]
+        self._data, self._indices, self._indptr = data, indices, indptr
+
+
+class _GrowingArray:
+    """_GrowingRows for a dense array: rows appended in place, with spare capacity"""
+
+    def __init__(self):
+        self.array = None
+        self._buffer = None
+        self._n_rows = 0
+
+    def append(self, array, new_rows):
+        """array with new_rows stacked under it; copied first unless it's the last one returned"""
+        if array is None or array is not self.array:
+            self._buffer = new_rows[:0] if array is None else array
+            self._n_rows = len(self._buffer)
+
+        n_rows = self._n_rows + len(new_rows)
+        if n_rows > len(self._buffer) or self._buffer is array:
+            buffer = np.empty(
+                (max(n_rows, 2 * self._n_rows),) + new_rows.shape[1:],
+                dtype=np.result_type(self._buffer, new_rows),
+            )
+            buffer[:self._n_rows] = self._buffer[:self._n_rows]
+            self._buffer = buffer
+
+        self._buffer[self._n_rows:n_rows] = new_rows
+        self._n_rows = n_rows
+        self.array = self._buffer[:n_rows]
+        return self.array
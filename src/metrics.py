@@ -0,0 +1,134 @@
+# metrics.py
+# Lightweight metric types for hot-path instrumentation
+
+import bisect
+
+# Latency buckets in seconds, from sub-millisecond scoring to slow documents
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+class Histogram:
+    """
+    Bucketed histogram in the Prometheus style: each bucket counts the
+    observations less than or equal to its upper bound.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        """Cumulative bucket counts, total count and sum"""
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets + (float("inf"),), self.bucket_counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else repr(bound)] = cumulative
+        return {"buckets": buckets, "count": self.count, "sum": self.sum}
+
+
+class Counter:
+    """Monotonically increasing count"""
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge:
+    """Value that can go up and down"""
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class MetricsRegistry:
+    """
+    Named metric families, rendered in the Prometheus text format.
+
+    Asking for a metric by name and labels returns the existing one if it was
+    created before, so callers can look metrics up on the hot path. Not
+    thread-safe: use one registry per thread (or event loop).
+    """
+
+    def __init__(self):
+        self._families = {}  # name -> (type, help, {label items: metric})
+
+    def counter(self, name, help, labels=None):
+        return self._get(name, "counter", help, labels, Counter)
+
+    def gauge(self, name, help, labels=None):
+        return self._get(name, "gauge", help, labels, Gauge)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, labels=None):
+        return self._get(name, "histogram", help, labels, lambda: Histogram(buckets))
+
+    def register(self, name, help, metric, labels=None):
+        """Add an existing Counter, Gauge or Histogram under name"""
+        metric_type = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}[type(metric)]
+        family = self._family(name, metric_type, help)
+        family[_label_key(labels)] = metric
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, (metric_type, help, metrics) in self._families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for label_key, metric in metrics.items():
+                if metric_type == "histogram":
+                    snapshot = metric.snapshot()
+                    for bound, count in snapshot["buckets"].items():
+                        lines.append(
+                            f"{name}_bucket{_format_labels(label_key + (('le', bound),))} {count}"
+                        )
+                    lines.append(f"{name}_sum{_format_labels(label_key)} {snapshot['sum']!r}")
+                    lines.append(f"{name}_count{_format_labels(label_key)} {snapshot['count']}")
+                else:
+                    lines.append(f"{name}{_format_labels(label_key)} {metric.value!r}")
+        return "\n".join(lines) + "\n"
+
+    def _get(self, name, metric_type, help, labels, factory):
+        family = self._family(name, metric_type, help)
+        label_key = _label_key(labels)
+        metric = family.get(label_key)
+        if metric is None:
+            metric = family[label_key] = factory()
+        return metric
+
+    def _family(self, name, metric_type, help):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (metric_type, help, {})
+        elif family[0] != metric_type:
+            raise ValueError(f"Metric {name} is a {family[0]}, not a {metric_type}")
+        return family[2]
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _format_labels(label_key):
+    if not label_key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in label_key) + "}"
+
+
+def _escape(value):
+    """Label value escaped for the text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -1,19 +1,38 @@
 # privacy_layer.py
 # A privacy layer that ensures no personal data is used
 
-import numpy as np
 import re
 import random
 
+from src.differential_privacy import LaplaceMechanism, PrivacyBudget
+
+# Cheap test for where a PII match can start: an email local part followed
+# by "@", or a digit, "+" or "(" for the numeric types. Skips most words
+# without trying each pattern on them
+_PII_START = r'(?=[\w.%+-]*@|[\d+(])'
+
+# Whitespace no PII match can span: inside a match, whitespace always
+# follows a digit or ")" or comes before a digit. Text between two of these
+# is redacted independently of the rest
+_SEGMENT_BREAK = re.compile(r'(?<![\d)])\s(?!\d)')
+
 
 class PrivacyLayer:
-    def __init__(self):
+    def __init__(self, seed=None, session_epsilon=None):
         # Privacy settings
         self.anonymization_enabled = True
         self.differential_privacy_enabled = True
         self.epsilon = 0.5  # Differential privacy parameter (higher = less privacy but more accuracy)
         self.local_processing = True  # Ensures minimal data leaves the device
 
+        # Numeric features that get Laplace noise, with their sensitivity
+        self.noised_features = {"word_count": 1}
+
+        # Own random generator (seeded from the OS unless seed is given), and
+        # the epsilon each session may spend in total (None = unlimited)
+        self.noise = LaplaceMechanism(seed)
+        self.budget = PrivacyBudget(session_epsilon)
+
         # PII re-gex patterns
         self.pii_patterns = {
             'email': re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'),
@@ -23,33 +42,109 @@ class PrivacyLayer:
             'ip_address': re.compile(r'\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b')
         }
 
-    def apply_privacy_measures(self, content_features):
+        # All PII patterns as one alternation, to find the text that has any
+        # PII in a single scan. Every pattern starts with \b, which is checked
+        # once up front, followed by _PII_START
+        word_boundary = r'\b'
+        self.pii_scanner = re.compile(word_boundary + _PII_START + '(?:' + '|'.join(
+            f'(?:{pattern.pattern.removeprefix(word_boundary)})'
+            for pattern in self.pii_patterns.values()
+        ) + ')')
+
+    def apply_privacy_measures(self, content_features, session_id=None):
         """
         Apply privacy-preserving measures to content features.
 
         Args:
             content_features (dict): Original content features
+            session_id: Session charged for the noised values; None skips
+                budget accounting
 
         Returns:
             dict: Privacy-enhanced content features
+
+        Raises:
+            PrivacyBudgetExceeded: If the session's epsilon budget is spent
         """
-        import copy
+        return self.apply_privacy_measures_batch([content_features], [session_id])[0]
 
-        private_features = copy.deepcopy(content_features)
+    def apply_privacy_measures_batch(self, features_list, session_ids=None):
+        """
+        Apply privacy measures to many documents, noising each numeric
+        feature for the whole batch in one draw.
+
+        Args:
+            features_list (list): Original content features of each document
+            session_ids (list): Session of each document (None entries, or
+                no list at all, skip budget accounting)
+
+        Returns:
+            list: Privacy-enhanced content features, in order
+        """
+        # Shallow copies are enough: each step below builds a new mapping and
+        # replaces the values it changes rather than modifying them, so the
+        # caller's features (cached ones included) are never touched
+        private_features_list = [dict(features) for features in features_list]
 
         if self.anonymization_enabled:
-            private_features = self._sanitize_features(private_features)
+            private_features_list = [
+                self._sanitize_features(features) for features in private_features_list
+            ]
 
         if self.differential_privacy_enabled:
-            private_features = self._apply_differential_privacy(private_features)
+            private_features_list = self._apply_differential_privacy(
+                private_features_list, session_ids or [None] * len(private_features_list)
+            )
 
         if self.local_processing:
-            private_features = self._apply_local_processing(private_features)
+            private_features_list = [
+                self._apply_local_processing(features) for features in private_features_list
+            ]
+
+        return private_features_list
+
+    def release_epsilon(self):
+        """Epsilon one document's release costs its session, at most"""
+        if not self.differential_privacy_enabled:
+            return 0.0
+        return self.epsilon * len(self.noised_features)
+
+    def redact_text(self, text):
+        """
+        Replace every PII match in text with a [REDACTED <TYPE>] marker.
 
-        return private_features
+        The result is that of one re.sub pass per type in pii_patterns
+        order, where overlapping matches are settled by the earlier type.
+        Those passes only run over the segments (see _SEGMENT_BREAK) that
+        pii_scanner finds PII in; the rest of the text is copied as is.
+        """
+        pieces = []
+        position = 0
+        while match := self.pii_scanner.search(text, position):
+            start = match.start()
+            while start > position and not _SEGMENT_BREAK.match(text, start - 1):
+                start -= 1
+            end_break = _SEGMENT_BREAK.search(text, match.end())
+            end = end_break.start() if end_break else len(text)
+
+            pieces.append(text[position:start])
+            pieces.append(self._redact_sequentially(text[start:end]))
+            position = end
+
+        if not pieces:
+            return text
+        pieces.append(text[position:])
+        return "".join(pieces)
+
+    def _redact_sequentially(self, text):
+        """Redact each PII type in turn, in pii_patterns order"""
+        for name, pattern in self.pii_patterns.items():
+            text = pattern.sub(f"[REDACTED {name.upper()}]", text)
+        return text
 
     def _sanitize_features(self, features):
         """Sanitize sensitive PII while preserving matching data"""
+        features = dict(features)
 
         # Sanitize entity types but keep useful ones
         if "entities" in features:
@@ -61,26 +156,41 @@ class PrivacyLayer:
 
         # Remove PII from text summary
         if "text_summary" in features:
-            text = features["text_summary"]
-            for pattern_name, pattern in self.pii_patterns.items():
-                text = pattern.sub(f"[REDACTED {pattern_name.upper()}]", text)
-            features["text_summary"] = text
+            features["text_summary"] = self.redact_text(features["text_summary"])
 
         return features
 
-    def _apply_differential_privacy(self, features):
+    def _apply_differential_privacy(self, features_list, session_ids):
         """Apply differential privacy to numeric features"""
-        # Add calibrated noise to numeric values
-        if "word_count" in features:
-            features["word_count"] = self._add_laplace_noise(features["word_count"], sensitivity=1)
+        noised = [
+            (name, sensitivity, [i for i, features in enumerate(features_list) if name in features])
+            for name, sensitivity in self.noised_features.items()
+        ]
 
-        return features
+        # Every noised value costs its session epsilon; charged up front, so
+        # a refused batch releases nothing
+        self.budget.charge(
+            [
+                session_ids[i]
+                for _, _, rows in noised
+                for i in rows
+                if session_ids[i] is not None
+            ],
+            self.epsilon,
+        )
+
+        features_list = [dict(features) for features in features_list]
+        for name, sensitivity, rows in noised:
+            if not rows:
+                continue
+            # Add calibrated noise to numeric values
+            values = self.noise.noise_counts(
+                [features_list[i][name] for i in rows], self.epsilon, sensitivity
+            )
+            for i, value in zip(rows, values.tolist()):
+                features_list[i][name] = value
 
-    def _add_laplace_noise(self, value, sensitivity=1.0):
-        """Add Laplace noise calibrated to the sensitivity and epsilon"""
-        scale = sensitivity / self.epsilon
-        noise = np.random.laplace(0, scale)
-        return max(0, int(value + noise))
+        return features_list
 
     def _apply_local_processing(self, features):
         """
@@ -0,0 +1,302 @@
+# sharded_matching.py
+# Scatter-gather matching over ad shards held by worker processes
+#
+# The ad matrices of a built MatchingEngine are copied into shared memory
+# once; each shard process maps a contiguous range of their rows without
+# copying it and scores every query against that range. The coordinator
+# builds the query once, sends it to all shards, and merges their local
+# top-k lists into the global one.
+
+import multiprocessing
+import os
+import threading
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+import scipy.sparse as sp
+
+from src.matching_engine import MatchingEngine, _content_text
+
+# Sparse matrices of the engine that the shards score against
+_MATRICES = ("ad_vectors", "keyword_matrix", "category_matrix")
+
+
+class ShardedMatchingEngine:
+    """
+    Serves match_content and match_batch of a built MatchingEngine from
+    n_shards worker processes.
+
+    Every ad's score depends on that ad alone, and each shard ranks its ads
+    with the same arithmetic and tie-breaking as the unsharded engine, so
+    merging the local top-k lists by (score, ad index) gives exactly the
+    unsharded ranking. The approximate index is not used.
+
+    The engine must not be modified afterwards; build a new
+    ShardedMatchingEngine for a new index version. Shards are stopped by
+    close(), or when the object is garbage collected.
+    """
+
+    def __init__(self, engine, n_shards=None):
+        """
+        Args:
+            engine (MatchingEngine): Engine with a built inventory
+            n_shards (int): Worker processes; defaults to the number of CPUs
+        """
+        if not engine.inventory_size:
+            raise ValueError("Cannot shard an empty inventory")
+
+        engine._flush_pending_vectors()
+        self.engine = engine
+        n_ads = engine.ad_vectors.shape[0]
+        self.n_shards = max(1, min(n_shards or os.cpu_count() or 1, n_ads))
+        self.last_candidate_counts = []
+        self._lock = threading.Lock()  # One scatter-gather at a time on the pipes
+
+        self._segments, layout = _share_matrices(engine)
+        bounds = np.linspace(0, n_ads, self.n_shards + 1).astype(int)
+        dead_rows = engine._deleted_rows()
+
+        # spawn rather than fork: the serving process may already run threads
+        context = multiprocessing.get_context("spawn")
+        self._connections = []
+        self._processes = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            connection, child_connection = context.Pipe()
+            shard_dead_rows = dead_rows[(dead_rows >= start) & (dead_rows < stop)] - start
+            process = context.Process(
+                target=_shard_worker,
+                args=(
+                    child_connection,
+                    layout,
+                    int(start),
+                    int(stop),
+                    shard_dead_rows.tolist(),
+                    {
+                        "candidate_retrieval": engine.candidate_retrieval,
+                        "max_candidate_share": engine.max_candidate_share,
+                        "hash_features": (
+                            engine.hashing.n_features if engine.hashing is not None else None
+                        ),
+                        "embedding_dim": engine.embedding_dim,
+                    },
+                ),
+                daemon=True,
+            )
+            process.start()
+            child_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+        # Wait until every shard has mapped its rows
+        for connection in self._connections:
+            connection.recv()
+
+        self._finalizer = weakref.finalize(
+            self, _shutdown, self._connections, self._processes, self._segments
+        )
+
+    @property
+    def ad_inventory(self):
+        return self.engine.ad_inventory
+
+    @property
+    def inventory_size(self):
+        return self.engine.inventory_size
+
+    @property
+    def index_version(self):
+        return self.engine.index_version
+
+    @index_version.setter
+    def index_version(self, version):
+        self.engine.index_version = version
+
+    def match_content(self, content_features, top_k=10):
+        """Same as MatchingEngine.match_content, scored on the shards"""
+        return self.match_batch([content_features], top_k=top_k)[0]
+
+    def match_batch(self, content_features_list, top_k=10):
+        """
+        Same as MatchingEngine.match_batch, scored on the shards.
+
+        All documents go to the shards in one message per shard, and every
+        shard scores them while the others do the same.
+        """
+        engine = self.engine
+        if not content_features_list:
+            self.last_candidate_counts = []
+            return []
+
+        content_vectors = engine._query_vectors(
+            [_content_text(features) for features in content_features_list]
+        )
+        queries = []
+        topic_categories = []
+        for d, content_features in enumerate(content_features_list):
+            content_keywords = set(content_features.get("keywords", []))
+            topics = engine._topic_categories(set(content_features.get("topic_candidates", [])))
+            topic_categories.append(topics)
+            queries.append((
+                content_vectors.indices[content_vectors.indptr[d]:content_vectors.indptr[d + 1]],
+                content_vectors.data[content_vectors.indptr[d]:content_vectors.indptr[d + 1]],
+                engine._keyword_ids(content_keywords),
+                engine._topic_category_hits(topics),
+                len(content_keywords),
+            ))
+
+        with self._lock:
+            for connection in self._connections:
+                connection.send((queries, top_k))
+            shard_results = [connection.recv() for connection in self._connections]
+
+        self.last_candidate_counts = [0] * len(content_features_list)
+        results = []
+        for d, content_features in enumerate(content_features_list):
+            ranked = [
+                np.concatenate(columns)
+                for columns in zip(*(shard[d][0] for shard in shard_results))
+            ]
+            self.last_candidate_counts[d] = sum(shard[d][1] for shard in shard_results)
+
+            # Best score first, ties by ad index, as in _top_k
+            ad_indices, final_scores = ranked[0], ranked[1]
+            order = np.lexsort((ad_indices, -final_scores))[:top_k]
+            results.append([
+                engine._build_match(
+                    *(column[i] for column in ranked), content_features, topic_categories[d]
+                )
+                for i in order
+            ])
+        return results
+
+    def close(self):
+        """Stop the shard processes and free the shared memory"""
+        self._finalizer()
+
+
+def _share_matrices(engine):
+    """
+    Copy the engine's sparse matrices into shared memory, along with the
+    ad TF-IDF norms in hashing mode, or the projection and ad embeddings in
+    dense mode.
+
+    Returns:
+        tuple: The SharedMemory segments, and the layout the shards attach
+            with: matrix name -> (shape, {array: (segment name, dtype, shape)}),
+            plus "dense" -> {engine attribute: ((segment name, dtype, shape),
+            whether the array has one row per ad)}
+    """
+    segments = []
+
+    def share(array):
+        # Zero-size segments aren't allowed
+        segment = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[:] = array
+        segments.append(segment)
+        return segment.name, array.dtype.str, array.shape
+
+    layout = {}
+    for name in _MATRICES:
+        matrix = getattr(engine, name).tocsr()
+        layout[name] = (
+            matrix.shape,
+            {part: share(getattr(matrix, part)) for part in ("data", "indices", "indptr")},
+        )
+
+    layout["dense"] = {}
+    if engine.hashing is not None:
+        # Computed once here rather than by every shard, which has no
+        # document frequencies
+        layout["dense"]["_row_norms"] = (share(engine._ad_norms()), True)
+    if engine.ad_embeddings is not None:
+        layout["dense"]["projection"] = (share(engine.projection), False)
+        layout["dense"]["ad_embeddings"] = (share(engine.ad_embeddings), True)
+    return segments, layout
+
+
+def _attach_rows(layout, segments, start, stop):
+    """CSR matrix of rows start:stop, viewing the shared data and indices in place"""
+    shape, arrays = layout
+    views = {part: _attach(array, segments) for part, array in arrays.items()}
+
+    indptr = views["indptr"][start:stop + 1]
+    first, last = indptr[0], indptr[-1]
+    return sp.csr_matrix(
+        (views["data"][first:last], views["indices"][first:last], indptr - first),
+        shape=(stop - start, shape[1]),
+        copy=False,
+    )
+
+
+def _attach(array, segments):
+    """Read-only view of an array shared by _share_matrices"""
+    name, dtype, shape = array
+    segment = shared_memory.SharedMemory(name=name)
+    segments.append(segment)
+    view = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+    view.flags.writeable = False
+    return view
+
+
+def _shard_worker(connection, layout, start, stop, dead_rows, engine_options):
+    """
+    Score queries against ads start:stop, skipping the deleted ones (dead_rows,
+    relative to start), until the coordinator closes the pipe.
+
+    Each request is (queries, top_k) and gets, per query, the shard's top_k
+    columns of MatchingEngine._score_query, with ad indices made global, and
+    the number of ads scored.
+    """
+    segments = []
+    shard = MatchingEngine(**engine_options)
+    for name in _MATRICES:
+        setattr(shard, name, _attach_rows(layout[name], segments, start, stop))
+    for name, (array, per_row) in layout["dense"].items():
+        view = _attach(array, segments)
+        setattr(shard, name, view[start:stop] if per_row else view)
+    shard._deleted = set(dead_rows)
+    n_features = shard.ad_vectors.shape[1]
+    n_keywords = shard.keyword_matrix.shape[1]
+    connection.send(True)
+
+    try:
+        while True:
+            try:
+                queries, top_k = connection.recv()
+            except EOFError:
+                break
+
+            results = []
+            for term_ids, weights, keyword_ids, topic_hits, n_content_keywords in queries:
+                content_vector = sp.csr_matrix(
+                    (weights, term_ids, [0, len(term_ids)]), shape=(1, n_features)
+                )
+                keyword_query = np.zeros(n_keywords)
+                keyword_query[keyword_ids] = 1
+
+                ranked = shard._score_query(
+                    content_vector, keyword_query, topic_hits, n_content_keywords, top_k
+                )
+                results.append(
+                    ((ranked[0] + start,) + ranked[1:], shard.last_candidate_counts[0])
+                )
+            connection.send(results)
+    finally:
+        connection.close()
+        # The matrices view the segments; drop them before closing
+        del shard
+        for segment in segments:
+            segment.close()
+
+
+def _shutdown(connections, processes, segments):
+    for connection in connections:
+        connection.close()
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    for segment in segments:
+        segment.close()
+        segment.unlink()
@@ -0,0 +1,67 @@
+# tests/test_ad_classifier.py
+# Keyword weighting of AdClassifier across batches
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from benchmarks.synthetic import generate_ads
+from src.ad_classifier import TOP_KEYWORDS, AdClassifier, _top_keywords
+from src.index_snapshot import load_index, save_index
+from src.matching_engine import MatchingEngine
+
+
+def _keywords(classifications):
+    return [classification["keywords"] for classification in classifications]
+
+
+def test_bulk_keywords_match_a_tfidf_fit():
+    ads = generate_ads(500)
+    vectorizer = TfidfVectorizer()
+    tfidf = vectorizer.fit_transform([ad["content"] for ad in ads])
+    expected = _top_keywords(tfidf, vectorizer.get_feature_names_out(), TOP_KEYWORDS)
+
+    assert _keywords(AdClassifier().classify_ads(ads)) == expected
+
+
+def test_incremental_batches_are_weighted_against_the_inventory():
+    ads = generate_ads(600)
+    bulk = AdClassifier().classify_ads(ads)
+
+    classifier = AdClassifier()
+    classifier.classify_ads(ads[:599])
+    assert classifier.classify_ad(ads[599]["content"])["keywords"] == bulk[599]["keywords"]
+
+    classifier = AdClassifier()
+    incremental = []
+    for start in range(0, len(ads), 100):
+        incremental += classifier.classify_ads(ads[start:start + 100])
+    assert _keywords(incremental[-100:]) == _keywords(bulk[-100:])
+
+
+def test_removed_ads_leave_the_document_frequencies():
+    ads = generate_ads(200)
+    classifier = AdClassifier()
+    classifier.classify_ads(ads)
+    classifier.remove_documents([ad["content"] for ad in ads[100:]])
+
+    fresh = AdClassifier()
+    fresh.classify_ads(ads[:100])
+    assert classifier.n_documents == 100
+    assert (classifier.document_frequencies[:len(fresh.document_frequencies)]
+            == fresh.document_frequencies).all()
+    assert not classifier.document_frequencies[len(fresh.document_frequencies):].any()
+
+
+def test_loaded_engine_weights_new_ads_against_its_inventory(tmp_path):
+    ads = generate_ads(300)
+    new_ads = generate_ads(5, seed=1)
+    engine = MatchingEngine()
+    engine.add_ads(ads)
+    save_index(engine, tmp_path)
+    loaded = load_index(tmp_path)
+
+    engine.add_ads(new_ads)
+    loaded.add_ads(new_ads)
+
+    assert [ad["classification"] for ad in loaded.ad_inventory[-5:]] == [
+        ad["classification"] for ad in engine.ad_inventory[-5:]
+    ]
@@ -0,0 +1,63 @@
+# tests/test_analysis_cache.py
+# Frozen values and bounds of the content analysis cache
+
+import pytest
+
+from src.analysis_cache import AnalysisCache
+
+
+def _streamed_features():
+    """Features shaped like ContentAnalyzer.analyze_stream() output"""
+    return {
+        "keywords": ["privacy", "data"],
+        "entities": [("Acme", "ORG")],
+        "topic_candidates": ["privacy"],
+        "word_count": 12000,
+        "streaming": {"chunks": 3, "stopped_early": True},
+    }
+
+
+def test_cached_features_are_read_only():
+    cache = AnalysisCache()
+    key = cache.key("Some page")
+    cache.put(key, _streamed_features())
+    cached = cache.get(key)
+
+    with pytest.raises(TypeError):
+        cached["word_count"] = 0
+    with pytest.raises(TypeError):
+        cached["streaming"]["chunks"] = 0
+    with pytest.raises(AttributeError):
+        cached["keywords"].append("leak")
+    assert cached["entities"] == (("Acme", "ORG"),)
+
+
+def test_cached_features_are_a_copy():
+    cache = AnalysisCache()
+    key = cache.key("Some page")
+    features = _streamed_features()
+    cache.put(key, features)
+
+    features["streaming"]["chunks"] = 99
+    features["keywords"].append("leak")
+
+    cached = cache.get(key)
+    assert cached["streaming"]["chunks"] == 3
+    assert cached["keywords"] == ("privacy", "data")
+
+
+def test_key_normalizes_case_and_whitespace():
+    assert AnalysisCache.key("Some  Page\n") == AnalysisCache.key("some page")
+    assert AnalysisCache.key("some page") != AnalysisCache.key("other page")
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnalysisCache(max_entries=2)
+    for content in ("a", "b"):
+        cache.put(cache.key(content), {"keywords": [content]})
+    cache.get(cache.key("a"))
+    cache.put(cache.key("c"), {"keywords": ["c"]})
+
+    assert cache.get(cache.key("b")) is None
+    assert cache.get(cache.key("a"))["keywords"] == ("a",)
+    assert cache.stats()["evictions"] == 1
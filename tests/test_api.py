@@ -0,0 +1,160 @@
+# tests/test_api.py
+# Request validation of the recommendation endpoints
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.app as app_module
+from api.micro_batcher import MicroBatcher
+from src.differential_privacy import PrivacyBudget
+
+# Without a context manager the lifespan doesn't run, so no engine worker
+# is started; the pool is replaced wherever a request gets that far
+client = TestClient(app_module.app)
+
+
+def _empty_result():
+    return {
+        "recommended_ads": [],
+        "index_version": 1,
+        "privacy_metrics": {
+            "anonymization_applied": True,
+            "differential_privacy_applied": True,
+            "local_processing_simulated": True,
+        },
+    }
+
+
+@pytest.fixture
+def pool_calls(monkeypatch):
+    """The (contents, top_k, batch_size) of every engine pool batch call"""
+    calls = []
+
+    async def process_batch(contents, top_k=10, batch_size=None):
+        calls.append((contents, top_k, batch_size))
+        return [_empty_result() for _ in contents]
+
+    monkeypatch.setattr(app_module.engine_pool, "process_batch", process_batch)
+    return calls
+
+
+@pytest.mark.parametrize("top_k", ["ten", 0, -3, 2.5, True, [5]])
+def test_recommend_rejects_invalid_top_k(top_k, pool_calls):
+    response = client.post("/recommend", json={"data": {"content": "Page", "top_k": top_k}})
+
+    assert response.status_code == 422
+    assert "top_k" in response.json()["error"]
+    assert pool_calls == []
+
+
+@pytest.mark.parametrize("data", [{"top_k": "x"}, {"top_k": -1}, {"batch_size": 0}])
+def test_batch_rejects_invalid_parameters(data, pool_calls):
+    response = client.post(
+        "/recommend/batch", json={"data": {"contents": ["Page"], **data}}
+    )
+
+    assert response.status_code == 422
+    assert pool_calls == []
+
+
+@pytest.mark.parametrize("contents", ["hello", {"a": 1}, [], ["Page", 3], None])
+def test_batch_rejects_invalid_contents(contents, budget, pool_calls):
+    response = client.post(
+        "/recommend/batch", json={"data": {"contents": contents, "session_id": "s1"}}
+    )
+
+    assert response.status_code == 422
+    assert "contents" in response.json()["error"]
+    assert budget.spent("s1") == 0.0
+    assert pool_calls == []
+
+
+def test_batch_rejects_too_many_documents(monkeypatch, pool_calls):
+    monkeypatch.setattr(app_module, "max_batch_docs", 3)
+
+    response = client.post(
+        "/recommend/batch", json={"data": {"contents": ["Page"] * 4}}
+    )
+    assert response.status_code == 422
+    assert pool_calls == []
+
+    response = client.post(
+        "/recommend/batch", json={"data": {"contents": ["Page"] * 3}}
+    )
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 3
+
+
+def test_top_k_is_clamped(pool_calls):
+    response = client.post(
+        "/recommend", json={"data": {"content": "Page", "top_k": 10 ** 9}}
+    )
+    assert response.status_code == 200
+
+    response = client.post(
+        "/recommend/batch", json={"data": {"contents": ["Page"], "top_k": "500"}}
+    )
+    assert response.status_code == 200
+
+    assert [top_k for _, top_k, _ in pool_calls] == [app_module.max_top_k] * 2
+
+
+def test_top_k_defaults_to_10(pool_calls):
+    response = client.post("/recommend", json={"data": {"content": "Page"}})
+
+    assert response.status_code == 200
+    assert pool_calls[0][1] == 10
+
+
+def test_micro_batcher_rejects_non_positive_top_k():
+    batcher = MicroBatcher(lambda contents, top_k: None)
+
+    with pytest.raises(ValueError):
+        asyncio.run(batcher.submit("Page", top_k=0))
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    """A one-document session budget in place of the server's ledger"""
+    budget = PrivacyBudget(app_module.release_epsilon)
+    monkeypatch.setattr(app_module, "privacy_budget", budget)
+    return budget
+
+
+def test_session_budget_is_enforced_across_routes(budget, pool_calls):
+    response = client.post(
+        "/recommend", json={"data": {"content": "Page", "session_id": "s1"}}
+    )
+    assert response.status_code == 200
+
+    response = client.post(
+        "/recommend/batch", json={"data": {"contents": ["Page"], "session_id": "s1"}}
+    )
+    assert response.status_code == 429
+    assert "s1" in response.json()["error"]
+    assert len(pool_calls) == 1
+
+    response = client.post("/recommend", json={"data": {"content": "Page"}})
+    assert response.status_code == 200
+
+
+def test_batch_charges_the_session_per_document(budget, pool_calls):
+    response = client.post(
+        "/recommend/batch", json={"data": {"contents": ["A", "B"], "session_id": 7}}
+    )
+
+    assert response.status_code == 429
+    assert budget.spent(7) == 0.0
+    assert pool_calls == []
+
+
+@pytest.mark.parametrize("session_id", [True, 1.5, ["s"], {"id": 1}])
+def test_recommend_rejects_invalid_session_id(session_id, budget, pool_calls):
+    response = client.post(
+        "/recommend", json={"data": {"content": "Page", "session_id": session_id}}
+    )
+
+    assert response.status_code == 422
+    assert pool_calls == []
@@ -0,0 +1,23 @@
+# tests/test_category_matcher.py
+# Category detection of CategoryMatcher on both sides of the size threshold
+
+from benchmarks.bench_categories import taxonomy
+from benchmarks.synthetic import generate_ads
+from src import category_matcher
+from src.category_matcher import CategoryMatcher
+
+
+def _expected(categories, text):
+    return [i for i, category in enumerate(categories) if category in text]
+
+
+def test_find_matches_substring_tests_for_small_and_large_taxonomies():
+    texts = [ad["content"].lower() for ad in generate_ads(200)]
+    texts += ["", "technology", "sports and fitness news", "travelling"]
+
+    for size in (15, category_matcher.SUBSTRING_SCAN_MAX + 1, 1000):
+        categories = taxonomy(size)
+        matcher = CategoryMatcher(categories)
+        for text in texts:
+            assert matcher.find(text) == _expected(categories, text)
+            assert matcher._find_automaton(text) == _expected(categories, text)
@@ -0,0 +1,56 @@
+# tests/test_differential_privacy.py
+# Session budgets and Laplace noise
+
+import numpy as np
+import pytest
+
+from src import differential_privacy
+from src.differential_privacy import LaplaceMechanism, PrivacyBudget, PrivacyBudgetExceeded
+
+
+def test_budget_refuses_the_whole_charge_past_the_limit():
+    budget = PrivacyBudget(1.0)
+    budget.charge(["a", "a"], 0.5)
+
+    with pytest.raises(PrivacyBudgetExceeded):
+        budget.charge(["b", "a"], 0.5)
+    assert budget.spent("a") == 1.0
+    assert budget.spent("b") == 0.0
+    assert budget.remaining("a") == 0.0
+
+
+def test_least_recently_charged_session_is_evicted():
+    budget = PrivacyBudget(1.0, max_sessions=2)
+    budget.charge(["a"], 0.5)
+    budget.charge(["b"], 0.5)
+    budget.charge(["a"], 0.5)
+    budget.charge(["c"], 0.5)
+
+    assert len(budget) == 2
+    assert budget.evictions == 1
+    assert budget.spent("a") == 1.0
+    assert budget.spent("b") == 0.0
+
+
+def test_idle_sessions_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(differential_privacy.time, "monotonic", lambda: now[0])
+    budget = PrivacyBudget(1.0, ttl=60)
+    budget.charge(["a"], 1.0)
+    budget.charge(["b"], 1.0)
+
+    now[0] += 30
+    budget.charge(["b"], 0.0)
+    now[0] += 45
+    assert budget.spent("a") == 0.0
+    assert budget.spent("b") == 1.0
+    assert len(budget) == 1
+
+
+def test_noise_is_seeded_per_instance():
+    values = np.arange(5)
+    first = LaplaceMechanism(seed=7).noise(values, 0.5)
+
+    assert (LaplaceMechanism(seed=7).noise(values, 0.5) == first).all()
+    assert (LaplaceMechanism(seed=8).noise(values, 0.5) != first).any()
+    assert (LaplaceMechanism(seed=7).noise_counts(values, 0.5) >= 0).all()
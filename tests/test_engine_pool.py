@@ -0,0 +1,62 @@
+# tests/test_engine_pool.py
+# Startup and recovery of the engine worker pool
+
+import asyncio
+import os
+import signal
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from api.engine_pool import EnginePool
+
+
+@pytest.fixture(scope="module", autouse=True)
+def spacy_model():
+    # Every worker loads the spaCy model when it starts
+    spacy = pytest.importorskip("spacy")
+    try:
+        spacy.load("en_core_web_sm")
+    except OSError:
+        pytest.skip("en_core_web_sm is not installed")
+
+
+def _worker_pids(pool):
+    return [process.pid for process in pool._executor._processes.values()]
+
+
+def test_start_loads_every_worker():
+    pool = EnginePool(workers=2, timeout=60)
+
+    async def scenario():
+        await pool.start()
+        return _worker_pids(pool)
+
+    try:
+        assert len(set(asyncio.run(scenario()))) == 2
+    finally:
+        pool.shutdown()
+
+
+def test_pool_is_replaced_after_a_worker_dies():
+    pool = EnginePool(workers=2, timeout=60)
+
+    async def scenario():
+        await pool.start()
+        os.kill(_worker_pids(pool)[0], signal.SIGKILL)
+        with pytest.raises(BrokenProcessPool):
+            # The pool may only notice on the next submit
+            for _ in range(3):
+                await pool.process_content("A page about running shoes")
+                await asyncio.sleep(0.5)
+
+        await pool._warmup
+        return await pool.process_content("A page about running shoes", top_k=3)
+
+    try:
+        result = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert len(result["recommended_ads"]) == 3
+    assert pool.restarts.value == 1
+    assert pool.pending == 0
@@ -0,0 +1,88 @@
+# tests/test_hashed_tfidf.py
+# HashedTfidf against a TfidfVectorizer fitted on the same documents
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from benchmarks.synthetic import generate_ads, generate_pages
+from src.hashed_tfidf import HashedTfidf
+
+N_FEATURES = 2 ** 22
+
+
+@pytest.fixture(scope="module")
+def documents():
+    return [ad["content"] for ad in generate_ads(600)]
+
+
+@pytest.fixture(scope="module")
+def fitted(documents):
+    vectorizer = TfidfVectorizer()
+    tfidf = vectorizer.fit_transform(documents)
+    columns = [HashedTfidf(N_FEATURES)._column(term) for term in vectorizer.get_feature_names_out()]
+    # The comparison is exact only without hash collisions
+    assert len(set(columns)) == len(columns)
+    return vectorizer, tfidf, np.array(columns)
+
+
+def _hashed(documents, batch_size=None):
+    hashed = HashedTfidf(N_FEATURES)
+    batches = [documents] if batch_size is None else [
+        documents[start:start + batch_size] for start in range(0, len(documents), batch_size)
+    ]
+    counts = []
+    for batch in batches:
+        batch_counts = hashed.transform(batch)
+        hashed.add_documents(batch_counts)
+        counts.append(batch_counts)
+    return hashed, sp.vstack(counts).tocsr()
+
+
+def test_idf_matches_a_tfidf_fit(documents, fitted):
+    vectorizer, _, columns = fitted
+    hashed, _ = _hashed(documents, batch_size=64)
+
+    assert hashed.n_documents == len(documents)
+    np.testing.assert_allclose(hashed.idf[columns], vectorizer.idf_, rtol=1e-12)
+
+
+def test_similarities_match_a_tfidf_fit(documents, fitted):
+    vectorizer, tfidf, _ = fitted
+    hashed, counts = _hashed(documents, batch_size=100)
+    queries = generate_pages(20, seed=2) + ["", "words in no document at all"]
+
+    expected = cosine_similarity(vectorizer.transform(queries), tfidf)
+    got = hashed.similarity(hashed.query_vectors(queries), counts, hashed.norms(counts))
+
+    np.testing.assert_allclose(got.toarray(), expected, atol=1e-12)
+
+
+def test_top_terms_carry_the_top_tfidf_weights(documents, fitted):
+    vectorizer, tfidf, _ = fitted
+    hashed, _ = _hashed(documents)
+    vocabulary = vectorizer.vocabulary_
+
+    for row, terms in enumerate(hashed.top_terms(documents[:100], 5)):
+        weights = tfidf[row].toarray().ravel()
+        got = [weights[vocabulary[term]] for term in terms]
+        np.testing.assert_allclose(got, np.sort(weights)[::-1][:len(terms)], rtol=1e-12)
+
+
+def test_removing_documents_undoes_adding_them(documents):
+    hashed, _ = _hashed(documents[:400])
+    frequencies = hashed.document_frequencies.copy()
+
+    extra = hashed.transform(documents[400:])
+    hashed.add_documents(extra)
+    hashed.remove_documents(extra)
+
+    assert hashed.n_documents == 400
+    assert (hashed.document_frequencies == frequencies).all()
+
+
+def test_n_features_must_be_positive():
+    with pytest.raises(ValueError):
+        HashedTfidf(0)
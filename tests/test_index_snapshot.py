@@ -0,0 +1,121 @@
+# tests/test_index_snapshot.py
+# Snapshot round trips of MatchingEngine indexes, current and older formats
+
+import json
+import os
+
+import pytest
+
+from benchmarks.synthetic import generate_ads, generate_content_features
+from src.index_snapshot import FORMAT_VERSION, load_index, save_index
+from src.matching_engine import MatchingEngine
+
+ENGINE_MODES = {
+    "vocabulary": {},
+    "hashed": {"hash_features": 2 ** 16},
+    "dense": {"embedding_dim": 32},
+}
+
+
+def _ranking(matches):
+    return [(m["ad"]["classification"]["ad_id"], m["relevance_score"], m["match_reason"])
+            for m in matches]
+
+
+@pytest.fixture(scope="module")
+def pages():
+    return [generate_content_features(seed=seed) for seed in range(15)]
+
+
+def _engine(mode, n_ads=800):
+    engine = MatchingEngine(**ENGINE_MODES[mode])
+    engine.add_ads(generate_ads(n_ads))
+    return engine
+
+
+def _rewrite_index(path, drop=(), **changes):
+    """Edit index.json in place, as an older save_index would have written it"""
+    with open(os.path.join(path, "index.json")) as f:
+        index = json.load(f)
+    for key in drop:
+        index.pop(key, None)
+    index.update(changes)
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump(index, f)
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+@pytest.mark.parametrize("mode", ENGINE_MODES)
+def test_round_trip_keeps_rankings(tmp_path, pages, mode, mmap):
+    engine = _engine(mode)
+    engine.remove_ad(engine.ad_inventory[3]["classification"]["ad_id"])
+    save_index(engine, tmp_path)
+    loaded = load_index(tmp_path, mmap=mmap)
+
+    assert loaded.inventory_size == engine.inventory_size
+    assert [_ranking(loaded.match_content(page)) for page in pages] == [
+        _ranking(engine.match_content(page)) for page in pages
+    ]
+    assert [_ranking(m) for m in loaded.match_batch(pages)] == [
+        _ranking(m) for m in engine.match_batch(pages)
+    ]
+
+
+@pytest.mark.parametrize("mode", ["vocabulary", "hashed"])
+def test_loaded_index_takes_updates(tmp_path, pages, mode):
+    engine = _engine(mode)
+    save_index(engine, tmp_path)
+    loaded = load_index(tmp_path)
+
+    new_ads = generate_ads(20, seed=1)
+    removed = engine.ad_inventory[0]["classification"]["ad_id"]
+    for index in (engine, loaded):
+        index.add_ads(new_ads)
+        index.remove_ad(removed)
+
+    assert loaded.get_ad(removed) is None
+    assert [_ranking(loaded.match_content(page)) for page in pages] == [
+        _ranking(engine.match_content(page)) for page in pages
+    ]
+
+
+def test_format_1_snapshot_loads(tmp_path, pages):
+    # Version 1 had no index_version and only vocabulary indexes
+    engine = _engine("vocabulary")
+    save_index(engine, tmp_path)
+    _rewrite_index(tmp_path, drop=("index_version",), format_version=1)
+    loaded = load_index(tmp_path)
+
+    assert loaded.index_version is None
+    assert [_ranking(loaded.match_content(page)) for page in pages] == [
+        _ranking(engine.match_content(page)) for page in pages
+    ]
+
+
+@pytest.mark.parametrize("mode", ["vocabulary", "hashed"])
+def test_format_2_snapshot_loads(tmp_path, pages, mode):
+    # Version 2 added hashed indexes and index_version, but no embeddings
+    engine = _engine(mode)
+    engine.index_version = 4
+    save_index(engine, tmp_path)
+    _rewrite_index(tmp_path, drop=("embedding_dim",), format_version=2)
+    loaded = load_index(tmp_path)
+
+    assert loaded.index_version == 4
+    assert loaded.ad_embeddings is None
+    assert [_ranking(loaded.match_content(page)) for page in pages] == [
+        _ranking(engine.match_content(page)) for page in pages
+    ]
+
+
+def test_unknown_format_is_refused(tmp_path):
+    save_index(_engine("vocabulary", n_ads=50), tmp_path)
+    _rewrite_index(tmp_path, format_version=FORMAT_VERSION + 1)
+
+    with pytest.raises(ValueError, match="Unsupported index format"):
+        load_index(tmp_path)
+
+
+def test_empty_inventory_is_refused(tmp_path):
+    with pytest.raises(ValueError):
+        save_index(MatchingEngine(), tmp_path)
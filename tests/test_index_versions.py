@@ -0,0 +1,88 @@
+# tests/test_index_versions.py
+# Publishing index versions and swapping them into a running engine
+
+import os
+import threading
+
+from benchmarks.synthetic import generate_ads, generate_content_features
+from data.sample_ads import get_sample_ads
+from src.index_snapshot import CURRENT, current_version, is_versioned, load_index, publish_index
+from src.main import PrivacyAdEngine
+from src.matching_engine import MatchingEngine
+
+
+def _engine(ads):
+    engine = MatchingEngine()
+    engine.add_ads(ads)
+    return engine
+
+
+def test_publish_numbers_versions_and_prunes_old_ones(tmp_path):
+    root = str(tmp_path / "indexes")
+    versions = [publish_index(_engine(generate_ads(50, seed=seed)), root, keep=2)
+                for seed in range(4)]
+
+    assert versions == [1, 2, 3, 4]
+    assert is_versioned(root)
+    assert current_version(root) == (4, os.path.join(root, "v000004"))
+    assert sorted(os.listdir(root)) == [CURRENT, "v000003", "v000004"]
+    assert load_index(root).index_version == 4
+
+
+def test_published_version_is_swapped_in(tmp_path):
+    root = str(tmp_path / "indexes")
+    publish_index(_engine(get_sample_ads()), root)
+    engine = PrivacyAdEngine(index_path=root, index_poll_interval=0.0)
+    assert engine.index_version == 1
+
+    publish_index(_engine(generate_ads(300)), root)
+    # The first request after publishing starts the load and keeps the old version
+    assert engine.matching_engine.index_version == 1
+    engine._index_update.result()
+
+    assert engine.matching_engine.index_version == 2
+    assert engine.matching_engine.inventory_size == 300
+
+
+def test_rebuild_swaps_without_disturbing_requests(tmp_path):
+    root = str(tmp_path / "indexes")
+    publish_index(_engine(get_sample_ads()), root)
+    engine = PrivacyAdEngine(index_path=root, index_poll_interval=3600)
+    features = generate_content_features(seed=0)
+    engine.matching_engine  # Loaded before the rebuild starts
+
+    seen = []
+    stop = threading.Event()
+
+    def serve():
+        while not stop.is_set():
+            current = engine.matching_engine
+            matches = current.match_content(features)
+            seen.append((current.index_version, len(matches)))
+
+    server = threading.Thread(target=serve)
+    server.start()
+    try:
+        version = engine.rebuild_index(generate_ads(2000, seed=3)).result()
+    finally:
+        stop.set()
+        server.join()
+
+    assert version == 2 == current_version(root)[0]
+    assert engine.matching_engine.inventory_size == 2000
+    assert {version for version, _ in seen} <= {1, 2}
+    assert all(count == 10 for _, count in seen)
+
+
+def test_older_version_is_never_swapped_in():
+    engine = PrivacyAdEngine()
+    engine.matching_engine
+    newer = _engine(generate_ads(20))
+    newer.index_version = 5
+    older = _engine(generate_ads(20, seed=1))
+    older.index_version = 3
+
+    engine._swap_index(newer)
+    engine._swap_index(older)
+    assert engine.index_version == 5
+    assert engine.rebuild_index(generate_ads(30)).result() == 6
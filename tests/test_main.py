@@ -0,0 +1,20 @@
+# tests/test_main.py
+# PrivacyAdEngine configuration
+
+from src.analysis_cache import AnalysisCache
+from src.main import PrivacyAdEngine
+
+
+def test_analysis_cache_can_be_disabled():
+    engine = PrivacyAdEngine(analysis_cache=False)
+
+    assert engine.analysis_cache is None
+    assert engine.content_analyzer.cache is None
+    assert engine._cache_lookups() == (0, 0)
+
+
+def test_analysis_cache_defaults_or_is_shared():
+    cache = AnalysisCache(max_entries=5)
+
+    assert isinstance(PrivacyAdEngine().analysis_cache, AnalysisCache)
+    assert PrivacyAdEngine(analysis_cache=cache).content_analyzer.cache is cache
@@ -0,0 +1,190 @@
+# tests/test_matching_engine.py
+# Ad IDs, deletes, updates and compaction of MatchingEngine
+
+import numpy as np
+import pytest
+
+from api.schemas import recommend_response
+from benchmarks.synthetic import generate_ads, generate_content_features
+from src.ann_index import ClusteredIndex
+from src.matching_engine import MatchingEngine
+
+
+def _ranking(matches):
+    return [(m["ad"]["classification"]["ad_id"], m["relevance_score"]) for m in matches]
+
+
+def _ids(engine):
+    return [ad["classification"]["ad_id"] for ad in engine.ad_inventory if ad is not None]
+
+
+@pytest.fixture(scope="module")
+def ads():
+    return generate_ads(1500)
+
+
+@pytest.fixture(scope="module")
+def pages():
+    return [generate_content_features(seed=seed) for seed in range(20)]
+
+
+@pytest.mark.parametrize("hash_features", [None, 2 ** 16])
+def test_deleted_ads_are_never_matched(ads, pages, hash_features):
+    engine = MatchingEngine(hash_features=hash_features, compact_ratio=0.9)
+    engine.add_ads(ads)
+    full = [engine.match_content(page, top_k=80) for page in pages]
+
+    ids = _ids(engine)
+    gone = set(np.random.default_rng(0).choice(ids, 300, replace=False).tolist())
+    for ad_id in gone:
+        engine.remove_ad(ad_id)
+
+    assert engine.inventory_size == len(ids) - 300
+    assert all(engine.get_ad(ad_id) is None for ad_id in gone)
+    for page, matches in zip(pages, full):
+        got = _ranking(engine.match_content(page, top_k=10))
+        assert not {ad_id for ad_id, _ in got} & gone
+        if hash_features is None:
+            # Vocabulary vectors keep their weights, so the survivors keep
+            # their order
+            expected = [m for m in _ranking(matches) if m[0] not in gone][:10]
+            assert got == expected
+    assert [_ranking(m) for m in engine.match_batch(pages)] == [
+        _ranking(engine.match_content(page)) for page in pages
+    ]
+
+    with pytest.raises(KeyError):
+        engine.remove_ad(next(iter(gone)))
+
+
+@pytest.mark.parametrize("hash_features", [None, 2 ** 16])
+def test_compaction_keeps_rankings(ads, pages, hash_features):
+    engine = MatchingEngine(hash_features=hash_features, compact_ratio=0.9)
+    engine.add_ads(ads)
+    for ad_id in _ids(engine)[::3]:
+        engine.remove_ad(ad_id)
+    before = [_ranking(engine.match_content(page)) for page in pages]
+
+    engine.compact()
+
+    assert len(engine.ad_inventory) == engine.inventory_size
+    assert engine.ad_vectors.shape[0] == engine.inventory_size
+    assert [_ranking(engine.match_content(page)) for page in pages] == before
+    assert all(engine.get_ad(ad_id)["classification"]["ad_id"] == ad_id for ad_id in _ids(engine))
+
+
+@pytest.mark.parametrize("hash_features", [None, 2 ** 16])
+def test_ads_appended_between_matches_rank_like_full_scoring(ads, pages, hash_features):
+    # Appended ads reach the postings through the tail, merged now and then
+    engine = MatchingEngine(
+        hash_features=hash_features, refit_ratio=10, max_candidate_share=float("inf")
+    )
+    exhaustive = MatchingEngine(
+        hash_features=hash_features, refit_ratio=10, candidate_retrieval=False
+    )
+    for e in (engine, exhaustive):
+        e.add_ads(ads[:1000])
+    engine.match_content(pages[0])
+
+    for i, ad in enumerate(ads[1000:1200]):
+        for e in (engine, exhaustive):
+            e.add_ad(f"{ad['content']} novelty{i}", ad["metadata"])
+        # A broad page, and one only the newest ads share words with
+        narrow = {"keywords": [f"novelty{i}", f"novelty{i // 2}"], "topic_candidates": []}
+        for page in (pages[i % len(pages)], narrow):
+            assert _ranking(engine.match_content(page, top_k=3)) == _ranking(
+                exhaustive.match_content(page, top_k=3)
+            )
+        assert engine.last_candidate_counts[0] < 100
+
+    assert engine.ad_vectors.shape[0] == 1200
+    assert 1000 < engine._postings[0].shape[0] < 1200
+
+
+def test_batches_use_the_approximate_index(ads, pages):
+    engine = MatchingEngine(
+        approximate_index=ClusteredIndex(n_probe=2), approximate_min_inventory=1000
+    )
+    engine.add_ads(ads)
+    single, single_counts = [], []
+    for page in pages:
+        single.append(_ranking(engine.match_content(page)))
+        single_counts.extend(engine.last_candidate_counts)
+
+    assert [_ranking(matches) for matches in engine.match_batch(pages)] == single
+    assert engine.last_candidate_counts == single_counts
+    assert max(single_counts) < len(ads)
+
+
+def test_tombstones_are_compacted_past_the_ratio(ads):
+    engine = MatchingEngine(compact_ratio=0.25)
+    engine.add_ads(ads[:100])
+    for ad_id in _ids(engine)[:30]:
+        engine.remove_ad(ad_id)
+    engine.add_ads(ads[100:101])
+    engine.match_content(generate_content_features(seed=0))
+
+    assert len(engine.ad_inventory) == engine.inventory_size == 71
+
+
+def test_update_replaces_the_ad_under_its_id(ads):
+    engine = MatchingEngine()
+    engine.add_ads(ads[:200])
+    ad_id = _ids(engine)[5]
+
+    engine.update_ad(ad_id, "Trail running shoes for marathon training", {"brand": "x"})
+
+    assert engine.inventory_size == 200
+    assert engine.get_ad(ad_id)["content"] == "Trail running shoes for marathon training"
+    matches = engine.match_content(
+        {"keywords": ["marathon", "running"], "topic_candidates": ["running"]}, top_k=1
+    )
+    assert _ranking(matches)[0][0] == ad_id
+    with pytest.raises(KeyError):
+        engine.update_ad(12345, "No such ad")
+
+
+def test_duplicate_ads_are_indexed_once(ads):
+    engine = MatchingEngine()
+
+    assert engine.add_ads(ads[:50] + ads[:10]) == 50
+    assert engine.add_ads(ads[:50]) == 0
+    assert engine.add_ad(ads[0]["content"]) == _ids(engine)[0]
+    assert engine.add_ad("Custom creative", ad_id=np.int64(42)) == 42
+    assert engine.get_ad(42)["classification"]["ad_id"] == 42
+
+    # Caller-assigned IDs turn off content deduplication
+    assert engine.add_ad(ads[0]["content"], ad_id=7) == 7
+    assert engine.get_ad(7)["content"] == engine.get_ad(_ids(engine)[0])["content"]
+    assert engine.inventory_size == 52
+
+
+@pytest.mark.parametrize("ad_id", ["sku-1", "42", 4.0, True, (1,)])
+def test_non_integer_ids_are_rejected(ads, ad_id):
+    engine = MatchingEngine()
+    engine.add_ads(ads[:10])
+
+    with pytest.raises(ValueError, match="ad_id"):
+        engine.add_ads([{"content": "Custom creative", "ad_id": ad_id}, ads[20]])
+    with pytest.raises(ValueError, match="ad_id"):
+        engine.add_ad("Custom creative", ad_id=ad_id)
+    with pytest.raises(ValueError, match="ad_id"):
+        engine.update_ad(ad_id, "Custom creative")
+    assert engine.inventory_size == 10
+
+
+def test_caller_ids_fit_compact_responses(ads):
+    engine = MatchingEngine()
+    engine.add_ads([{**ad, "ad_id": 1000 + i} for i, ad in enumerate(ads[:50])])
+    matches = engine.match_content(generate_content_features(seed=1), top_k=5)
+    result = {
+        "recommended_ads": matches,
+        "privacy_metrics": {
+            "anonymization_applied": True,
+            "differential_privacy_applied": True,
+            "local_processing_simulated": True,
+        },
+    }
+
+    compact = recommend_response(result, compact=True)
+    assert [ad.ad_id for ad in compact.recommended_ads] == [m[0] for m in _ranking(matches)]
@@ -0,0 +1,72 @@
+# tests/test_privacy_layer.py
+# PII redaction of PrivacyLayer against the per-type reference passes
+
+import random
+
+import pytest
+
+from benchmarks.bench_privacy import _PII_SAMPLES, page_with_pii, redact_per_pattern
+from src.analysis_cache import AnalysisCache
+from src.privacy_layer import PrivacyLayer
+
+privacy_layer = PrivacyLayer(seed=0)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("23.1.337.505-3686", "23.1.[REDACTED PHONE]"),
+    ("(7097531373@4.org", "([REDACTED EMAIL]"),
+    ("Call (555) 123-4567 today", "Call ([REDACTED PHONE] today"),
+    ("No personal data here.", "No personal data here."),
+])
+def test_overlapping_matches_are_settled_in_pattern_order(text, expected):
+    assert privacy_layer.redact_text(text) == expected
+
+
+def test_redaction_matches_per_type_passes_on_random_text():
+    rng = random.Random(0)
+    alphabet = "0123456789" * 3 + ".-- @()+abgorZ_%\n,\t "
+    pieces = _PII_SAMPLES + ["a@b.org", "1.2.3.4", "555 123 4567", " ", "-", ".", "(", "@", "word"]
+
+    for i in range(20000):
+        if i % 2:
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randrange(1, 40)))
+        else:
+            text = "".join(rng.choice(pieces + list(alphabet)) for _ in range(rng.randrange(1, 12)))
+        assert privacy_layer.redact_text(text) == redact_per_pattern(privacy_layer, text), text
+
+
+def test_redaction_matches_per_type_passes_on_pages():
+    for seed in range(5):
+        text = page_with_pii(5000, seed=seed)
+        assert privacy_layer.redact_text(text) == redact_per_pattern(privacy_layer, text)
+
+
+def _features():
+    return {
+        "keywords": ["privacy", "data"],
+        "topic_candidates": ["data privacy", "security"],
+        "entities": [("Acme", "ORG"), ("Jane Doe", "PERSON")],
+        "word_count": 120,
+        "text_summary": "Mail jane.doe@example.com for details",
+    }
+
+
+def test_input_features_are_left_alone():
+    features = _features()
+    private = privacy_layer.apply_privacy_measures(features)
+
+    assert features == _features()
+    assert private["keywords"] == ["privacy", "data"]
+    assert private["entities"] == [("Acme", "ORG")]
+    assert "word_count" not in private
+
+
+def test_cached_features_pass_through_read_only():
+    cache = AnalysisCache()
+    key = cache.key("Some page")
+    cached = cache.put(key, _features())
+
+    private = privacy_layer.apply_privacy_measures(cached)
+
+    assert private["keywords"] == ("privacy", "data")
+    assert cache.get(key)["word_count"] == 120
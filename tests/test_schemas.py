@@ -0,0 +1,63 @@
+# tests/test_schemas.py
+# Response models against the old json.dumps serialization
+
+import json
+
+import numpy as np
+
+from api.schemas import batch_response, recommend_response, to_json
+from benchmarks.bench_response import round_trip
+
+
+def _result(scores):
+    return {
+        "recommended_ads": [
+            {
+                "ad": {
+                    "content": "Privacy-first analytics",
+                    "classification": {"ad_id": 7 + i, "keywords": ["privacy"], "categories": []},
+                },
+                "relevance_score": score,
+                "match_factors": {
+                    "content_similarity": score,
+                    "keyword_overlap": np.int64(1),
+                    "category_relevance": 0,
+                },
+                "match_reason": "Matched keywords: privacy",
+            }
+            for i, score in enumerate(scores)
+        ],
+        "index_version": 3,
+        "privacy_metrics": {
+            "anonymization_applied": True,
+            "differential_privacy_applied": True,
+            "local_processing_simulated": True,
+        },
+        "content_topics": ["privacy"],
+    }
+
+
+def test_full_response_parses_to_the_old_values():
+    result = _result([np.float64(0.8125), 0.1, 1.5e-05, 1e-7, 0.0])
+
+    assert json.loads(to_json(recommend_response(result))) == json.loads(round_trip(result))
+
+
+def test_small_floats_are_written_differently():
+    body = to_json(recommend_response(_result([1.5e-05])))
+
+    assert "0.000015" in body
+    assert "1.5e-05" in round_trip(_result([1.5e-05])).decode()
+
+
+def test_compact_response_keeps_ids_and_scores():
+    result = _result([0.5, 0.25])
+    body = json.loads(to_json(batch_response([result], compact=True)))
+
+    assert body == {"results": [{
+        "recommended_ads": [
+            {"ad_id": 7, "relevance_score": 0.5},
+            {"ad_id": 8, "relevance_score": 0.25},
+        ],
+        "index_version": 3,
+    }]}
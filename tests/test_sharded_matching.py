@@ -0,0 +1,60 @@
+# tests/test_sharded_matching.py
+# Sharded rankings against the single-process engine
+
+import pytest
+
+from benchmarks.synthetic import generate_ads, generate_content_features
+from src.matching_engine import MatchingEngine
+from src.sharded_matching import ShardedMatchingEngine
+
+
+def _ranking(matches):
+    return [
+        (m["ad"]["classification"]["ad_id"], m["relevance_score"], m["match_factors"],
+         m["match_reason"])
+        for m in matches
+    ]
+
+
+@pytest.fixture(scope="module")
+def pages():
+    pages = [generate_content_features(seed=seed) for seed in range(25)]
+    pages.append({"keywords": [], "topic_candidates": []})
+    pages.append({"keywords": ["zzzz"], "topic_candidates": ["nothing"]})
+    return pages
+
+
+@pytest.mark.parametrize("hash_features, n_shards", [(None, 3), (2 ** 16, 2)])
+def test_shards_rank_like_one_process(pages, hash_features, n_shards):
+    engine = MatchingEngine(hash_features=hash_features, compact_ratio=0.9)
+    engine.add_ads(generate_ads(2000))
+    for ad in engine.ad_inventory[::7]:
+        engine.remove_ad(ad["classification"]["ad_id"])
+
+    sharded = ShardedMatchingEngine(engine, n_shards)
+    try:
+        for top_k in (1, 10, 50):
+            assert [_ranking(sharded.match_content(page, top_k=top_k)) for page in pages] == [
+                _ranking(engine.match_content(page, top_k=top_k)) for page in pages
+            ]
+        assert [_ranking(m) for m in sharded.match_batch(pages, top_k=10)] == [
+            _ranking(m) for m in engine.match_batch(pages, top_k=10)
+        ]
+    finally:
+        sharded.close()
+
+
+def test_more_shards_than_ads(pages):
+    engine = MatchingEngine()
+    engine.add_ads(generate_ads(2))
+    sharded = ShardedMatchingEngine(engine, 8)
+    try:
+        assert sharded.n_shards == 2
+        assert _ranking(sharded.match_content(pages[0])) == _ranking(engine.match_content(pages[0]))
+    finally:
+        sharded.close()
+
+
+def test_empty_inventory_is_refused():
+    with pytest.raises(ValueError):
+        ShardedMatchingEngine(MatchingEngine(), 2)